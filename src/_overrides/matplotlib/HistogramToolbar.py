@@ -8,6 +8,7 @@ from matplotlib.backends.backend_tkagg import NavigationToolbar2Tk
 from PIL import Image, ImageTk
 
 from src.constants import ASSETS_FOLDER
+from src.lib.blit_manager import unanimated
 
 # Note from us before you go into the depths below.
 #
@@ -15,6 +16,7 @@ from src.constants import ASSETS_FOLDER
 # - to lock the histogram to the x-axes
 # - to override the tooltip to only show the current x-value
 # - to remove some buttons (subplot settings)
+# - to include the (animated) vmin / vmax lines when saving
 # -----
 
 
@@ -49,6 +51,13 @@ class HistogramToolbar(NavigationToolbar2Tk):
 
         super().__init__(canvas, parent, pack_toolbar=pack)
 
+    def save_figure(self, *args):
+        # the vmin / vmax lines are animated, which savefig would otherwise leave out
+        with unanimated(self.canvas.figure):
+            super().save_figure(*args)
+
+        self.canvas.draw_idle()
+
     def drag_pan(self, event):
         """Callback for dragging in pan/zoom mode."""
         for ax in self._pan_info.axes:
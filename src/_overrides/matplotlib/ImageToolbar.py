@@ -3,6 +3,7 @@ import tkinter as tk
 import tkinter.font
 from collections import namedtuple
 from functools import partial
+from typing import Optional
 
 import numpy as np
 import ttkbootstrap as tb
@@ -14,6 +15,19 @@ from ttkbootstrap.dialogs.dialogs import Querybox
 
 from src.components.color_chooser import ColourChooserButton
 from src.constants import ASSETS_FOLDER
+from src.lib.blit_manager import BlitManager, unanimated
+from src.widgets.image.annotations import Annotations
+from src.widgets.image.regions import (
+    BoxRegion,
+    EllipseRegion,
+    PolygonRegion,
+    Region,
+)
+
+# The shapes the region tool can draw, the first is the default
+REGION_SHAPES = ["Box", "Ellipse", "Polygon"]
+# The least time (in ms) between updates of the co-ordinates under the mouse
+MOUSE_MOVE_INTERVAL = 30
 
 # Note from us before you go into the depths below.
 #
@@ -28,7 +42,7 @@ from src.constants import ASSETS_FOLDER
 
 
 class ImageToolbar(NavigationToolbar2Tk):
-    def __init__(self, canvas, parent, pack):
+    def __init__(self, canvas, parent, pack, blit_manager: BlitManager):
         # Edit toolitems to add new actions to toolbar
         # format of new tool is:
         # (
@@ -70,6 +84,13 @@ class ImageToolbar(NavigationToolbar2Tk):
                 "erase",
                 "lock_erase",
             ),
+            (
+                "Region",
+                "Draw a region to measure statistics over\n"
+                "Polygons: click each vertex, right click to finish",
+                "square",
+                "lock_region",
+            ),
             (None, None, None, None),
             (
                 "Settings",
@@ -81,20 +102,28 @@ class ImageToolbar(NavigationToolbar2Tk):
         )
 
         self.parent = parent
+        # annotations are drawn as overlays, so drawing them doesn't redraw the image
+        self.blit_manager = blit_manager
 
         self._line_info = None
         self._erase_info = None
+        self._region_info = None
+
+        # the latest mouse move whose message hasn't been shown yet
+        self._mouse_move_event = None
+        self._mouse_move_after = None
 
         self.check_vars = {}
 
         self.super_init(canvas, parent)
 
-        self.prev_x = None
-        self.prev_y = None
+        # the lines and text drawn on each axes, see get_annotations
+        self.annotations = {}
 
         self.line_size = 5
         self.text_size = 5
         self.erase_size = 5
+        self.region_shape = REGION_SHAPES[0]
 
     def super_init(self, canvas, window):
         if window is None:
@@ -122,7 +151,14 @@ class ImageToolbar(NavigationToolbar2Tk):
                     str(f"{image_file}.png"),
                     # Modified to allow for custom toggled buttons
                     toggle=callback
-                    in ["zoom", "pan", "lock_line", "lock_text", "lock_erase"],
+                    in [
+                        "zoom",
+                        "pan",
+                        "lock_line",
+                        "lock_text",
+                        "lock_erase",
+                        "lock_region",
+                    ],
                     command=getattr(self, callback),
                 )
                 if tooltip_text is not None:
@@ -161,6 +197,7 @@ class ImageToolbar(NavigationToolbar2Tk):
             ("Line", "line_tool"),
             ("Text", "text_tool"),
             ("Erase", "erase_tool"),
+            ("Region", "region_tool"),
         ]:
             if text in self._buttons:
                 if self.mode == mode:
@@ -174,11 +211,13 @@ class ImageToolbar(NavigationToolbar2Tk):
                 self.press_pan(event)
             elif event.name == "button_release_event":
                 self.release_pan(event)
+                self.parent.on_navigate()
         if self.mode == "zoom rect":
             if event.name == "button_press_event":
                 self.press_zoom(event)
             elif event.name == "button_release_event":
                 self.release_zoom(event)
+                self.parent.on_navigate()
         if self.mode == "line_tool":
             if event.name == "button_press_event":
                 self.press_line(event)
@@ -194,6 +233,11 @@ class ImageToolbar(NavigationToolbar2Tk):
                 self.press_erase(event)
             elif event.name == "button_release_event":
                 self.release_erase(event)
+        if self.mode == "region_tool":
+            if event.name == "button_press_event":
+                self.press_region(event)
+            elif event.name == "button_release_event":
+                self.release_region(event)
 
     def lock_line(self):
         if not self.canvas.widgetlock.available(self):
@@ -219,34 +263,41 @@ class ImageToolbar(NavigationToolbar2Tk):
         id_drag = self.canvas.mpl_connect("motion_notify_event", self.draw_line)
         self._line_info = self._LineInfo(button=event.button, axes=axes, cid=id_drag)
 
-    def draw_line(self, event):
-        for ax in self._line_info.axes:
-            if self.prev_x is None or self.prev_y is None:
-                self.prev_x = event.xdata
-                self.prev_y = event.ydata
-                return
-
-            ax.plot(
-                [self.prev_x, event.xdata],
-                [self.prev_y, event.ydata],
-                color=self.line_colour,
-                linewidth=self.line_size,
+        for ax in axes:
+            self.get_annotations(ax).start_stroke(
+                *self._event_data(ax, event), self.line_colour, self.line_size
             )
 
-            self.prev_x = event.xdata
-            self.prev_y = event.ydata
+    def draw_line(self, event):
+        for ax in self._line_info.axes:
+            self.get_annotations(ax).extend_stroke(*self._event_data(ax, event))
 
-        self.canvas.draw_idle()
+        self.blit_manager.update()
 
     def release_line(self, event):
         if self._line_info is None:
             return
         self.canvas.mpl_disconnect(self._line_info.cid)
         self._id_drag = self.canvas.mpl_connect("motion_notify_event", self.mouse_move)
-        self.canvas.draw_idle()
+
+        for ax in self._line_info.axes:
+            self.get_annotations(ax).finish_stroke()
+
+        self.blit_manager.update()
         self._line_info = None
-        self.prev_x = None
-        self.prev_y = None
+
+    def get_annotations(self, ax) -> Annotations:
+        """Get the annotations on the given axes, creating them if there's none yet."""
+        if ax not in self.annotations:
+            self.annotations[ax] = Annotations(ax, self.blit_manager)
+
+        return self.annotations[ax]
+
+    @staticmethod
+    def _event_data(ax, event):
+        # the position of the event in the data co-ordinates of ax, which still works
+        # once the mouse has left ax (unlike event.xdata / ydata)
+        return ax.transData.inverted().transform((event.x, event.y))
 
     def lock_text(self):
         if not self.canvas.widgetlock.available(self):
@@ -275,18 +326,14 @@ class ImageToolbar(NavigationToolbar2Tk):
             return
 
         for ax in axes:
-            ax.text(
-                event.xdata,
-                event.ydata,
-                text,
-                fontsize=self.text_size,
-                color=self.text_colour,
+            self.get_annotations(ax).add_text(
+                *self._event_data(ax, event), text, self.text_size, self.text_colour
             )
 
-        self.canvas.draw_idle()
+        self.blit_manager.update()
 
     def release_text(self, event):
-        self.canvas.draw_idle()
+        self.blit_manager.update()
 
     def lock_erase(self):
         if not self.canvas.widgetlock.available(self):
@@ -314,28 +361,127 @@ class ImageToolbar(NavigationToolbar2Tk):
 
     def draw_erase(self, event):
         for ax in self._erase_info.axes:
-            for line in ax.lines:
-                line.set_pickradius(self.erase_size)
-                contains, lines_data = line.contains(event)
-                if contains:
-                    line.remove()
+            if ax in self.annotations:
+                self.annotations[ax].erase(
+                    *self._event_data(ax, event), self.erase_size
+                )
 
-            for text in ax.texts:
-                contains, texts_data = text.contains(event)
-                if contains:
-                    text.remove()
-
-        self.canvas.draw_idle()
+        self.blit_manager.update()
 
     def release_erase(self, event):
         if self._erase_info is None:
             return
         self.canvas.mpl_disconnect(self._erase_info.cid)
         self._id_drag = self.canvas.mpl_connect("motion_notify_event", self.mouse_move)
-        self.canvas.draw_idle()
+        self.blit_manager.update()
         self._erase_info = None
-        self.prev_x = None
-        self.prev_y = None
+
+    def lock_region(self):
+        if not self.canvas.widgetlock.available(self):
+            self.set_message("region tool unavailable")
+            return
+        if self.mode == "region_tool":
+            self.mode = ""
+            self.canvas.widgetlock.release(self)
+            self._finish_region(None)
+        else:
+            self.mode = "region_tool"
+            self.canvas.widgetlock(self)
+        self._update_buttons_checked()
+
+    # points are the (x, y) the region is drawn through, in data co-ordinates. For
+    # boxes and ellipses the last point follows the mouse
+    _RegionInfo = namedtuple("_RegionInfo", "axes cid points preview")
+
+    def press_region(self, event):
+        if event.x is None or event.y is None:
+            return
+
+        if self._region_info is not None:
+            # adding to a polygon
+            if event.button == 3 or event.dblclick:
+                self._finish_region(self._make_region())
+            elif event.button == 1:
+                self._region_info.points.append(
+                    self._event_data(self._region_info.axes, event)
+                )
+            return
+
+        # only the image axes has regions
+        ax = self.canvas.figure.axes[0]
+        if event.button != 1 or not ax.in_axes(event):
+            return
+
+        self.canvas.mpl_disconnect(self._id_drag)
+        id_drag = self.canvas.mpl_connect("motion_notify_event", self.draw_region)
+
+        start = self._event_data(ax, event)
+        (preview,) = ax.plot([], [], color="cyan", linewidth=1.5, linestyle="--")
+        self.blit_manager.add_artist(preview)
+
+        self._region_info = self._RegionInfo(
+            axes=ax, cid=id_drag, points=[start, start], preview=preview
+        )
+
+    def draw_region(self, event):
+        if self._region_info is None or event.x is None:
+            return
+
+        self._region_info.points[-1] = self._event_data(self._region_info.axes, event)
+
+        region = self._make_region()
+        if region is not None:
+            patch = region.patch()
+            outline = patch.get_patch_transform().transform(patch.get_path().vertices)
+        else:
+            outline = np.array(self._region_info.points)
+
+        self._region_info.preview.set_data(*outline.T)
+
+        self.blit_manager.update()
+
+    def release_region(self, event):
+        if self._region_info is None or self.region_shape == "Polygon":
+            return
+
+        self._finish_region(self._make_region())
+
+    def _make_region(self) -> Optional[Region]:
+        """The region being drawn, None if it has no area (yet)."""
+
+        points = self._region_info.points
+        (x0, y0), (x1, y1) = points[0], points[-1]
+
+        if self.region_shape == "Polygon":
+            if len(points) < 3:
+                return None
+            return PolygonRegion(tuple((float(x), float(y)) for x, y in points))
+
+        if x0 == x1 or y0 == y1:
+            return None
+
+        if self.region_shape == "Ellipse":
+            # drawn from the centre out
+            return EllipseRegion(
+                float(x0), float(y0), float(abs(x1 - x0)), float(abs(y1 - y0))
+            )
+
+        return BoxRegion(float(x0), float(y0), float(x1), float(y1))
+
+    def _finish_region(self, region: Optional[Region]):
+        if self._region_info is None:
+            return
+
+        self.canvas.mpl_disconnect(self._region_info.cid)
+        self._id_drag = self.canvas.mpl_connect("motion_notify_event", self.mouse_move)
+
+        self._region_info.preview.remove()
+        self._region_info = None
+
+        if region is not None:
+            self.parent.add_region(region)
+        else:
+            self.blit_manager.update()
 
     def annotation_settings(
         self,
@@ -351,7 +497,7 @@ class ImageToolbar(NavigationToolbar2Tk):
         frame.grid(column=0, row=0, sticky=tk.NSEW, padx=10, pady=10)
 
         config.columnconfigure((0, 1), weight=1)
-        config.rowconfigure((0, 1, 2, 3, 4, 5, 6), weight=1)
+        config.rowconfigure((0, 1, 2, 3, 4, 5, 6, 7), weight=1)
 
         title_label = tb.Label(frame, text="Config Options", bootstyle="inverse-light")
         title_label.grid(
@@ -435,13 +581,32 @@ class ImageToolbar(NavigationToolbar2Tk):
         )
         erase_size_slider.grid(column=1, row=5, padx=10, pady=10, sticky=tk.NSEW)
 
+        # Shape config for region tool
+        region_shape_label = tb.Label(
+            frame, text="Region Shape", bootstyle="inverse-light"
+        )
+        region_shape_label.grid(column=0, row=6, sticky=tk.NSEW, padx=10, pady=10)
+
+        region_shape_dropdown = tb.Menubutton(
+            frame, text=self.region_shape, bootstyle="dark"
+        )
+        region_shape_dropdown.grid(column=1, row=6, sticky=tk.NSEW, padx=10, pady=10)
+
+        region_shape_menu = tk.Menu(region_shape_dropdown, tearoff=0)
+        for shape in REGION_SHAPES:
+            region_shape_menu.add_command(
+                label=shape,
+                command=partial(self.set_region_shape, region_shape_dropdown, shape),
+            )
+        region_shape_dropdown["menu"] = region_shape_menu
+
         apply_button = tb.Button(
             frame,
             bootstyle="success",
             text="Apply",
             command=partial(self.apply_config, config),
         )
-        apply_button.grid(column=1, row=6, sticky=tk.SE, padx=10, pady=10)
+        apply_button.grid(column=1, row=7, sticky=tk.SE, padx=10, pady=10)
 
         config.grab_set()
 
@@ -468,9 +633,20 @@ class ImageToolbar(NavigationToolbar2Tk):
         self.erase_size = value
         size_label["text"] = f"Erase Size ({value:1.2f})"
 
+    def set_region_shape(self, dropdown, shape):
+        self.region_shape = shape
+        dropdown["text"] = shape
+
     def apply_config(self, config):
         config.destroy()
 
+    def save_figure(self, *args):
+        # the overlays are animated, which savefig would otherwise leave out
+        with unanimated(self.canvas.figure):
+            super().save_figure(*args)
+
+        self.canvas.draw_idle()
+
     def update_stack(self):
         self.push_current()
 
@@ -548,6 +724,26 @@ class ImageToolbar(NavigationToolbar2Tk):
 
         button.configure(**image_kwargs)
 
+    def mouse_move(self, event):
+        """Update the cursor, and the co-ordinates under the mouse at most every
+        MOUSE_MOVE_INTERVAL, always ending on the latest ones."""
+
+        self._update_cursor(event)
+
+        self._mouse_move_event = event
+        if self._mouse_move_after is None:
+            self._mouse_move_after = self.after(
+                MOUSE_MOVE_INTERVAL, self._flush_mouse_move
+            )
+
+    def _flush_mouse_move(self):
+        event = self._mouse_move_event
+        self._mouse_move_event = None
+        self._mouse_move_after = None
+
+        if event is not None and self.winfo_exists():
+            self.set_message(self._mouse_event_to_message(event))
+
     @classmethod
     def _mouse_event_to_message(cls, event):
         if event.inaxes and event.inaxes.get_navigate():
@@ -576,4 +772,5 @@ class ImageToolbar(NavigationToolbar2Tk):
             ax._set_position(pos_active, "active")
 
         self.parent.update_matched_images()
+        self.parent.on_navigate()
         self.canvas.draw_idle()
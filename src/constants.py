@@ -3,6 +3,9 @@ import sys
 import tkinter as tk
 
 PERCENTILES = [90, 95, 99, 99.5, 99.9, 100]
+# The error (in percentile rank) allowed in the percentiles an image first opens with.
+#   The exact values are calculated in the background after.
+PERCENTILE_MAX_ERROR = 0.05
 DPI = 150
 
 # loading images and such
@@ -0,0 +1,91 @@
+import os
+import tkinter as tk
+import traceback
+from multiprocessing.pool import AsyncResult, ThreadPool
+from typing import Any, Callable, Optional
+
+# How often (ms) to check on running jobs from the Tk thread
+POLL_INTERVAL = 50
+
+# How many jobs which spend most of their time waiting (i.e. downloads) can run at once
+IO_POOL_SIZE = 8
+
+# the shared pool all background work runs on, see get_pool
+_pool: Optional[ThreadPool] = None
+# the shared pool for jobs which mostly wait, see get_io_pool
+_io_pool: Optional[ThreadPool] = None
+
+
+def get_pool() -> ThreadPool:
+    """Get the shared worker pool, creating it the first time it's needed."""
+    global _pool
+
+    if _pool is None:
+        _pool = ThreadPool(processes=os.cpu_count() or 4)
+
+    return _pool
+
+
+def get_io_pool() -> ThreadPool:
+    """Get the shared pool for jobs which spend most of their time waiting on I/O, so
+    they don't hold up the work on the main pool (which only has a thread per CPU)."""
+    global _io_pool
+
+    if _io_pool is None:
+        _io_pool = ThreadPool(processes=IO_POOL_SIZE)
+
+    return _io_pool
+
+
+def run_in_background(
+    widget: tk.Misc,
+    func: Callable,
+    *args,
+    callback: Optional[Callable[[Any], None]] = None,
+    error_callback: Optional[Callable[[BaseException], None]] = None,
+    pool: Optional[ThreadPool] = None,
+) -> AsyncResult:
+    """Run func(*args) on the worker pool, then call back with the result on the Tk thread.
+
+    Tk isn't thread safe, so func must not touch any widgets. Instead, the result is
+    polled for from the Tk thread with widget.after, and the callbacks are run from
+    there. If widget has been destroyed by the time func is done, nothing is called.
+
+    :param widget: the widget the result is for
+    :param func: the function to run in the background
+    :param callback: called with the return value of func once it's done
+    :param error_callback: called with the exception if func raises. By default the
+        traceback is just printed.
+    :param pool: the pool to run on, the shared one (see get_pool) by default
+
+    :return: the AsyncResult of the job
+    """
+
+    if pool is None:
+        pool = get_pool()
+
+    result = pool.apply_async(func, args)
+
+    def poll():
+        if not widget.winfo_exists():
+            return
+
+        if not result.ready():
+            widget.after(POLL_INTERVAL, poll)
+            return
+
+        try:
+            value = result.get()
+        except Exception as e:
+            if error_callback is None:
+                traceback.print_exception(e)
+            else:
+                error_callback(e)
+            return
+
+        if callback is not None:
+            callback(value)
+
+    widget.after(POLL_INTERVAL, poll)
+
+    return result
@@ -0,0 +1,85 @@
+from contextlib import contextmanager
+from typing import Iterable, Optional
+
+from matplotlib.artist import Artist
+from matplotlib.backend_bases import DrawEvent
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.figure import Figure
+
+
+class BlitManager:
+    """Draws overlay artists on top of a cached render of the rest of the figure.
+
+    Overlay artists (annotations, catalogue markers, the histogram's vmin / vmax lines)
+    are marked as animated, so full draws of the figure skip them. After every full
+    draw the rendered figure is cached as the background, and update only restores
+    that background and draws the overlays on top of it - which is a lot cheaper than
+    re-rendering the image underneath whenever an overlay changes.
+
+    See https://matplotlib.org/stable/users/explain/animations/blitting.html
+    """
+
+    def __init__(self, canvas: FigureCanvasTkAgg):
+        """Construct a BlitManager.
+
+        :param canvas: the canvas to draw on
+        """
+        self.canvas = canvas
+        self.background = None
+        self.artists: list[Artist] = []
+
+        self.canvas.mpl_connect("draw_event", self.on_draw)
+
+    def add_artist(self, artist: Artist):
+        """Draw the given artist as an overlay. It's dropped once it's removed."""
+        if artist in self.artists:
+            return
+
+        artist.set_animated(True)
+        self.artists.append(artist)
+
+    def add_artists(self, artists: Iterable[Artist]):
+        for artist in artists:
+            self.add_artist(artist)
+
+    def on_draw(self, event: Optional[DrawEvent]):
+        """Cache the background and draw the overlays, after a full draw."""
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self._draw_artists()
+
+    def update(self):
+        """Redraw the overlays on top of the cached background."""
+        if self.background is None:
+            # nothing's been drawn yet, so there's nothing to draw on top of
+            self.canvas.draw_idle()
+            return
+
+        self.canvas.restore_region(self.background)
+        self._draw_artists()
+        self.canvas.blit(self.canvas.figure.bbox)
+
+    def _draw_artists(self):
+        # artists which have been removed from the figure no longer have one
+        self.artists = [a for a in self.artists if a.figure is not None]
+
+        for artist in self.artists:
+            self.canvas.figure.draw_artist(artist)
+
+
+@contextmanager
+def unanimated(figure: Figure):
+    """Temporarily draw all of the animated artists of figure as part of it.
+
+    Figure.savefig skips animated artists, so the overlays of a BlitManager would be
+    missing from saved figures without this.
+    """
+    artists = figure.findobj(lambda artist: artist.get_animated())
+
+    for artist in artists:
+        artist.set_animated(False)
+
+    try:
+        yield
+    finally:
+        for artist in artists:
+            artist.set_animated(True)
@@ -0,0 +1,78 @@
+import numpy as np
+import numpy.typing as npt
+
+
+def segment_distances(points: npt.ArrayLike, x: float, y: float) -> npt.ArrayLike:
+    """The distance from (x, y) to each segment of the polyline through points.
+
+    :param points: the vertices of the polyline, as float[n][2]
+    :param x: the x of the point to measure from
+    :param y: the y of the point to measure from
+
+    :return: the distance to each of the n - 1 segments
+    """
+
+    start, end = points[:-1], points[1:]
+    direction = end - start
+    offset = np.array([x, y]) - start
+
+    length_sq = np.einsum("ij,ij->i", direction, direction)
+    # how far along each segment the closest point is. Zero length segments are
+    # just their start point
+    t = np.einsum("ij,ij->i", offset, direction) / np.where(length_sq > 0, length_sq, 1)
+    np.clip(t, 0, 1, out=t)
+
+    return np.hypot(*(offset - t[:, None] * direction).T)
+
+
+def simplify(points: npt.ArrayLike, tolerance: float) -> npt.ArrayLike:
+    """Simplify a polyline with the Ramer-Douglas-Peucker algorithm.
+
+    Drops vertices which are within tolerance of the line between the vertices kept
+    either side of them, so the simplified line never strays more than tolerance from
+    the original.
+
+    :param points: the vertices of the polyline, as float[n][2]
+    :param tolerance: the maximum distance (in the units of points) a dropped vertex
+        can be from the simplified line
+
+    :return: the kept vertices, in order
+    """
+
+    points = np.asarray(points, dtype=np.float64)
+    if len(points) < 3:
+        return points
+
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+
+    # ranges of (first, last) vertex to simplify, done with a stack rather than
+    # recursion so long strokes don't hit the recursion limit
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+
+        start, end = points[first], points[last]
+        inner = points[first + 1 : last]
+
+        # distance to the segment from start to end, not the line through them, so
+        # a stroke which doubles back along itself keeps its furthest vertices
+        direction = end - start
+        offset = inner - start
+        length_sq = direction @ direction
+        t = offset @ direction / length_sq if length_sq > 0 else np.zeros(len(inner))
+        np.clip(t, 0, 1, out=t)
+        distances = np.hypot(*(offset - t[:, None] * direction).T)
+
+        furthest = int(np.argmax(distances))
+        if distances[furthest] <= tolerance:
+            continue
+
+        split = first + 1 + furthest
+        keep[split] = True
+        stack.append((first, split))
+        stack.append((split, last))
+
+    return points[keep]
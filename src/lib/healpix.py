@@ -0,0 +1,158 @@
+import math
+from typing import Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+# The bit masks for spreading the bits of a 32 bit integer out to every other bit,
+#   as (shift, mask) from the widest shift down
+_SPREAD = [
+    (16, 0x0000FFFF0000FFFF),
+    (8, 0x00FF00FF00FF00FF),
+    (4, 0x0F0F0F0F0F0F0F0F),
+    (2, 0x3333333333333333),
+    (1, 0x5555555555555555),
+]
+
+
+def spread_bits(v: npt.ArrayLike) -> npt.ArrayLike:
+    """Spread the bits of v out to the even bits, i.e. 0b111 -> 0b10101."""
+
+    v = np.asarray(v, dtype=np.uint64)
+    for shift, mask in _SPREAD:
+        v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+
+    return v
+
+
+def interleave(x: npt.ArrayLike, y: npt.ArrayLike) -> npt.ArrayLike:
+    """The index of (x, y) within a HEALPix base pixel in the nested scheme, where the
+    bits of x are the even bits and the bits of y are the odd bits."""
+    return (spread_bits(x) | (spread_bits(y) << np.uint64(1))).astype(np.int64)
+
+
+def ang2xyf(
+    nside: int, lon: npt.ArrayLike, lat: npt.ArrayLike
+) -> Tuple[npt.ArrayLike, npt.ArrayLike, npt.ArrayLike]:
+    """Find the HEALPix pixels which points are in, as their position within their
+    base pixel (face).
+
+    This is the ang2pix of the HEALPix library (Gorski et al. 2005), without building
+    the index so the position within a HiPS tile can be found from it directly.
+
+    :param nside: the number of pixels along each side of a face, a power of 2
+    :param lon: the longitude of each point, in degrees
+    :param lat: the latitude of each point, in degrees
+
+    :return: a tuple of (x, y, face) for each point
+    """
+
+    lon, lat = np.broadcast_arrays(
+        np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64)
+    )
+
+    z = np.sin(np.radians(lat))
+    za = np.abs(z)
+    # the longitude in units of 90 degrees, in [0, 4)
+    tt = np.mod(lon, 360) / 90
+    tt = np.where(tt >= 4, 0, tt)
+
+    x = np.empty(lon.shape, dtype=np.int64)
+    y = np.empty(lon.shape, dtype=np.int64)
+    face = np.empty(lon.shape, dtype=np.int64)
+
+    # equatorial region
+    equatorial = za <= 2 / 3
+    t1 = nside * (0.5 + tt[equatorial])
+    t2 = nside * z[equatorial] * 0.75
+    # the indices of the ascending and descending edge lines
+    jp = (t1 - t2).astype(np.int64)
+    jm = (t1 + t2).astype(np.int64)
+    ifp = jp // nside
+    ifm = jm // nside
+
+    face[equatorial] = np.where(ifp == ifm, ifp | 4, np.where(ifp < ifm, ifp, ifm + 8))
+    x[equatorial] = jm & (nside - 1)
+    y[equatorial] = nside - (jp & (nside - 1)) - 1
+
+    # polar caps
+    polar = ~equatorial
+    ntt = np.minimum(tt[polar].astype(np.int64), 3)
+    tp = tt[polar] - ntt
+    tmp = nside * np.sqrt(3 * (1 - za[polar]))
+
+    jp = np.minimum((tp * tmp).astype(np.int64), nside - 1)
+    jm = np.minimum(((1 - tp) * tmp).astype(np.int64), nside - 1)
+
+    north = z[polar] >= 0
+    face[polar] = np.where(north, ntt, ntt + 8)
+    x[polar] = np.where(north, nside - jm - 1, jp)
+    y[polar] = np.where(north, nside - jp - 1, jm)
+
+    return x, y, face
+
+
+def ang2pix_nest(nside: int, lon: npt.ArrayLike, lat: npt.ArrayLike) -> npt.ArrayLike:
+    """The index (in the nested scheme) of the HEALPix pixel each point is in.
+
+    :param nside: the number of pixels along each side of a base pixel, a power of 2
+    :param lon: the longitude of each point, in degrees
+    :param lat: the latitude of each point, in degrees
+
+    :return: the index of each pixel
+    """
+
+    x, y, face = ang2xyf(nside, lon, lat)
+    return face * nside * nside + interleave(x, y)
+
+
+def ang2pix_nest_point(nside: int, lon: float, lat: float) -> int:
+    """ang2pix_nest for a single point, in plain python without the overhead of numpy
+    (which is most of the time for one point)."""
+
+    z = math.sin(math.radians(lat))
+    za = abs(z)
+    tt = (lon % 360) / 90
+    if tt >= 4:
+        tt = 0
+
+    if za <= 2 / 3:
+        t1 = nside * (0.5 + tt)
+        t2 = nside * z * 0.75
+        jp = int(t1 - t2)
+        jm = int(t1 + t2)
+        ifp = jp // nside
+        ifm = jm // nside
+
+        if ifp == ifm:
+            face = ifp | 4
+        elif ifp < ifm:
+            face = ifp
+        else:
+            face = ifm + 8
+
+        x = jm & (nside - 1)
+        y = nside - (jp & (nside - 1)) - 1
+    else:
+        ntt = min(int(tt), 3)
+        tp = tt - ntt
+        tmp = nside * math.sqrt(3 * (1 - za))
+
+        jp = min(int(tp * tmp), nside - 1)
+        jm = min(int((1 - tp) * tmp), nside - 1)
+
+        if z >= 0:
+            face, x, y = ntt, nside - jm - 1, nside - jp - 1
+        else:
+            face, x, y = ntt + 8, jp, jm
+
+    for shift, mask in _SPREAD:
+        x = (x | (x << shift)) & mask
+        y = (y | (y << shift)) & mask
+
+    return face * nside * nside + (x | (y << 1))
+
+
+def pixel_size(nside: int) -> float:
+    """The (square root of the) area of a HEALPix pixel, in degrees."""
+    return np.degrees(np.sqrt(4 * np.pi / (12 * nside * nside)))
@@ -0,0 +1,185 @@
+import bisect
+import io
+import math
+from typing import Dict, List, Optional
+
+import numpy as np
+import numpy.typing as npt
+from astropy.io import fits
+
+from src.lib import healpix
+
+# The deepest order a HEALPix index fits in an int64 at
+MAX_ORDER = 29
+
+
+def uniq_to_cells(uniq: npt.ArrayLike):
+    """Split NUNIQ indices (4 * 4^order + ipix) into their order and index.
+
+    :return: a tuple of (order, ipix), each int64[]
+    """
+
+    uniq = np.asarray(uniq, dtype=np.int64)
+    order = np.zeros(uniq.shape, dtype=np.int64)
+
+    for o in range(1, MAX_ORDER + 1):
+        order[uniq >= 4 * 4**o] = o
+
+    return order, uniq - 4 * 4**order
+
+
+def merge_ranges(starts: npt.ArrayLike, ends: npt.ArrayLike):
+    """Merge ranges (sorted by start) which touch or overlap.
+
+    :return: a tuple of (starts, ends) of the merged ranges
+    """
+
+    if len(starts) == 0:
+        return starts, ends
+
+    reach = np.maximum.accumulate(ends)
+    new = np.ones(len(starts), dtype=bool)
+    new[1:] = starts[1:] > reach[:-1]
+    last = np.append(np.flatnonzero(new)[1:] - 1, len(starts) - 1)
+
+    return starts[new], reach[last]
+
+
+class MOC:
+    """A Multi-Order Coverage map (see the IVOA MOC standard), the part of the sky a
+    survey covers.
+
+    The cells are stored as sorted, disjoint ranges of HEALPix indices at the deepest
+    order, so looking up whether a point is covered is a binary search.
+    """
+
+    def __init__(
+        self,
+        order: int,
+        starts: npt.ArrayLike,
+        ends: npt.ArrayLike,
+        frame: str = "equatorial",
+    ):
+        """Construct a MOC.
+
+        :param order: the order of the indices in the ranges
+        :param starts: the first index of each range, sorted
+        :param ends: one past the last index of each range
+        :param frame: the frame of the co-ordinates, equatorial or galactic
+        """
+
+        self.order = order
+        self.frame = frame
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+
+        # coarser versions, see degrade
+        self._degraded: Dict[int, "MOC"] = {}
+        # the ranges as lists, for contains_point
+        self._start_list: Optional[List[int]] = None
+        self._end_list: Optional[List[int]] = None
+
+    @classmethod
+    def from_uniq(cls, uniq: npt.ArrayLike, frame: str = "equatorial") -> "MOC":
+        """Make a MOC from its cells as NUNIQ indices, as a MOC FITS file has them."""
+
+        orders, ipix = uniq_to_cells(uniq)
+        order = int(orders.max(initial=0))
+
+        shift = 2 * (order - orders)
+        starts = ipix << shift
+        ends = (ipix + 1) << shift
+
+        by_start = np.argsort(starts, kind="stable")
+        return cls(order, *merge_ranges(starts[by_start], ends[by_start]), frame)
+
+    @classmethod
+    def from_fits(cls, payload: bytes) -> "MOC":
+        """Read a MOC FITS file, a binary table of the NUNIQ index of each cell."""
+
+        with fits.open(io.BytesIO(payload)) as hdul:
+            table = hdul[1]
+            frame = "galactic" if table.header.get("COORDSYS") == "G" else "equatorial"
+
+            return cls.from_uniq(np.asarray(table.data.field(0)), frame)
+
+    @property
+    def sky_fraction(self) -> float:
+        return float(np.sum(self.ends - self.starts)) / (12 * 4**self.order)
+
+    def degrade(self, order: int) -> "MOC":
+        """A coarser version of the MOC, covering every cell at order which is at
+        least partly covered. These are kept, so getting one again is free."""
+
+        if order >= self.order:
+            return self
+
+        if order not in self._degraded:
+            shift = 2 * (self.order - order)
+            starts = self.starts >> shift
+            ends = ((self.ends - 1) >> shift) + 1
+
+            self._degraded[order] = MOC(order, *merge_ranges(starts, ends), self.frame)
+
+        return self._degraded[order]
+
+    def contains_cells(
+        self, ipix: npt.ArrayLike, order: Optional[int] = None
+    ) -> npt.ArrayLike:
+        """Whether each HEALPix cell is (at least partly) covered.
+
+        :param ipix: the index of each cell, in the nested scheme
+        :param order: the order of the cells, that of the MOC by default
+        """
+
+        if order is None:
+            order = self.order
+
+        if order < self.order:
+            return self.degrade(order).contains_cells(ipix)
+
+        ipix = np.asarray(ipix, dtype=np.int64) >> (2 * (order - self.order))
+        i = np.searchsorted(self.starts, ipix, side="right") - 1
+        inside = i >= 0
+        inside[inside] = ipix[inside] < self.ends[i[inside]]
+
+        return inside
+
+    def contains(self, lon: npt.ArrayLike, lat: npt.ArrayLike) -> npt.ArrayLike:
+        """Whether each point (in degrees, in the frame of the MOC) is covered."""
+
+        return self.contains_cells(healpix.ang2pix_nest(2**self.order, lon, lat))
+
+    def contains_point(self, lon: float, lat: float) -> bool:
+        """contains for a single point, without the overhead of numpy."""
+
+        if self._start_list is None:
+            self._start_list = self.starts.tolist()
+            self._end_list = self.ends.tolist()
+
+        ipix = healpix.ang2pix_nest_point(2**self.order, lon, lat)
+        i = bisect.bisect_right(self._start_list, ipix) - 1
+
+        return i >= 0 and ipix < self._end_list[i]
+
+    def overlaps(self, lon: npt.ArrayLike, lat: npt.ArrayLike, spacing: float) -> bool:
+        """Whether any of an area is covered, from a grid of points over it.
+
+        The points are looked up in a version of the MOC coarse enough that every
+        cell it has near the area has a point in it, so a covered cell between the
+        points isn't missed.
+
+        :param lon: the longitude of each point, in degrees. NaN points are ignored
+        :param lat: the latitude of each point, in degrees
+        :param spacing: how far apart the points are, in degrees
+        """
+
+        lon = np.asarray(lon, dtype=np.float64).ravel()
+        lat = np.asarray(lat, dtype=np.float64).ravel()
+        valid = np.isfinite(lon) & np.isfinite(lat)
+
+        # cells are at least twice the spacing across
+        order = math.floor(math.log2(healpix.pixel_size(1) / max(2 * spacing, 1e-12)))
+        moc = self.degrade(min(max(order, 0), self.order))
+
+        return bool(np.any(moc.contains(lon[valid], lat[valid])))
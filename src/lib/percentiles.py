@@ -0,0 +1,260 @@
+"""Percentile estimation over (potentially much larger than memory) image data.
+
+There are two paths here:
+- approximate_percentiles, which takes a random sample of the data (only reading the
+  rows it samples) and gives percentiles with a bounded error on their rank, fast
+  enough to render an image with.
+- exact_percentiles, which gives the same result as np.nanpercentile in one chunked
+  pass over the data, without ever holding a copy of all of it. It's slow on large
+  images so is intended to be run in the background, see ImageFrame.
+
+All errors here are in percentile rank - i.e. a max_error of 0.05 means the value
+returned for the 99.5th percentile is the true value of something within the 99.45th
+to the 99.55th percentiles.
+"""
+
+import math
+from typing import Callable, Optional, Sequence, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+from src.lib.util import CHUNK_SIZE, iter_chunks
+
+# z-score for how confident we want to be that the error is within the bound (99%)
+CONFIDENCE_Z = 2.576
+# Never sample more than this many values, no matter the requested error
+MAX_SAMPLES = 2**22
+# Seed for sampling, so that opening the same image twice looks the same
+SEED = 0
+
+
+def _quantiles(percentiles: Sequence[float]) -> npt.ArrayLike:
+    return np.asarray(percentiles, dtype=np.float64) / 100
+
+
+def sample_size(percentiles: Sequence[float], max_error: float) -> int:
+    """How many (non-NaN) samples are needed for the percentiles to be within max_error.
+
+    Uses the normal approximation to the binomial for the rank of each percentile in
+    the sample, so the tails need a lot fewer samples than the median does.
+
+    :param percentiles: the percentiles which will be estimated
+    :param max_error: the acceptable error, in percentile rank
+
+    :return: the number of samples needed
+    """
+
+    eps = max_error / 100
+    q = _quantiles(percentiles)
+    # q(1 - q) is 0 at the min / max, which would need no samples at all, so floor it
+    variance = np.maximum(q * (1 - q), eps)
+
+    return int(math.ceil(np.max(CONFIDENCE_Z**2 * variance / eps**2)))
+
+
+def sample_error(percentiles: Sequence[float], samples: int) -> float:
+    """The error bound (in percentile rank) for percentiles estimated from samples values.
+
+    The inverse of sample_size.
+    """
+
+    if samples == 0:
+        return 100.0
+
+    q = _quantiles(percentiles)
+    variance = np.maximum(q * (1 - q), 1 / samples)
+
+    return float(100 * np.max(CONFIDENCE_Z * np.sqrt(variance / samples)))
+
+
+def sample_data(
+    image_data: npt.ArrayLike, max_samples: int, seed: int = SEED
+) -> npt.ArrayLike:
+    """Take a random sample of (about) max_samples values from image_data, dropping NaNs.
+
+    Picks random rows, and random columns within those rows, so only the sampled rows
+    are ever read from disk for memory-mapped data. If image_data is small enough, all
+    of it is returned.
+
+    :param image_data: the data to sample. Should be float[][] (or float[][][] for rgb).
+    :param max_samples: the (maximum) number of values to take
+    :param seed: the seed for the random sample
+
+    :return: a 1D float64 array of the sampled values
+    """
+
+    if image_data.size <= max_samples or np.ndim(image_data) < 2:
+        values = np.asarray(image_data, dtype=np.float64).ravel()
+        return values[~np.isnan(values)]
+
+    rows, cols = image_data.shape[:2]
+    channels = image_data.size // (rows * cols)
+    pixels = max(1, max_samples // channels)
+
+    # as many rows as columns (relative to the shape), to spread the sample out
+    n_rows = min(rows, max(1, math.ceil(math.sqrt(pixels * rows / cols))))
+    n_cols = min(cols, max(1, pixels // n_rows))
+
+    rng = np.random.default_rng(seed)
+    row_idx = np.sort(rng.choice(rows, n_rows, replace=False))
+    col_idx = np.sort(rng.choice(cols, n_cols, replace=False))
+
+    batch = max(1, CHUNK_SIZE // (cols * channels))
+    values = np.concatenate(
+        [
+            np.asarray(image_data[row_idx[i : i + batch]])[:, col_idx].ravel()
+            for i in range(0, n_rows, batch)
+        ]
+    ).astype(np.float64)
+
+    return values[~np.isnan(values)]
+
+
+def approximate_percentiles(
+    image_data: npt.ArrayLike, percentiles: Sequence[float], max_error: float
+) -> Tuple[npt.ArrayLike, float]:
+    """Estimate percentiles of image_data from a sample of it.
+
+    :param image_data: the data. Should be float[][].
+    :param percentiles: the percentiles to estimate, between 0 and 100
+    :param max_error: the acceptable error in percentile rank. Note the sample size is
+        capped at MAX_SAMPLES, so a very small max_error may not be met - check the
+        returned error.
+
+    :return: a tuple of (the percentile values, the error bound). The error is 0 when
+        the whole of image_data was used.
+    """
+
+    needed = min(sample_size(percentiles, max_error), MAX_SAMPLES)
+    values = sample_data(image_data, needed)
+
+    if len(values) == 0:
+        return np.full(len(percentiles), np.nan), 0.0
+
+    error = 0.0 if image_data.size <= needed else sample_error(percentiles, len(values))
+
+    return np.percentile(values, percentiles), error
+
+
+def exact_percentiles(
+    image_data: npt.ArrayLike,
+    percentiles: Sequence[float],
+    sample: Optional[npt.ArrayLike] = None,
+    visit: Optional[Callable[[npt.ArrayLike], None]] = None,
+) -> npt.ArrayLike:
+    """Calculate percentiles of image_data exactly, equivalent to np.nanpercentile.
+
+    A sample of the data is used to bracket each percentile, then a single chunked
+    pass counts the values below each bracket and collects the (few) values inside
+    it, which is enough to pick out the exact order statistics. If a bracket misses
+    (which is unlikely) it is widened and the pass redone for that percentile.
+
+    :param image_data: the data. Should be float[][].
+    :param percentiles: the percentiles to calculate, between 0 and 100
+    :param sample: a sample of image_data (see sample_data) to bracket with. One is
+        taken if not given.
+    :param visit: called with each chunk of image_data on the first pass, so other
+        reductions can be done in the same pass (see ImageStatistics)
+
+    :return: the percentile values
+    """
+
+    q = _quantiles(percentiles)
+
+    if sample is None:
+        sample = sample_data(image_data, MAX_SAMPLES)
+
+    if len(sample) == 0:
+        if visit is not None:
+            for chunk in iter_chunks(image_data):
+                visit(chunk)
+
+        return np.full(len(q), np.nan)
+
+    result = np.full(len(q), np.nan)
+    pending = np.arange(len(q))
+    # bracket half-widths, in quantiles. Start at a few times the expected sample error
+    width = np.array([3 * sample_error([p], len(sample)) / 100 for p in percentiles])
+
+    while len(pending) > 0:
+        lo_q, hi_q = q[pending] - width[pending], q[pending] + width[pending]
+        lo = np.where(lo_q <= 0, -np.inf, np.quantile(sample, np.clip(lo_q, 0, 1)))
+        hi = np.where(hi_q >= 1, np.inf, np.quantile(sample, np.clip(hi_q, 0, 1)))
+
+        count, below, inside = _bracket_pass(image_data, lo, hi, visit)
+        visit = None
+
+        if count == 0:
+            return result
+
+        still_pending = []
+        for i, target in enumerate(pending):
+            rank = q[target] * (count - 1)
+            k = int(math.floor(rank))
+            k_next = min(k + 1, count - 1)
+
+            if not below[i] <= k <= k_next < below[i] + len(inside[i]):
+                still_pending.append(target)
+                continue
+
+            lower, upper = np.partition(inside[i], (k - below[i], k_next - below[i]))[
+                [k - below[i], k_next - below[i]]
+            ]
+            result[target] = lower + (rank - k) * (upper - lower)
+
+        pending = np.array(still_pending, dtype=int)
+        width *= 4
+
+    return result
+
+
+def _bracket_pass(
+    image_data: npt.ArrayLike,
+    lo: npt.ArrayLike,
+    hi: npt.ArrayLike,
+    visit: Optional[Callable[[npt.ArrayLike], None]] = None,
+):
+    """Count the non-NaN values, the values below each lo, and collect the values
+    within each [lo, hi] bracket, in one pass over image_data."""
+
+    count = 0
+    below = np.zeros(len(lo), dtype=np.int64)
+    inside = [[] for _ in lo]
+
+    for chunk in iter_chunks(image_data):
+        if visit is not None:
+            visit(chunk)
+
+        count += chunk.size - np.count_nonzero(np.isnan(chunk))
+
+        for i, (low, high) in enumerate(zip(lo, hi)):
+            below[i] += np.count_nonzero(chunk < low)
+            inside[i].append(chunk[(chunk >= low) & (chunk <= high)])
+
+    inside = [np.concatenate(values).astype(np.float64) for values in inside]
+
+    return count, below, inside
+
+
+def get_percentiles(
+    image_data: npt.ArrayLike,
+    percentiles: Sequence[float],
+    max_error: Optional[float] = None,
+    visit: Optional[Callable[[npt.ArrayLike], None]] = None,
+) -> Tuple[npt.ArrayLike, float]:
+    """Get percentiles of image_data, either exactly or within some error.
+
+    :param image_data: the data. Should be float[][].
+    :param percentiles: the percentiles to get, between 0 and 100
+    :param max_error: the acceptable error in percentile rank, None for exact values
+    :param visit: for exact values, called with each chunk of image_data (see
+        exact_percentiles)
+
+    :return: a tuple of (the percentile values, the error bound - 0 when exact)
+    """
+
+    if max_error is None:
+        return exact_percentiles(image_data, percentiles, visit=visit), 0.0
+
+    return approximate_percentiles(image_data, percentiles, max_error)
@@ -0,0 +1,52 @@
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+
+class RedrawScheduler:
+    """Coalesces redraws of a canvas into (at most) one per Tk idle cycle.
+
+    Call request whenever the figure has changed, instead of canvas.draw. The canvas is
+    marked dirty and drawn once Tk is next idle, so any number of changes made in the
+    meantime (e.g. match_render changing the colour map, norm and grid lines of every
+    matched image) only cost one draw each.
+    """
+
+    def __init__(self, canvas: FigureCanvasTkAgg):
+        """Construct a RedrawScheduler.
+
+        :param canvas: the canvas to draw
+        """
+        self.canvas = canvas
+        self.dirty = False
+
+        # how many draws were asked for, and how many actually happened
+        self.requested = 0
+        self.draws = 0
+
+    @property
+    def avoided(self) -> int:
+        """How many of the requested draws were coalesced into another."""
+        return self.requested - self.draws - int(self.dirty)
+
+    def request(self):
+        """Mark the canvas as needing a redraw, drawing it once Tk is idle."""
+        self.requested += 1
+
+        if self.dirty:
+            return
+
+        self.dirty = True
+        self.canvas.get_tk_widget().after_idle(self.flush)
+
+    def flush(self):
+        """Draw the canvas now, if it needs it."""
+        if not self.dirty:
+            return
+
+        self.dirty = False
+
+        # the canvas may have been closed while the draw was pending
+        if not self.canvas.get_tk_widget().winfo_exists():
+            return
+
+        self.draws += 1
+        self.canvas.draw()
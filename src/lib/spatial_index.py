@@ -0,0 +1,106 @@
+import math
+from collections import defaultdict
+from typing import Hashable, Iterator, Set, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+# (x min, y min, x max, y max)
+Bounds = Tuple[float, float, float, float]
+Cell = Tuple[int, int]
+
+
+class GridIndex:
+    """A spatial hash of items over a grid of square cells.
+
+    Each item is stored in every cell it touches, so finding the items near a point
+    only looks at the items in the cells around it, rather than all of them.
+    """
+
+    def __init__(self, cell_size: float):
+        """Construct an empty GridIndex.
+
+        :param cell_size: the width / height of the cells, in the units of the bounds
+            that'll be given to it. Ideally about the size of a typical query.
+        """
+        self.cell_size = cell_size
+
+        self._cells: dict[Cell, Set[Hashable]] = defaultdict(set)
+        # which cells each item is in, for removing it
+        self._items: dict[Hashable, Set[Cell]] = {}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, item: Hashable) -> bool:
+        return item in self._items
+
+    def insert(self, item: Hashable, bounds: Bounds):
+        """Add an item covering the given bounds."""
+        self._add(item, set(self._cells_in(bounds)))
+
+    def insert_polyline(self, item: Hashable, vertices: npt.ArrayLike):
+        """Add an item which is a polyline, i.e. a stroke.
+
+        It's only added to the cells its segments pass through, not every cell in its
+        bounds (which for a long diagonal line would be a lot of cells).
+
+        :param item: the item
+        :param vertices: the vertices of the polyline, as float[n][2]
+        """
+        cells = set()
+
+        for start, end in zip(vertices[:-1], vertices[1:]):
+            # cut the segment into pieces no longer than a cell, whose bounds then
+            # cover at most 2x2 cells
+            pieces = max(1, math.ceil(np.hypot(*(end - start)) / self.cell_size))
+            points = start + (end - start) * np.linspace(0, 1, pieces + 1)[:, None]
+
+            for (x0, y0), (x1, y1) in zip(points[:-1], points[1:]):
+                cells.update(
+                    self._cells_in((min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)))
+                )
+
+        if len(vertices) == 1:
+            cells.update(self._cells_in((*vertices[0], *vertices[0])))
+
+        self._add(item, cells)
+
+    def remove(self, item: Hashable):
+        """Remove an item, if it's in the index."""
+        for cell in self._items.pop(item, ()):
+            self._cells[cell].discard(item)
+
+            if len(self._cells[cell]) == 0:
+                del self._cells[cell]
+
+    def clear(self):
+        self._cells.clear()
+        self._items.clear()
+
+    def query(self, bounds: Bounds) -> Set[Hashable]:
+        """Get the items which (may) touch the given bounds.
+
+        The index is only as precise as its cells, so an item returned might not
+        actually be within bounds, but every item within bounds is returned.
+        """
+        found = set()
+
+        for cell in self._cells_in(bounds):
+            found.update(self._cells.get(cell, ()))
+
+        return found
+
+    def _add(self, item: Hashable, cells: Set[Cell]):
+        self.remove(item)
+
+        self._items[item] = cells
+        for cell in cells:
+            self._cells[cell].add(item)
+
+    def _cells_in(self, bounds: Bounds) -> Iterator[Cell]:
+        x0, y0, x1, y1 = (math.floor(value / self.cell_size) for value in bounds)
+
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                yield x, y
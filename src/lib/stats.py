@@ -0,0 +1,172 @@
+"""Noise statistics over (potentially much larger than memory) image data.
+
+Everything here is done in chunks (see util.iter_chunks), so only a chunk of the
+data is ever copied at once, and can be done on a strided view of the data to
+only read every n-th row and column.
+"""
+
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+from src.lib import percentiles
+from src.lib.util import iter_chunks
+
+# Values more than this many standard deviations are clipped, see clipped_sigma
+CLIP = 2.5
+# Scales the median absolute deviation to the standard deviation of a normal distribution
+MAD_SCALE = 1.4826
+
+
+def strided(image_data: npt.ArrayLike, stride: int) -> npt.ArrayLike:
+    """A view of every stride-th row and column of image_data (no copy)."""
+
+    if stride <= 1:
+        return image_data
+
+    return image_data[::stride, ::stride]
+
+
+class Moments:
+    """Accumulates the count, mean, standard deviation, min and max of chunks of data.
+
+    The chunks are combined with Chan et al's pairwise update, so there's no loss of
+    precision from summing squares over a lot of values.
+    """
+
+    def __init__(self, upper: Optional[float] = None):
+        """Construct a Moments.
+
+        :param upper: only count values which are at most this
+        """
+        self.upper = upper
+
+        self.count = 0
+        self.nan_count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+        self._mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, chunk: npt.ArrayLike):
+        """Add a (1D) chunk of data."""
+
+        keep = ~np.isnan(chunk)
+        self.nan_count += len(keep) - int(np.count_nonzero(keep))
+
+        if self.upper is not None:
+            keep &= chunk <= self.upper
+
+        values = chunk[keep].astype(np.float64)
+        if len(values) == 0:
+            return
+
+        chunk_mean = values.mean()
+        chunk_m2 = np.square(values - chunk_mean).sum()
+
+        total = self.count + len(values)
+        delta = chunk_mean - self._mean
+        self._m2 += chunk_m2 + delta**2 * self.count * len(values) / total
+        self._mean += delta * len(values) / total
+        self.count = total
+
+        self.sum += values.sum()
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+    @property
+    def mean(self) -> float:
+        return self._mean if self.count > 0 else math.nan
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self._m2 / self.count) if self.count > 0 else math.nan
+
+
+def moments(
+    image_data: npt.ArrayLike, upper: Optional[float] = None, stride: int = 1
+) -> Tuple[int, float, float]:
+    """The count, mean and standard deviation of the (non-NaN) values of image_data.
+
+    :param image_data: the data. Should be float[][].
+    :param upper: only count values which are at most this
+    :param stride: only use every stride-th row and column
+
+    :return: a tuple of (count, mean, standard deviation). The mean and standard
+        deviation are NaN when there are no values.
+    """
+
+    accumulator = Moments(upper)
+    for chunk in iter_chunks(strided(image_data, stride)):
+        accumulator.add(chunk)
+
+    return accumulator.count, accumulator.mean, accumulator.std
+
+
+def clipped_sigma(
+    image_data: npt.ArrayLike,
+    clip: float = CLIP,
+    iterations: int = 1,
+    stride: int = 1,
+    moments_all: Optional[Tuple[int, float, float]] = None,
+) -> float:
+    """The standard deviation of image_data, ignoring values above clip * itself.
+
+    Each iteration is one chunked pass over the data, and clips at clip times the
+    standard deviation from the last one. With one iteration this is exactly the
+    standard deviation of the values at most clip times the standard deviation of all
+    of them.
+
+    :param image_data: the data. Should be float[][].
+    :param clip: how many standard deviations to clip at
+    :param iterations: how many times to clip. Stops early if nothing changes.
+    :param stride: only use every stride-th row and column
+    :param moments_all: the moments of all of image_data (see moments), if they're
+        already known, to save a pass
+
+    :return: the clipped standard deviation
+    """
+
+    if moments_all is None:
+        moments_all = moments(image_data, stride=stride)
+
+    count, _mean, sigma = moments_all
+
+    for _ in range(iterations):
+        if not math.isfinite(sigma):
+            break
+
+        clipped_count, _mean, sigma = moments(image_data, clip * sigma, stride)
+        if clipped_count == count:
+            break
+
+        count = clipped_count
+
+    return sigma
+
+
+def mad_sigma(
+    image_data: npt.ArrayLike, max_samples: int = percentiles.MAX_SAMPLES
+) -> float:
+    """Estimate the standard deviation of the noise in image_data from its median
+    absolute deviation, on a random sample of it.
+
+    This is much less affected by the sources in an image than the standard deviation
+    is, and only reads the sampled rows.
+
+    :param image_data: the data. Should be float[][].
+    :param max_samples: the most values to sample, see percentiles.sample_data
+
+    :return: the estimated standard deviation
+    """
+
+    values = percentiles.sample_data(image_data, max_samples)
+    if len(values) == 0:
+        return math.nan
+
+    median = np.median(values)
+    return float(MAD_SCALE * np.median(np.abs(values - median)))
@@ -1,10 +1,16 @@
 import tkinter as tk
-from typing import Optional, TypeVar
+from typing import Iterator, Optional, TypeVar
+
+import numpy as np
+import numpy.typing as npt
 
 from src import constants
 
 T = TypeVar("T")
 
+# Roughly how many elements of an array to read in to memory at once in iter_chunks
+CHUNK_SIZE = 2**22
+
 
 def with_defaults(*values: list[T]) -> Optional[T]:
     """Takes a list of values, returning the first one which is not None.
@@ -29,3 +35,27 @@ def get_size_inches(widget: tk.Widget):
     """Returns the size of the given widget as a tuple of inches."""
 
     return widget.winfo_width() / constants.DPI, widget.winfo_height() / constants.DPI
+
+
+def iter_chunks(
+    image_data: npt.ArrayLike, chunk_size: int = CHUNK_SIZE
+) -> Iterator[npt.ArrayLike]:
+    """Iterate over image_data in flat chunks of (roughly) chunk_size elements.
+
+    The chunks are split along the first axis, so for memory-mapped data each chunk
+    is a contiguous part of the file and only one chunk is in memory at a time.
+
+    :param image_data: the data to iterate over
+    :param chunk_size: about how many elements to put in each chunk
+
+    :return: an iterator of 1D arrays, which together hold every element of image_data
+    """
+
+    if np.ndim(image_data) < 2:
+        image_data = np.reshape(image_data, (-1, 1))
+
+    row_size = max(1, image_data[0].size) if len(image_data) > 0 else 1
+    rows = max(1, chunk_size // row_size)
+
+    for i in range(0, len(image_data), rows):
+        yield np.asarray(image_data[i : i + rows]).ravel()
@@ -1,11 +1,14 @@
+import tkinter as tk
 from dataclasses import dataclass
+from typing import Callable, Optional
 
-import numpy as np
 import numpy.typing as npt
 from astropy import wcs
-from matplotlib.contour import QuadContourSet
 from matplotlib.figure import Figure
-from scipy.ndimage.filters import gaussian_filter
+
+from src.lib import stats
+from src.widgets.contour import contour_geometry
+from src.widgets.contour.contour_overlay import ContourOverlay
 
 
 def generate_levels(mean: float, sigma: float, sigma_list: list[float]):
@@ -24,17 +27,15 @@ def generate_levels(mean: float, sigma: float, sigma_list: list[float]):
 def get_sigma(image_data: npt.ArrayLike):
     """Calculate the sigma based on the data clipped at 2.5 times the standard deviation.
 
-    Taken with modifications with permission from Kieran Luken.
+    Taken with modifications with permission from Kieran Luken. This is done in chunks
+    (see stats.clipped_sigma), so it doesn't copy the data.
 
     :param image_data: the data to calculate from. Should be a float[][]
     """
-    clipped_image = np.copy(image_data)
-    clip_level = 2.5 * np.nanstd(clipped_image)
-    clipped_image[np.where(clipped_image > clip_level)] = np.nan
-    return np.nanstd(clipped_image)
+    return stats.clipped_sigma(image_data, clip=2.5)
 
     # if you want no clipping, use this!
-    # return np.nanstd(image_data)
+    # return stats.moments(image_data)[2]
 
 
 @dataclass
@@ -46,6 +47,8 @@ class RenderContourOptions:
     :param data_source_wcs: the wcs object of the data sourjce
     :param contour_levels: the thresholds to draw contour lines at
     :param gaussian_factor: how much to smooth the data before generating contours on
+    :param fast_smoothing: whether a large gaussian_factor can be smoothed on a
+        decimated copy of the data (see smoothing.smooth)
     :param line_colour: the colour of the contour lines
     :param line_opacity: the opacity of the contour lines
     :param line_width: the width of the contour lines
@@ -58,43 +61,64 @@ class RenderContourOptions:
     line_colour: str
     line_opacity: float
     line_width: float
+    fast_smoothing: bool = True
 
 
-def clear_contours(contour_set: QuadContourSet):
+def clear_contours(contour_set: Optional[ContourOverlay]):
     """Remove all contours from the axes.
 
-    :param contour_set: the set of contours to remove from
+    :param contour_set: the contour lines to remove
     """
     if contour_set is not None:
-        for contour in contour_set.collections:
-            contour.remove()
+        contour_set.remove()
 
 
 def update_contours(
-    fig: Figure, contour_set: QuadContourSet, options: RenderContourOptions
-):
+    fig: Figure,
+    contour_set: Optional[ContourOverlay],
+    options: RenderContourOptions,
+    widget: tk.Misc,
+    on_change: Callable[[], None],
+) -> ContourOverlay:
     """Draw contours onto the 0th axes on the given figure with the given
         options.
 
     Will replace the existing contour_set when provided.
 
+    The lines themselves are only found once per data source and options (see
+    contour_geometry.get_contour_paths), drawing them on each image just transforms
+    them from the pixels of the data source to the pixels of the image. Only the
+    lines in view are drawn, at the level of detail of the view (see ContourOverlay).
+
     :param fig: the figure to draw on
     :param contour_set: the existing contour set, passed here to clear
     :param options: options given to render the contour as
+    :param widget: the widget to simplify the lines in the background for
+    :param on_change: called when the lines change after a pan / zoom, to redraw
+
+    :return: the drawn contour lines
     """
 
     clear_contours(contour_set)
 
-    print("I'm trying to contour!")
     options.contour_levels.sort()
 
     # https://stackoverflow.com/questions/12274529/how-to-smooth-matplotlib-contour-plot
-    data_smooth = gaussian_filter(options.data_source, options.gaussian_factor)
-    return fig.axes[0].contour(
-        data_smooth,
-        levels=options.contour_levels,
+    paths = contour_geometry.get_contour_paths(
+        options.data_source,
+        options.contour_levels,
+        options.gaussian_factor,
+        options.fast_smoothing,
+    )
+
+    ax = fig.axes[0]
+    return ContourOverlay(
+        widget,
+        ax,
+        paths,
+        ax.get_transform(options.data_source_wcs),
+        on_change,
         colors=options.line_colour,
         alpha=options.line_opacity,
         linewidths=options.line_width,
-        transform=fig.axes[0].get_transform(options.data_source_wcs),
     )
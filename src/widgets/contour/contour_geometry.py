@@ -0,0 +1,369 @@
+import math
+import os
+import weakref
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field
+from functools import partial
+from multiprocessing.pool import ThreadPool
+from typing import Callable, Optional, Sequence, Tuple
+
+import contourpy
+import numpy as np
+import numpy.typing as npt
+
+from src.lib import geometry
+from src.widgets.contour import smoothing
+
+# How many sets of contour paths to keep around
+CACHE_SIZE = 8
+# The size (in smoothed pixels) of the tiles the lines are traced over in parallel
+TILE_SIZE = 1024
+# How many threads to trace the tiles with. contourpy releases the GIL, so this scales
+THREADS = os.cpu_count() or 1
+# Line ends at tile seams are matched after rounding to this many decimal places
+SEAM_DECIMALS = 6
+# Simplified lines stray at most this many screen pixels from the full detail ones
+DETAIL_TOLERANCE = 0.5
+# The finest level of detail lines are simplified for. Zoomed in any further than
+#   this, the full detail lines are drawn
+MIN_DETAIL_LEVEL = -2
+
+# (x min, y min, x max, y max)
+Bounds = Tuple[float, float, float, float]
+
+
+@dataclass
+class ContourPaths:
+    """The contour lines of a data source, in its pixel co-ordinates.
+
+    :param levels: the levels the lines are at, sorted
+    :param lines: for each level, the lines at it, each as float[n][2] of (x, y)
+    """
+
+    levels: list[float]
+    lines: list[list[npt.ArrayLike]]
+
+    # detail level -> the simplified segments, see simplified
+    _simplified: dict = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+    _bounds: Optional[npt.ArrayLike] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    # detail level being simplified -> called with it once it's done, see
+    # wait_for_detail_level. Shared by everything drawing these paths, so each
+    # level is only simplified once
+    _pending: dict = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    def segments(self) -> Tuple[list[npt.ArrayLike], list[float]]:
+        """All of the lines as one list, with the level of each line."""
+
+        segments, levels = [], []
+        for level, lines in zip(self.levels, self.lines):
+            segments.extend(lines)
+            levels.extend([level] * len(lines))
+
+        return segments, levels
+
+    def bounds(self) -> npt.ArrayLike:
+        """The bounding box of each of the segments, as float[n][4] (see Bounds)."""
+
+        if self._bounds is None:
+            segments, _levels = self.segments()
+            self._bounds = np.array(
+                [(*line.min(axis=0), *line.max(axis=0)) for line in segments]
+            ).reshape(-1, 4)
+
+        return self._bounds
+
+    def has_detail_level(self, level: Optional[int]) -> bool:
+        """Whether the segments at level have been simplified yet."""
+        return level is None or level in self._simplified
+
+    def closest_detail_level(self, level: int) -> Optional[int]:
+        """The simplified level closest to level, preferring coarser ones (which are
+        cheaper to draw), or None if no level has been simplified yet."""
+
+        ready = list(self._simplified)
+        coarser = [other for other in ready if other > level]
+        if coarser:
+            return min(coarser)
+
+        return max(ready, default=None)
+
+    def wait_for_detail_level(
+        self, level: int, callback: Callable[[int], None]
+    ) -> bool:
+        """Have callback called with level once it's simplified (see
+        detail_level_ready).
+
+        :return: whether the caller should simplify it, which is only the first to
+            wait on it
+        """
+
+        waiting = level in self._pending
+        self._pending.setdefault(level, []).append(callback)
+
+        return not waiting
+
+    def detail_level_ready(self, level: int, _segments=None):
+        """Call everything waiting on level, once it's been simplified."""
+
+        for callback in self._pending.pop(level, []):
+            callback(level)
+
+    def simplified(self, level: Optional[int]) -> list[npt.ArrayLike]:
+        """The segments simplified for a detail level (see detail_level).
+
+        Simplifying every line is slow, so is intended to be done in the background
+        the first time each level is needed. The result is kept, and as the lines are
+        in the pixels of the data source it's shared by every image they're drawn on.
+
+        :param level: the detail level, None for the full detail segments
+
+        :return: the simplified segments, in the same order as segments
+        """
+
+        if level is None:
+            return self.segments()[0]
+
+        if level not in self._simplified:
+            tolerance = DETAIL_TOLERANCE * 2**level
+            self._simplified[level] = [
+                geometry.simplify(line, tolerance) for line in self.segments()[0]
+            ]
+
+        return self._simplified[level]
+
+
+def detail_level(density: float) -> Optional[int]:
+    """The level of detail to draw lines at, for a view with the given density.
+
+    Level k is simplified to within DETAIL_TOLERANCE * 2**k data pixels, which is
+    at most DETAIL_TOLERANCE screen pixels for any density from 2**k up to 2**(k+1),
+    so zooming only needs a new level each time the density doubles.
+
+    :param density: how many data pixels are in each screen pixel
+
+    :return: the level, or None when the full detail lines should be drawn
+    """
+
+    if not density > 0 or not math.isfinite(density):
+        return None
+
+    level = math.floor(math.log2(density))
+    return None if level < MIN_DETAIL_LEVEL else level
+
+
+def visible_lines(bounds: npt.ArrayLike, view: Bounds) -> npt.ArrayLike:
+    """Which lines have a bounding box overlapping the view.
+
+    :param bounds: the bounding box of each line, see ContourPaths.bounds
+    :param view: the bounding box of the view, in the same co-ordinates
+
+    :return: the indices of the overlapping lines
+    """
+
+    x0, y0, x1, y1 = view
+    return np.flatnonzero(
+        (bounds[:, 0] <= x1)
+        & (bounds[:, 2] >= x0)
+        & (bounds[:, 1] <= y1)
+        & (bounds[:, 3] >= y0)
+    )
+
+
+# (id of the data source, gaussian factor, fast smoothing, levels) ->
+#   (weakref to the data source, the paths)
+_cache: "OrderedDict[Tuple, Tuple[weakref.ref, ContourPaths]]" = OrderedDict()
+
+
+def compute_contour_paths(
+    data: npt.ArrayLike,
+    levels: Sequence[float],
+    gaussian_factor: float,
+    fast_smoothing: bool = True,
+) -> ContourPaths:
+    """Smooth data and find the contour lines at levels, see get_contour_paths."""
+
+    data_smooth, factor = smoothing.smooth(data, gaussian_factor, fast_smoothing)
+
+    # the pixel co-ordinates (in data) of the centres of the smoothed pixels
+    offset = (factor - 1) / 2
+    x = np.arange(data_smooth.shape[1]) * factor + offset
+    y = np.arange(data_smooth.shape[0]) * factor + offset
+
+    levels = sorted(levels)
+    return ContourPaths(levels, trace_lines(x, y, data_smooth, levels))
+
+
+def trace_lines(
+    x: npt.ArrayLike,
+    y: npt.ArrayLike,
+    z: npt.ArrayLike,
+    levels: Sequence[float],
+    tile_size: int = TILE_SIZE,
+    threads: int = THREADS,
+) -> list[list[npt.ArrayLike]]:
+    """Find the contour lines of z at each level, over tiles in parallel.
+
+    The tiles overlap by a row / column, so a line crossing from one tile into the
+    next has an end in both at the same point on the seam, and those are joined back
+    up once all the tiles are traced (see stitch_lines).
+
+    :param x: the x co-ordinate of each column of z
+    :param y: the y co-ordinate of each row of z
+    :param z: the data to contour. Should be float[][].
+    :param levels: the levels to find the lines at
+    :param tile_size: the size of the tiles
+    :param threads: how many threads to trace the tiles with
+
+    :return: for each level, the lines at it, each as float[n][2] of (x, y)
+    """
+
+    rows, cols = z.shape
+    tiles = [
+        (
+            slice(r, min(r + tile_size, rows - 1) + 1),
+            slice(c, min(c + tile_size, cols - 1) + 1),
+        )
+        for r in range(0, max(rows - 1, 1), tile_size)
+        for c in range(0, max(cols - 1, 1), tile_size)
+    ]
+
+    trace = partial(_trace_tile, x, y, z, levels)
+
+    if len(tiles) == 1 or threads <= 1:
+        traced = [trace(tile) for tile in tiles]
+    else:
+        with ThreadPool(min(threads, len(tiles))) as pool:
+            traced = pool.map(trace, tiles)
+
+    if len(tiles) == 1:
+        return traced[0]
+
+    return [
+        stitch_lines([line for tile in traced for line in tile[i]])
+        for i in range(len(levels))
+    ]
+
+
+def _trace_tile(x, y, z, levels, tile) -> list[list[npt.ArrayLike]]:
+    rows, cols = tile
+
+    if rows.stop - rows.start < 2 or cols.stop - cols.start < 2:
+        return [[] for _ in levels]
+
+    generator = contourpy.contour_generator(
+        x[cols],
+        y[rows],
+        np.ma.masked_invalid(z[rows, cols]),
+        line_type=contourpy.LineType.Separate,
+    )
+
+    return [list(generator.lines(level)) for level in levels]
+
+
+def stitch_lines(lines: list[npt.ArrayLike]) -> list[npt.ArrayLike]:
+    """Join up lines which end at the same point, i.e. either side of a tile seam.
+
+    :param lines: the lines to join, each as float[n][2]
+
+    :return: the joined lines. Lines which are already closed are left as they are.
+    """
+
+    def key(point):
+        return tuple(np.round(point, SEAM_DECIMALS))
+
+    closed = [line for line in lines if np.array_equal(line[0], line[-1])]
+    open_lines = [line for line in lines if not np.array_equal(line[0], line[-1])]
+
+    # the point at each end of each open line -> [(line, which end)]
+    ends = defaultdict(list)
+    for i, line in enumerate(open_lines):
+        ends[key(line[0])].append((i, 0))
+        ends[key(line[-1])].append((i, -1))
+
+    used = [False] * len(open_lines)
+
+    def follow(pieces):
+        # keep adding on whichever unused line starts / ends where pieces ends
+        while True:
+            for j, end in ends[key(pieces[-1][-1])]:
+                if not used[j]:
+                    break
+            else:
+                return pieces
+
+            used[j] = True
+            line = open_lines[j] if end == 0 else open_lines[j][::-1]
+            pieces.append(line[1:])
+
+    joined = []
+    for i, line in enumerate(open_lines):
+        if used[i]:
+            continue
+
+        used[i] = True
+        forwards = follow([line])
+        backwards = follow([line[::-1]])
+
+        pieces = [piece[::-1] for piece in backwards[:0:-1]] + forwards
+        joined.append(np.concatenate(pieces))
+
+    return closed + joined
+
+
+def get_contour_paths(
+    data: npt.ArrayLike,
+    levels: Sequence[float],
+    gaussian_factor: float,
+    fast_smoothing: bool = True,
+) -> ContourPaths:
+    """Get the contour lines of data at levels, after smoothing it.
+
+    The lines are in the pixel co-ordinates of data, so they're the same whichever image
+    they're drawn on, and are cached by the identity of data and the options so that
+    drawing the same contours on many images only finds them once.
+
+    :param data: the data source. Should be float[][].
+    :param levels: the levels to draw the lines at
+    :param gaussian_factor: how much to smooth the data before finding the lines
+    :param fast_smoothing: whether a large gaussian_factor can be smoothed on a
+        decimated copy of the data (see smoothing.smooth)
+
+    :return: the contour paths
+    """
+
+    key = (id(data), gaussian_factor, fast_smoothing, tuple(sorted(levels)))
+
+    if key in _cache:
+        ref, paths = _cache[key]
+        # ids can be reused once the data is gone, so check it's the same data
+        if ref() is data:
+            _cache.move_to_end(key)
+            return paths
+
+        del _cache[key]
+
+    paths = compute_contour_paths(data, levels, gaussian_factor, fast_smoothing)
+
+    _cache[key] = (weakref.ref(data), paths)
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+
+    return paths
+
+
+def clear_cache():
+    _cache.clear()
+
+
+def forget(data: npt.ArrayLike):
+    """Drop the cached paths for data, and the smoothed data they were found from,
+    i.e. once it's been changed in place."""
+
+    for key in [key for key, (ref, _paths) in _cache.items() if ref() is data]:
+        del _cache[key]
+
+    smoothing.forget(data)
@@ -0,0 +1,181 @@
+import tkinter as tk
+from functools import partial
+from typing import Callable, Optional
+
+import numpy as np
+from matplotlib import rcParams
+from matplotlib.axes import Axes
+from matplotlib.collections import LineCollection
+from matplotlib.transforms import Transform
+
+from src.lib import background
+from src.widgets.contour import contour_geometry
+from src.widgets.contour.contour_geometry import Bounds, ContourPaths
+
+# The view is grown by this fraction of its size on each side before culling, so
+#   panning a little doesn't immediately show lines which haven't been added yet
+CULL_MARGIN = 0.25
+
+
+class ContourOverlay:
+    """Contour lines drawn on an image at the level of detail of the current view.
+
+    Only the lines which overlap the view are drawn, simplified to within half a
+    screen pixel (see ContourPaths.simplified), so a zoomed out view of a large
+    mosaic isn't drawing millions of sub-pixel segments. Whenever the view changes
+    the lines are culled again, and if the view needs a level of detail which hasn't
+    been simplified yet it's done in the background, drawing the closest level there
+    is until it's done (see ContourPaths.closest_detail_level).
+    """
+
+    def __init__(
+        self,
+        widget: tk.Misc,
+        ax: Axes,
+        paths: ContourPaths,
+        transform: Transform,
+        on_change: Callable[[], None],
+        **kwargs,
+    ):
+        """Construct a ContourOverlay, and add it to the axes.
+
+        :param widget: the widget to run the background simplifying for
+        :param ax: the axes to draw on
+        :param paths: the contour lines, in the pixels of their data source
+        :param transform: the transform from the pixels of the data source to the
+            display, i.e. ax.get_transform(data source wcs)
+        :param on_change: called whenever the drawn lines change (from the
+            background), to redraw the canvas
+        :param kwargs: the style of the lines, passed to the LineCollection
+        """
+
+        self.widget = widget
+        self.ax = ax
+        self.paths = paths
+        self.transform = transform
+        self.on_change = on_change
+
+        _segments, levels = paths.segments()
+        # like matplotlib's contour, negative levels are dashed when they're all one colour
+        self.linestyles = np.array(
+            [
+                rcParams["contour.negative_linestyle"] if level < 0 else "solid"
+                for level in levels
+            ],
+            dtype=object,
+        )
+
+        # the detail level simplified segments are wanted at, and the one drawn
+        self.level: Optional[int] = None
+        self.drawn_level: Optional[int] = None
+
+        self.collection = LineCollection([], transform=transform, **kwargs)
+        ax.add_collection(self.collection, autolim=False)
+
+        self.cids = [
+            ax.callbacks.connect("xlim_changed", self.update_view),
+            ax.callbacks.connect("ylim_changed", self.update_view),
+        ]
+
+        self.update_view()
+
+    def remove(self):
+        """Remove the lines from the axes."""
+        for cid in self.cids:
+            self.ax.callbacks.disconnect(cid)
+
+        self.collection.remove()
+
+    def get_view(self) -> Optional[Bounds]:
+        """The bounding box of the view in the pixels of the data source, with a margin.
+
+        :return: the bounding box, or None when the view couldn't be mapped (i.e.
+            it's off the edge of the sky)
+        """
+
+        x0, y0, x1, y1 = self.ax.bbox.extents
+        # the corners and midpoints of the edges, in case the source is rotated
+        # relative to the image
+        display = np.array(
+            [(x, y) for x in (x0, (x0 + x1) / 2, x1) for y in (y0, (y0 + y1) / 2, y1)]
+        )
+
+        with np.errstate(invalid="ignore"):
+            points = self.transform.inverted().transform(display)
+
+        points = points[np.all(np.isfinite(points), axis=1)]
+        if len(points) == 0:
+            return None
+
+        (px0, py0), (px1, py1) = points.min(axis=0), points.max(axis=0)
+        margin_x, margin_y = CULL_MARGIN * (px1 - px0), CULL_MARGIN * (py1 - py0)
+
+        return px0 - margin_x, py0 - margin_y, px1 + margin_x, py1 + margin_y
+
+    def get_density(self, view: Bounds) -> float:
+        """How many data source pixels are in each screen pixel, for a view."""
+
+        x0, y0, x1, y1 = view
+        scale = 1 + 2 * CULL_MARGIN
+
+        return max(
+            (x1 - x0) / scale / max(self.ax.bbox.width, 1),
+            (y1 - y0) / scale / max(self.ax.bbox.height, 1),
+        )
+
+    def update_view(self, *_args):
+        """Cull and simplify the lines for the current view.
+
+        Called whenever the limits of the axes change.
+        """
+
+        view = self.get_view()
+        self.level = (
+            None
+            if view is None
+            else contour_geometry.detail_level(self.get_density(view))
+        )
+
+        if self.paths.has_detail_level(self.level):
+            self.draw(self.level, view)
+            return
+
+        # draw what we have while the level is simplified. The full detail lines
+        # are what this is avoiding, so if nothing's simplified yet nothing's drawn
+        closest = self.paths.closest_detail_level(self.level)
+        if closest is not None:
+            self.draw(closest, view)
+        else:
+            self.collection.set_segments([])
+
+        if self.paths.wait_for_detail_level(self.level, self.on_simplified):
+            background.run_in_background(
+                self.widget,
+                self.paths.simplified,
+                self.level,
+                callback=partial(self.paths.detail_level_ready, self.level),
+            )
+
+    def on_simplified(self, level: int):
+        # if the view has moved on to another level since, update_view has that
+        if level == self.level and self.collection.axes is not None:
+            self.draw(level, self.get_view())
+            self.on_change()
+
+    def draw(self, level: Optional[int], view: Optional[Bounds]):
+        """Set the lines drawn to the lines in view, at the given level of detail.
+
+        :param level: the detail level, this must already be simplified
+        :param view: the view to cull to, None to draw every line
+        """
+
+        segments = self.paths.simplified(level)
+
+        if view is None:
+            visible = np.arange(len(segments))
+        else:
+            visible = contour_geometry.visible_lines(self.paths.bounds(), view)
+
+        self.collection.set_segments([segments[i] for i in visible])
+        self.collection.set_linestyles(list(self.linestyles[visible]) or "solid")
+        self.drawn_level = level
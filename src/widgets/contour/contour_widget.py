@@ -2,6 +2,7 @@ import re
 import tkinter as tk
 from functools import partial
 from tkinter import messagebox
+from typing import Tuple
 
 import numpy as np
 import ttkbootstrap as tb
@@ -10,7 +11,9 @@ import src.widgets.contour.contour as contour
 import src.widgets.image.image_controller as ic
 from src.components.color_chooser import ColourChooserButton
 from src.enums import DataType
+from src.lib import background
 from src.widgets.base_widget import BaseWidget
+from src.widgets.image.image_statistics import ImageStatistics
 
 BAD_MEAN_SIGMA = 'One of the "Mean" or "Sigma" fields is invalid. They must be floats.'
 BAD_LEVELS = (
@@ -30,6 +33,11 @@ INVALID_IMAGE = "Cannot apply contours to png images."
 INVALID_INPUT = "Invalid Input"
 
 
+def get_mean_sigma(statistics: ImageStatistics) -> Tuple[float, float]:
+    """The mean and sigma of an image, see ImageStatistics."""
+    return statistics.mean(), statistics.sigma()
+
+
 def validate_list_entry(text: str) -> bool:
     """Validates the given text matches the input for a "list" or "tag input"-like entry.
 
@@ -56,7 +64,7 @@ class ContourWidget(BaseWidget):
 
         self.frame = tb.Frame(self, bootstyle="light")
         self.frame.grid(column=0, row=0, sticky=tk.NSEW, padx=10, pady=10)
-        self.frame.grid_rowconfigure((0, 1, 2, 3, 4, 5, 6, 7), weight=1)
+        self.frame.grid_rowconfigure((0, 1, 2, 3, 4, 5, 6, 7, 8), weight=1)
         self.frame.grid_columnconfigure((0, 2), weight=1)
         self.frame.grid_columnconfigure((1, 3), weight=2)
 
@@ -123,7 +131,7 @@ class ContourWidget(BaseWidget):
         # Apply / Close buttons
         self.buttons = tb.Frame(self.frame, bootstyle="light")
         self.buttons.grid(
-            column=0, columnspan=4, row=7, sticky=tk.NSEW, padx=10, pady=10
+            column=0, columnspan=4, row=8, sticky=tk.NSEW, padx=10, pady=10
         )
         self.buttons.rowconfigure(0, weight=1)
         self.buttons.columnconfigure(0, weight=1)
@@ -183,6 +191,21 @@ class ContourWidget(BaseWidget):
         self.gaussian_entry.grid(column=3, row=2, padx=10, pady=10, sticky=tk.W)
         self.gaussian_entry.insert(0, "4")
 
+        fast_smoothing_label = tb.Label(
+            self.frame, text="Fast Smoothing", bootstyle="inverse-light"
+        )
+        fast_smoothing_label.grid(column=2, row=3, padx=10, pady=10, sticky=tk.W)
+
+        # smooth large gaussian factors on a decimated copy of the data source
+        self.fast_smoothing = tk.BooleanVar(value=True)
+        self.fast_smoothing_cbtn = tb.Checkbutton(
+            self.frame,
+            bootstyle="primary-round-toggle",
+            text=None,
+            variable=self.fast_smoothing,
+        )
+        self.fast_smoothing_cbtn.grid(column=3, row=3, padx=10, pady=10, sticky=tk.W)
+
         # Styling
         styling_label = tb.Label(
             self.frame,
@@ -190,34 +213,34 @@ class ContourWidget(BaseWidget):
             bootstyle="inverse-light",
             font=("Helvetica bold", 10),
         )
-        styling_label.grid(column=2, row=3, padx=10, pady=10, sticky=tk.W)
+        styling_label.grid(column=2, row=4, padx=10, pady=10, sticky=tk.W)
 
         lc_label = tb.Label(self.frame, text="Line Colour", bootstyle="inverse-light")
-        lc_label.grid(column=2, row=4, padx=10, pady=10, sticky=tk.W)
+        lc_label.grid(column=2, row=5, padx=10, pady=10, sticky=tk.W)
 
         self.lc_button = ColourChooserButton(
             self.frame, width=24, height=24, window_title="Choose Contour Line Colour"
         )
-        self.lc_button.grid(column=3, row=4, sticky=tk.W, padx=10)
+        self.lc_button.grid(column=3, row=5, sticky=tk.W, padx=10)
 
         self.lo_label = tb.Label(
             self.frame, text="Line Opacity (0.50)", bootstyle="inverse-light"
         )
-        self.lo_label.grid(column=2, row=5, padx=10, pady=10, sticky=tk.W)
+        self.lo_label.grid(column=2, row=6, padx=10, pady=10, sticky=tk.W)
 
         self.lo_slider = tb.Scale(
             self.frame, command=self.set_line_opacity, value=self.line_opacity
         )
-        self.lo_slider.grid(column=3, row=5, padx=10, pady=10, sticky=tk.W)
+        self.lo_slider.grid(column=3, row=6, padx=10, pady=10, sticky=tk.W)
 
         self.lw_label = tb.Label(
             self.frame, text="Line Width", bootstyle="inverse-light"
         )
-        self.lw_label.grid(column=2, row=6, padx=10, pady=10, sticky=tk.W)
+        self.lw_label.grid(column=2, row=7, padx=10, pady=10, sticky=tk.W)
 
         self.lw_entry = tb.Entry(self.frame)
         self.lw_entry.insert(0, 0.5)
-        self.lw_entry.grid(column=3, row=6, padx=10, pady=10, sticky=tk.W)
+        self.lw_entry.grid(column=3, row=7, padx=10, pady=10, sticky=tk.W)
 
         self.update_dropdown(
             ic.get_selected_image(),
@@ -247,14 +270,33 @@ class ContourWidget(BaseWidget):
         self.data_source = image
         self.data_source_dropdown["text"] = image.file_name
 
-        self.mean_entry.insert(
-            0, np.format_float_positional(np.nanmean(self.data_source.image_data))
-        )
-        self.sigma_entry.insert(
-            0,
-            np.format_float_positional(contour.get_sigma(self.data_source.image_data)),
-        )
         self.sigmas_entry.insert(0, "-5,5,9,13,17")
+
+        # the statistics can take a while for large images, so the mean and sigma
+        # are filled in once they're ready rather than waiting on them here
+        statistics = self.data_source.statistics
+        if statistics.get("mean") is not None and statistics.get("sigma") is not None:
+            self.set_mean_sigma(
+                image, (statistics.get("mean"), statistics.get("sigma"))
+            )
+        else:
+            background.run_in_background(
+                self,
+                get_mean_sigma,
+                statistics,
+                callback=partial(self.set_mean_sigma, image),
+            )
+
+    def set_mean_sigma(self, image, mean_sigma):
+        # a different data source may have been picked while they were calculated
+        if image is not self.data_source:
+            return
+
+        mean, sigma = mean_sigma
+        self.mean_entry.delete(0, tk.END)
+        self.sigma_entry.delete(0, tk.END)
+        self.mean_entry.insert(0, np.format_float_positional(mean))
+        self.sigma_entry.insert(0, np.format_float_positional(sigma))
         self.generate_levels()
 
     def update_dropdown(self, selected_image, image_list):
@@ -352,6 +394,7 @@ class ContourWidget(BaseWidget):
             line_colour=self.line_colour,
             line_opacity=self.line_opacity,
             line_width=line_width,
+            fast_smoothing=self.fast_smoothing.get(),
         )
 
         images = ic.get_images() if not selected else [ic.get_selected_image()]
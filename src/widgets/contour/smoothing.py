@@ -0,0 +1,129 @@
+import math
+import weakref
+from collections import OrderedDict
+from typing import Tuple
+
+import numpy as np
+import numpy.typing as npt
+from scipy.ndimage import gaussian_filter
+
+from src.widgets.image.image_pyramid import CHUNK_SIZE, block_reduce
+
+# At or above this gaussian factor, the data is decimated before it's smoothed (when
+#   downsampling is allowed), as the detail lost is smoothed away anyway
+DOWNSAMPLE_SIGMA = 4
+# The smoothed data to keep around, in bytes. The most recently used is always kept
+CACHE_BYTES = 2**30
+
+# (id of the data source, gaussian factor, downsample) -> (weakref to the data source,
+#   the smoothed data, the factor it was decimated by)
+_cache: "OrderedDict[Tuple, Tuple[weakref.ref, npt.ArrayLike, int]]" = OrderedDict()
+
+
+def decimation_factor(sigma: float) -> int:
+    """How much data smoothed by sigma can be decimated by, without visibly changing it.
+
+    Half of sigma keeps at least two samples per sigma, which the gaussian is smooth
+    over.
+    """
+
+    if sigma < DOWNSAMPLE_SIGMA:
+        return 1
+
+    return int(sigma // 2)
+
+
+def decimate(data: npt.ArrayLike, factor: int) -> npt.ArrayLike:
+    """Average data over factor x factor blocks, ignoring NaNs.
+
+    This is done in chunks of rows, so (memory-mapped) data is never read in to
+    memory all at once.
+    """
+
+    if factor == 1:
+        return data
+
+    rows = factor * max(1, CHUNK_SIZE // (factor * data.shape[1]))
+
+    return np.concatenate(
+        [
+            block_reduce(data[i : i + rows], factor)
+            for i in range(0, data.shape[0], rows)
+        ]
+    )
+
+
+def smooth_uncached(
+    data: npt.ArrayLike, sigma: float, downsample: bool = True
+) -> Tuple[npt.ArrayLike, int]:
+    """Smooth data with a gaussian, see smooth."""
+
+    factor = decimation_factor(sigma) if downsample else 1
+    decimated = decimate(data, factor)
+
+    # averaging over blocks is already some smoothing (a box with a variance of
+    # (factor^2 - 1) / 12), so only smooth by the rest of sigma
+    remaining = math.sqrt(max(sigma**2 - (factor**2 - 1) / 12, 0)) / factor
+
+    if remaining == 0:
+        return decimated, factor
+
+    return gaussian_filter(decimated, remaining), factor
+
+
+def smooth(
+    data: npt.ArrayLike, sigma: float, downsample: bool = True
+) -> Tuple[npt.ArrayLike, int]:
+    """Smooth data with a gaussian of standard deviation sigma (in pixels).
+
+    The results are cached by the identity of data (and sigma), so contouring the same
+    data source on many images, or applying the same contours again, only smooths it
+    once.
+
+    When downsample is set and sigma is large, the data is decimated first and then
+    smoothed by a (much cheaper) smaller gaussian, giving a smaller result. Pixel
+    (i, j) of the result is centred on pixel (factor * i + (factor - 1) / 2, ...) of
+    data.
+
+    :param data: the data to smooth. Should be float[][].
+    :param sigma: the standard deviation of the gaussian
+    :param downsample: whether the result can be decimated
+
+    :return: a tuple of (the smoothed data, the factor it's decimated by)
+    """
+
+    key = (id(data), sigma, downsample)
+
+    if key in _cache:
+        ref, smoothed, factor = _cache[key]
+        # ids can be reused once the data is gone, so check it's the same data
+        if ref() is data:
+            _cache.move_to_end(key)
+            return smoothed, factor
+
+        del _cache[key]
+
+    smoothed, factor = smooth_uncached(data, sigma, downsample)
+    _cache[key] = (weakref.ref(data), smoothed, factor)
+    _evict()
+
+    return smoothed, factor
+
+
+def clear_cache():
+    _cache.clear()
+
+
+def forget(data: npt.ArrayLike):
+    """Drop the cached results for data, i.e. once it's been changed in place."""
+
+    for key in [key for key, (ref, *_rest) in _cache.items() if ref() is data]:
+        del _cache[key]
+
+
+def _evict():
+    size = sum(smoothed.nbytes for _ref, smoothed, _factor in _cache.values())
+
+    while len(_cache) > 1 and size > CACHE_BYTES:
+        _key, (_ref, smoothed, _factor) = _cache.popitem(last=False)
+        size -= smoothed.nbytes
@@ -0,0 +1,228 @@
+import hashlib
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+# Where downloaded surveys are kept between runs
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "emu-viewer", "hips")
+# The most (in bytes) the cache can hold before the least recently used are removed
+MAX_CACHE_BYTES = 2 * 1024**3
+# Once it's too large, the cache is trimmed to this fraction of its max_bytes, so
+#   that the directory isn't scanned again on the very next put
+EVICT_TO = 0.9
+
+# The payload and the information about it are stored as <key>.data and <key>.json
+DATA_SUFFIX = ".data"
+INFO_SUFFIX = ".json"
+
+
+@dataclass
+class CachedResponse:
+    """A response from the hips2fits service.
+
+    :param payload: the body of the response, i.e. the .fits/.png/.jpg file
+    :param headers: the (HTTP) headers of the response
+    """
+
+    payload: bytes
+    headers: Dict[str, str]
+
+
+def cache_key(params: Dict[str, Any]) -> str:
+    """The key of a query in the cache, a hash of all of its parameters.
+
+    The parameters are what's sent to hips2fits (see hips_handler.get_query), so they
+    include the survey, projection, centre and FOV or WCS, size and format - two
+    queries only share a key when they'd get the same image.
+    """
+
+    canonical = json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class HiPSCache:
+    """A cache of hips2fits responses on disk, bounded in size by removing the least
+    recently used.
+
+    The total size is kept as things are put in (the directory is only scanned for it
+    the first time), so putting something in doesn't look at the rest of the cache
+    unless it's gone over max_bytes.
+
+    Failing to read or write the cache (i.e. a read only or full disk) is ignored,
+    the survey is just downloaded again.
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = MAX_CACHE_BYTES):
+        """Construct a HiPSCache.
+
+        :param directory: the directory to keep the cache in, created if needed
+        :param max_bytes: the most bytes of payloads to keep
+        """
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+        # the total size of the payloads, None until it's needed, see _get_total
+        self._total: Optional[int] = None
+
+        # several surveys can be downloading at once
+        self._lock = threading.Lock()
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.directory, key + suffix)
+
+    def get(self, params: Dict[str, Any]) -> Optional[CachedResponse]:
+        """Get the cached response to a query.
+
+        :param params: the parameters of the query
+        :return: the response, or None if it isn't cached
+        """
+
+        key = cache_key(params)
+
+        with self._lock:
+            try:
+                with open(self._path(key, INFO_SUFFIX)) as f:
+                    info = json.load(f)
+
+                with open(self._path(key, DATA_SUFFIX), "rb") as f:
+                    payload = f.read()
+
+                # mark it as used, for eviction
+                os.utime(self._path(key, DATA_SUFFIX))
+            except (OSError, ValueError):
+                return None
+
+        # i.e. only part of it was written
+        if info.get("size") != len(payload):
+            return None
+
+        return CachedResponse(payload, info.get("headers", {}))
+
+    def put(self, params: Dict[str, Any], response: CachedResponse):
+        """Cache the response to a query, removing the least recently used responses
+        if the cache is now too large.
+
+        :param params: the parameters of the query
+        :param response: the response
+        """
+
+        key = cache_key(params)
+        info = json.dumps(
+            {
+                "params": params,
+                "headers": dict(response.headers),
+                "size": len(response.payload),
+            },
+            default=str,
+        )
+
+        with self._lock:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+
+                total = self._get_total()
+
+                # written to the side first, so a half written payload is never read
+                data_path = self._path(key, DATA_SUFFIX)
+                with open(data_path + ".tmp", "wb") as f:
+                    f.write(response.payload)
+
+                # replacing a response only adds the difference
+                try:
+                    total -= os.path.getsize(data_path)
+                except OSError:
+                    pass
+
+                os.replace(data_path + ".tmp", data_path)
+                self._total = total + len(response.payload)
+
+                with open(self._path(key, INFO_SUFFIX), "w") as f:
+                    f.write(info)
+            except OSError:
+                return
+
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _get_total(self) -> int:
+        if self._total is None:
+            self._total = self.size()
+
+        return self._total
+
+    def _evict(self):
+        """Remove the least recently used responses until the cache fits in
+        EVICT_TO of max_bytes."""
+
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(DATA_SUFFIX):
+                continue
+
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+
+            entries.append((stat.st_mtime_ns, stat.st_size, name[: -len(DATA_SUFFIX)]))
+
+        total = sum(size for _mtime, size, _key in entries)
+
+        for _mtime, size, key in sorted(entries):
+            if total <= EVICT_TO * self.max_bytes:
+                break
+
+            self._remove(key)
+            total -= size
+
+        self._total = total
+
+    def _remove(self, key: str):
+        for suffix in (INFO_SUFFIX, DATA_SUFFIX):
+            try:
+                os.remove(self._path(key, suffix))
+            except OSError:
+                pass
+
+    def size(self) -> int:
+        """The total size (in bytes) of the cached payloads."""
+
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return 0
+
+        return sum(
+            os.path.getsize(os.path.join(self.directory, name))
+            for name in names
+            if name.endswith(DATA_SUFFIX)
+        )
+
+    def clear(self):
+        with self._lock:
+            try:
+                names = os.listdir(self.directory)
+            except OSError:
+                return
+
+            for name in names:
+                if name.endswith(DATA_SUFFIX):
+                    self._remove(name[: -len(DATA_SUFFIX)])
+
+            self._total = None
+
+
+_cache: Optional[HiPSCache] = None
+
+
+def get_cache() -> HiPSCache:
+    """Get the cache shared by the whole viewer."""
+    global _cache
+
+    if _cache is None:
+        _cache = HiPSCache()
+
+    return _cache
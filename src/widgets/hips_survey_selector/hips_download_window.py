@@ -0,0 +1,120 @@
+import tkinter as tk
+from typing import TYPE_CHECKING, Optional
+
+import ttkbootstrap as tb
+
+from src.widgets.hips_survey_selector.hips_handler import HiPSDownload
+
+if TYPE_CHECKING:
+    from src.widgets.image.image_frame import ImageFrame
+
+# How often (ms) the progress is updated
+PROGRESS_INTERVAL = 100
+
+
+def format_bytes(size: int) -> str:
+    return f"{size / 1024**2:.1f} MB"
+
+
+class HiPSDownloadWindow(tk.Toplevel):
+    """A small window showing the progress of a survey downloading, with a button to
+    cancel it.
+
+    It doesn't block anything else, so several can be open at once. The download
+    itself runs in the background (see image_controller.open_hips), this just polls
+    the HiPSDownload it shares with it. It stays open until the download is done,
+    even once a coarse version of the survey is showing.
+    """
+
+    def __init__(self, root: tk.Misc, survey: str, download: HiPSDownload):
+        """Construct a HiPSDownloadWindow.
+
+        :param root: the widget to open the window over
+        :param survey: the name of the survey, for the title
+        :param download: the download to show the progress of
+        """
+
+        super().__init__(root)
+
+        self.download = download
+        # the image the survey is shown in, once a first version of it has been
+        # (see image_controller.open_hips)
+        self.image_frame: Optional["ImageFrame"] = None
+
+        self.title("Download")
+        self.resizable(False, False)
+        # closing the window is cancelling the download
+        self.protocol("WM_DELETE_WINDOW", self.cancel)
+
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+
+        frame = tb.Frame(self, bootstyle="light")
+        frame.grid(column=0, row=0, sticky=tk.NSEW)
+        frame.columnconfigure(0, weight=1)
+
+        title_label = tb.Label(
+            frame, text=f"Downloading {survey}", bootstyle="inverse-light"
+        )
+        title_label.grid(column=0, row=0, columnspan=2, sticky=tk.W, padx=10, pady=10)
+
+        self.progress = tb.Progressbar(
+            frame, length=300, mode="indeterminate", bootstyle="info-striped"
+        )
+        self.progress.grid(column=0, row=1, columnspan=2, sticky=tk.EW, padx=10)
+        self.progress.start()
+
+        self.progress_label = tb.Label(frame, text="", bootstyle="inverse-light")
+        self.progress_label.grid(column=0, row=2, sticky=tk.W, padx=10, pady=10)
+
+        self.cancel_button = tb.Button(
+            frame, text="Cancel", bootstyle="danger", command=self.cancel
+        )
+        self.cancel_button.grid(column=1, row=2, sticky=tk.E, padx=10, pady=10)
+
+        # see HiPSDownload.report, only shown once there's something to say
+        self.status_label = tb.Label(
+            frame, text="", wraplength=300, bootstyle="inverse-light"
+        )
+
+        self.after(PROGRESS_INTERVAL, self.update_progress)
+
+    def update_progress(self):
+        if not self.winfo_exists():
+            return
+
+        # once cancelled it just says so, see cancel
+        if not self.download.cancelled.is_set():
+            self.show_progress(self.download.done, self.download.total)
+            self.show_status(self.download.status)
+
+        self.after(PROGRESS_INTERVAL, self.update_progress)
+
+    def show_progress(self, done: int, total: Optional[int]):
+        if total is None:
+            self.progress_label["text"] = format_bytes(done)
+            return
+
+        if str(self.progress["mode"]) != "determinate":
+            self.progress.stop()
+            self.progress.configure(mode="determinate", maximum=max(total, 1))
+
+        self.progress["value"] = done
+        self.progress_label["text"] = f"{format_bytes(done)} of {format_bytes(total)}"
+
+    def show_status(self, status: Optional[str]):
+        if status is None or status == self.status_label["text"]:
+            return
+
+        self.status_label["text"] = status
+        self.status_label.grid(
+            column=0, row=3, columnspan=2, sticky=tk.W, padx=10, pady=(0, 10)
+        )
+
+    def cancel(self):
+        """Cancel the download. The window closes once it has stopped."""
+
+        self.download.cancel()
+
+        self.cancel_button.configure(state=tk.DISABLED)
+        self.progress_label["text"] = "Cancelling..."
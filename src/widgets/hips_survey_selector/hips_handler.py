@@ -1,12 +1,108 @@
+import io
+import json
+import queue
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
 from dataclasses import dataclass
-from typing import Optional
+from typing import Any, Callable, Dict, Optional, Tuple
 
 import astropy.units as u
+import numpy as np
+import numpy.typing as npt
 from astropy import wcs
 from astropy.coordinates import Angle, Latitude, Longitude
-from astroquery.hips2fits import hips2fits
+from astropy.io import fits
+from astroquery.hips2fits import conf, hips2fits
+from PIL import Image
 
 from src.enums import DataType
+from src.widgets.hips_survey_selector import hips_metadata, hips_tiles
+from src.widgets.hips_survey_selector.hips_cache import (
+    CachedResponse,
+    HiPSCache,
+    get_cache,
+)
+
+# How much (in bytes) of a download is read at once, between checking if it was
+#   cancelled and updating its progress
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# The size (in pixels) of a survey opened at a RA, Dec and FOV before it's matched to
+#   the screen, and the smallest and largest it can be matched to (see fit_size)
+DEFAULT_SIZE = 1000
+MIN_SIZE = 256
+MAX_SIZE = 4096
+# The size (in pixels) colour (png/jpg) surveys are opened at. They can't be
+#   downloaded again when zoomed in on (see hips_detail), so aren't matched to the
+#   screen
+COLOUR_SIZE = 2000
+
+
+class DownloadCancelled(Exception):
+    """Raised from a download which was cancelled, see HiPSDownload."""
+
+
+class HiPSDownload:
+    """The progress of a survey being downloaded, and a way to cancel it.
+
+    This is shared between the download (running in the background) and whatever is
+    showing its progress, so only holds plain values, a threading.Event and a
+    queue.Queue.
+    """
+
+    def __init__(self):
+        # bytes downloaded so far, and how many there are in total (None if unknown)
+        self.done = 0
+        self.total: Optional[int] = None
+
+        self.cancelled = threading.Event()
+
+        # what's happening beyond the progress, i.e. that it fell back to hips2fits.
+        # Shown by HiPSDownloadWindow, see report
+        self.status: Optional[str] = None
+
+        # (image_data, header) for each coarse version of the survey drawn before
+        # it's done, see open_tiles
+        self.layers: "queue.Queue[Tuple[npt.ArrayLike, Optional[fits.Header]]]" = (
+            queue.Queue()
+        )
+
+    def update(self, done: int, total: Optional[int]):
+        """Update the progress, raising DownloadCancelled if it was cancelled."""
+
+        self.done = done
+        self.total = total
+
+        if self.cancelled.is_set():
+            raise DownloadCancelled()
+
+    def cancel(self):
+        """Stop the download, the next time it reads anything."""
+        self.cancelled.set()
+
+    def report(self, status: str):
+        """Tell whoever is showing the progress something about the download."""
+        self.status = status
+
+    def get_layer(self) -> Optional[Tuple[npt.ArrayLike, Optional[fits.Header]]]:
+        """Get the latest coarse version of the survey that hasn't been got yet,
+        skipping over any before it.
+
+        :return: (image_data, header), or None if there hasn't been a new one
+        """
+
+        layer = None
+        while not self.layers.empty():
+            layer = self.layers.get_nowait()
+
+        return layer
+
+
+# Gets the response to a query (see get_query) from hips2fits, or something standing
+#   in for it, reporting the progress to the (optional) HiPSDownload
+HiPSService = Callable[[Dict[str, Any], Optional[HiPSDownload]], CachedResponse]
 
 
 @dataclass
@@ -19,44 +115,283 @@ class HiPsSurvey:
     projection: str = ""
     survey: str = ""
     data_type: Optional[DataType] = None
+    # the size of the image in pixels, when opened at the RA, Dec and FOV
+    width: int = DEFAULT_SIZE
+    height: int = DEFAULT_SIZE
 
 
-def open_hips(hips_survey: HiPsSurvey, wcs: Optional[wcs.WCS] = None):
-    """Opens a HiPs survey with specified options provided by the HiPsSurvey dataclass, currently only supports opening
-    a survey with the RA and DEC in degrees
+def fit_size(pixels: float) -> int:
+    """The size (in pixels) of a survey to show on that many pixels of the screen,
+    within MIN_SIZE and MAX_SIZE. There's no point downloading more than can be
+    shown, it's downloaded again at a finer resolution when zoomed in on (see
+    hips_detail)."""
+    return int(min(max(round(pixels), MIN_SIZE), MAX_SIZE))
+
+
+def get_query(hips_survey: HiPsSurvey, wcs: Optional[wcs.WCS] = None) -> Dict[str, Any]:
+    """Get the parameters of the hips2fits query for a survey.
 
     :param hips_survey: options for the survey
     :param wcs: optionally a wcs to open the hips from
-    :return: a tuple of image_data (numpy array in shape float[][]) and fits header if applicable
+    :return: the query parameters
     """
-    print("Opening HiPs survey...")
 
     if wcs is None:
-        result = hips2fits.query(
+        return hips2fits.query(
             hips=hips_survey.survey,
-            width=2000,
-            height=2000,
+            width=hips_survey.width,
+            height=hips_survey.height,
             ra=Longitude(hips_survey.ra * u.deg),
             dec=Latitude(hips_survey.dec * u.deg),
             fov=Angle(hips_survey.FOV * u.deg),
             projection=hips_survey.projection,
-            get_query_payload=False,
-            format=hips_survey.data_type.value,
-        )
-    else:
-        result = hips2fits.query_with_wcs(
-            hips=hips_survey.survey,
-            wcs=wcs,
-            get_query_payload=False,
+            get_query_payload=True,
             format=hips_survey.data_type.value,
         )
 
-    print("Done downloading HiPs survey - close message box if still open")
+    return hips2fits.query_with_wcs(
+        hips=hips_survey.survey,
+        wcs=wcs,
+        get_query_payload=True,
+        format=hips_survey.data_type.value,
+    )
 
-    if hips_survey.data_type == DataType.FITS:
-        hdu = result[0]
+
+def fetch_hips2fits(
+    params: Dict[str, Any],
+    download: Optional[HiPSDownload] = None,
+    server: Optional[str] = None,
+) -> CachedResponse:
+    """Get the response to a query from the hips2fits service.
+
+    The response is read in DOWNLOAD_CHUNK_SIZE pieces, so the progress can be shown
+    and the download can be cancelled part way through.
+
+    :param params: the query parameters, see get_query
+    :param download: to report the progress to, and check for cancelling
+    :param server: the url of the service, hips2fits by default
+    :return: the response
+    :raises AttributeError: if hips2fits couldn't make the image, like astroquery
+    :raises DownloadCancelled: if the download was cancelled
+    """
+
+    if download is None:
+        download = HiPSDownload()
+
+    url = f"{server or conf.server}?{urllib.parse.urlencode(params)}"
+
+    try:
+        with urllib.request.urlopen(url, timeout=conf.timeout) as response:
+            length = response.headers.get("Content-Length")
+            total = int(length) if length is not None and length.isdigit() else None
+
+            chunks = []
+            done = 0
+            download.update(done, total)
+
+            while chunk := response.read(DOWNLOAD_CHUNK_SIZE):
+                chunks.append(chunk)
+                done += len(chunk)
+                download.update(done, total)
+
+            return CachedResponse(b"".join(chunks), dict(response.headers))
+    except urllib.error.HTTPError as e:
+        # hips2fits explains what went wrong as {"title": ..., "description": ...}
+        try:
+            content = json.loads(e.read())
+            message = content["title"]
+            if "description" in content:
+                message += ": " + content["description"]
+        except (ValueError, KeyError, TypeError):
+            message = str(e)
+
+        raise AttributeError(message) from e
+
+
+def decode(payload: bytes, data_type: DataType):
+    """Decode a survey downloaded from hips2fits.
+
+    :param payload: the downloaded .fits/.png/.jpg file
+    :param data_type: the type of payload
+    :return: a tuple of image_data (numpy array in shape float[][]) and fits header if applicable
+    """
+
+    if data_type == DataType.FITS:
+        hdu = fits.HDUList.fromstring(payload)[0]
 
         # some files have (1, 1, x, y) or (x, y, 1, 1) shape so we use .squeeze
         return hdu.data.squeeze(), hdu.header
 
-    return result, None
+    return np.asarray(Image.open(io.BytesIO(payload))), None
+
+
+def get_wcs(hips_survey: HiPsSurvey) -> wcs.WCS:
+    """The WCS of the image of a survey opened at a RA, Dec and FOV, the same as
+    hips2fits would give it.
+
+    :param hips_survey: options for the survey
+    :return: the WCS, with its pixel_shape set
+    """
+
+    width, height = hips_survey.width, hips_survey.height
+
+    # the FOV is across the largest side
+    scale = hips_survey.FOV / max(width, height)
+
+    image_wcs = wcs.WCS(naxis=2)
+    image_wcs.wcs.ctype = [
+        f"RA---{hips_survey.projection}",
+        f"DEC--{hips_survey.projection}",
+    ]
+    image_wcs.wcs.crval = [hips_survey.ra, hips_survey.dec]
+    image_wcs.wcs.crpix = [width / 2 + 0.5, height / 2 + 0.5]
+    image_wcs.wcs.cdelt = [-scale, scale]
+    image_wcs.wcs.radesys = "ICRS"
+    image_wcs.pixel_shape = (width, height)
+
+    return image_wcs
+
+
+def get_target_wcs(hips_survey: HiPsSurvey, wcs: Optional[wcs.WCS] = None) -> wcs.WCS:
+    """The (celestial) WCS of the image a survey is opened as.
+
+    :param hips_survey: options for the survey
+    :param wcs: optionally a wcs to open the hips from, which needs its pixel_shape
+    :return: the WCS, with its pixel_shape set
+    """
+
+    if wcs is None:
+        return get_wcs(hips_survey)
+
+    image_wcs = wcs.celestial
+    image_wcs.pixel_shape = wcs.pixel_shape[:2]
+
+    return image_wcs
+
+
+def open_tiles(
+    hips_survey: HiPsSurvey,
+    wcs: Optional[wcs.WCS] = None,
+    cache: Optional[HiPSCache] = None,
+    download: Optional[HiPSDownload] = None,
+    progressive: bool = True,
+):
+    """Open a HiPs survey by drawing it from its tiles (see hips_tiles.stream_tiles).
+
+    If progressive, the coarser versions drawn on the way are put in download.layers,
+    so they can be shown while the rest is downloading.
+
+    :param hips_survey: options for the survey
+    :param wcs: optionally a wcs to open the hips from, which needs its pixel_shape
+    :param cache: the cache to use, None for the shared one
+    :param download: to report the progress of downloading to, and cancel it with
+    :param progressive: whether to draw coarser versions first, otherwise only the
+        tiles matching the resolution are downloaded
+    :return: a tuple of image_data (numpy array in shape float[][]) and fits header if applicable
+    :raises hips_tiles.NativeUnavailable: if the survey can't be read from its tiles
+    """
+
+    if cache is None:
+        cache = get_cache()
+    if download is None:
+        download = HiPSDownload()
+
+    image_wcs = get_target_wcs(hips_survey, wcs)
+    width, height = image_wcs.pixel_shape
+
+    header = None
+    if hips_survey.data_type == DataType.FITS:
+        header = image_wcs.to_header()
+
+    tiles = hips_tiles.stream_tiles(
+        hips_metadata.get_metadata(hips_survey.survey, cache),
+        image_wcs,
+        (height, width),
+        hips_survey.data_type,
+        cache,
+        download,
+        progressive,
+    )
+
+    for image, last in tiles:
+        # png/jpg images are shown with the first row at the top
+        image_data = np.flipud(image).copy() if header is None else image.copy()
+
+        if last:
+            return image_data, header
+
+        download.layers.put((image_data, header))
+
+
+def open_hips(
+    hips_survey: HiPsSurvey,
+    wcs: Optional[wcs.WCS] = None,
+    cache: Optional[HiPSCache] = None,
+    service: HiPSService = fetch_hips2fits,
+    download: Optional[HiPSDownload] = None,
+    native: bool = True,
+    progressive: bool = True,
+):
+    """Opens a HiPs survey with specified options provided by the HiPsSurvey dataclass, currently only supports opening
+    a survey with the RA and DEC in degrees
+
+    The survey is drawn from its tiles where it can be (see open_tiles), otherwise
+    it's downloaded as one image from hips2fits. Either way, what's downloaded is
+    cached on disk (see hips_cache), so opening the same survey at the same place
+    again doesn't download it again, and works offline.
+
+    :param hips_survey: options for the survey
+    :param wcs: optionally a wcs to open the hips from
+    :param cache: the cache to use, None for the shared one
+    :param service: what to download the survey with from hips2fits, hips2fits by default
+    :param download: to report the progress of downloading to, and cancel it with
+    :param native: whether to use the survey's own files: to check the request
+        against its metadata (see hips_metadata.validate), then to draw it from its
+        tiles
+    :param progressive: whether coarser versions are drawn first when drawing it from
+        its tiles, see open_tiles
+    :return: a tuple of image_data (numpy array in shape float[][]) and fits header if applicable
+    :raises hips_metadata.InvalidSurveyRequest: if the survey can't give what's asked
+    """
+
+    if cache is None:
+        cache = get_cache()
+    if download is None:
+        download = HiPSDownload()
+
+    if native:
+        try:
+            metadata = hips_metadata.get_metadata(hips_survey.survey, cache)
+        except hips_tiles.NativeUnavailable as e:
+            download.report(f"Downloading from hips2fits instead, {e}")
+        else:
+            if metadata.coverage_error is not None:
+                download.report(
+                    f"Couldn't read what the survey covers, so it isn't checked: "
+                    f"{metadata.coverage_error}"
+                )
+
+            # before anything of the survey itself is downloaded
+            hips_metadata.validate(
+                metadata, hips_survey, get_target_wcs(hips_survey, wcs)
+            )
+
+            try:
+                return open_tiles(hips_survey, wcs, cache, download, progressive)
+            except hips_tiles.NativeUnavailable as e:
+                download.report(f"Downloading from hips2fits instead, {e}")
+
+    params = get_query(hips_survey, wcs)
+    response = cache.get(params)
+
+    if response is None:
+        response = service(params, download)
+        cache.put(params, response)
+
+    image_data, header = decode(response.payload, hips_survey.data_type)
+
+    # i.e. the survey wasn't found to be checked, and only has colour tiles
+    if hips_survey.data_type == DataType.FITS and len(image_data.shape) > 2:
+        raise hips_metadata.InvalidSurveyRequest(hips_metadata.NO_FITS)
+
+    return image_data, header
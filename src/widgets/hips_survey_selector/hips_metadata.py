@@ -0,0 +1,199 @@
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+import numpy as np
+from astropy.wcs import WCS
+from astropy.wcs import utils as wcs_utils
+
+from src.enums import DataType
+from src.lib.moc import MOC
+from src.widgets.hips_survey_selector.hips_cache import HiPSCache, get_cache
+from src.widgets.hips_survey_selector.hips_tiles import (
+    TILE_FORMATS,
+    HiPSProperties,
+    NativeUnavailable,
+    TileSource,
+    pixel_coordinates,
+    read_cached,
+    resolve_survey,
+)
+
+if TYPE_CHECKING:
+    from src.widgets.hips_survey_selector.hips_handler import HiPsSurvey
+
+# The coverage map of a survey, see the HiPS standard
+MOC_FILE = "Moc.fits"
+# How many points (in each dimension) of an image are checked against the coverage
+COVERAGE_SAMPLES = 16
+
+NO_FITS = "This HiPs survey does not support FITS, please select png or jpeg instead"
+
+
+class InvalidSurveyRequest(Exception):
+    """Raised when a survey can't give what was asked of it, i.e. it has no FITS tiles
+    or doesn't cover the area. See validate."""
+
+
+@dataclass
+class SurveyMetadata:
+    """What's known about a survey without downloading any of the survey itself.
+
+    :param survey: the ID, url or directory of the survey
+    :param base: the url or directory the files of the survey are in
+    :param properties: the properties of the survey
+    :param coverage: the part of the sky the survey covers, None if it doesn't say
+    :param coverage_error: why the coverage couldn't be read, if it couldn't
+    """
+
+    survey: str
+    base: str
+    properties: HiPSProperties
+    coverage: Optional[MOC] = None
+    coverage_error: Optional[str] = None
+
+
+# the metadata of each survey that's been looked up, by (cache directory, survey)
+_metadata: Dict[Tuple[str, str], SurveyMetadata] = {}
+_lock = threading.Lock()
+
+
+def load_metadata(survey: str, cache: HiPSCache) -> SurveyMetadata:
+    """Look up the metadata of a survey. The files it's read from are cached (see
+    hips_tiles.read_cached), so this only goes to the network the first time.
+
+    :param survey: the ID, url or directory of the survey
+    :param cache: the cache to use
+    :raises NativeUnavailable: if the survey couldn't be found
+    """
+
+    source = TileSource(resolve_survey(survey, cache))
+
+    try:
+        properties_file = read_cached(source, cache, "properties")
+
+        if properties_file is None:
+            raise NativeUnavailable(f"{survey} has no properties")
+
+        properties = HiPSProperties.parse(properties_file.decode("utf-8", "replace"))
+
+        coverage = None
+        coverage_error = None
+        moc_file = read_cached(source, cache, MOC_FILE)
+        if moc_file is not None:
+            try:
+                coverage = MOC.from_fits(moc_file)
+            except (OSError, ValueError, IndexError, KeyError) as e:
+                # it's taken to cover everything, see covers
+                coverage_error = str(e)
+    except OSError as e:
+        raise NativeUnavailable(f"Couldn't read {survey}: {e}") from e
+    finally:
+        source.close()
+
+    return SurveyMetadata(survey, source.base, properties, coverage, coverage_error)
+
+
+def get_metadata(survey: str, cache: Optional[HiPSCache] = None) -> SurveyMetadata:
+    """Get the metadata of a survey, looking it up the first time (see load_metadata)
+    and keeping it in memory after.
+
+    :param survey: the ID, url or directory of the survey
+    :param cache: the cache to use, None for the shared one
+    :raises NativeUnavailable: if the survey couldn't be found
+    """
+
+    if cache is None:
+        cache = get_cache()
+
+    key = (cache.directory, survey)
+
+    with _lock:
+        if key in _metadata:
+            return _metadata[key]
+
+    metadata = load_metadata(survey, cache)
+
+    with _lock:
+        _metadata[key] = metadata
+
+    return metadata
+
+
+def try_get_metadata(
+    survey: str, cache: Optional[HiPSCache] = None
+) -> Optional[SurveyMetadata]:
+    """get_metadata, but None if the survey couldn't be found (it may still be
+    opened with hips2fits)."""
+
+    try:
+        return get_metadata(survey, cache)
+    except NativeUnavailable:
+        return None
+
+
+def peek_metadata(
+    survey: str, cache: Optional[HiPSCache] = None
+) -> Optional[SurveyMetadata]:
+    """Get the metadata of a survey only if it's already in memory, so this never
+    waits on anything.
+
+    :param survey: the ID, url or directory of the survey
+    :param cache: the cache it was looked up with, None for the shared one
+    """
+
+    if cache is None:
+        cache = get_cache()
+
+    with _lock:
+        return _metadata.get((cache.directory, survey))
+
+
+def clear_cache():
+    with _lock:
+        _metadata.clear()
+
+
+def covers(metadata: SurveyMetadata, image_wcs: WCS) -> bool:
+    """Whether a survey covers any of an image, from a grid of COVERAGE_SAMPLES points
+    over it (see MOC.overlaps). Surveys which don't say what they cover are taken to
+    cover everything.
+
+    :param metadata: the metadata of the survey
+    :param image_wcs: the (celestial) wcs of the image, with its pixel_shape
+    """
+
+    if metadata.coverage is None:
+        return True
+
+    cols, rows = image_wcs.pixel_shape[:2]
+    x, y = np.meshgrid(
+        np.linspace(-0.5, cols - 0.5, COVERAGE_SAMPLES),
+        np.linspace(-0.5, rows - 0.5, COVERAGE_SAMPLES),
+    )
+    lon, lat = pixel_coordinates(image_wcs, x, y, metadata.coverage.frame)
+
+    scale_x, scale_y = wcs_utils.proj_plane_pixel_scales(image_wcs)
+    spacing = max(scale_x * cols, scale_y * rows) / (COVERAGE_SAMPLES - 1)
+
+    return metadata.coverage.overlaps(lon, lat, spacing)
+
+
+def validate(metadata: SurveyMetadata, hips_survey: "HiPsSurvey", image_wcs: WCS):
+    """Check a survey can give what's asked of it, before downloading any of it.
+
+    :param metadata: the metadata of the survey
+    :param hips_survey: options for the survey
+    :param image_wcs: the (celestial) wcs of the image to open it at, with its
+        pixel_shape
+    :raises InvalidSurveyRequest: if it can't
+    """
+
+    # hips2fits would make a FITS file from the colour tiles, with a channel each.
+    # Colour images can always be made, from whichever tiles there are
+    if hips_survey.data_type == DataType.FITS:
+        if TILE_FORMATS[DataType.FITS][1] not in metadata.properties.formats:
+            raise InvalidSurveyRequest(NO_FITS)
+
+    if not covers(metadata, image_wcs):
+        raise InvalidSurveyRequest(f"{hips_survey.survey} doesn't cover this area")
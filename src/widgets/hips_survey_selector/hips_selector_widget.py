@@ -1,5 +1,4 @@
 import tkinter as tk
-import traceback
 from functools import partial
 
 import ttkbootstrap as tb
@@ -7,8 +6,11 @@ import ttkbootstrap.dialogs as dialogs
 
 import src.widgets.image.image_controller as ic
 from src.enums import DataType
+from src.lib import background
 from src.widgets.base_widget import BaseWidget
+from src.widgets.hips_survey_selector import hips_metadata
 from src.widgets.hips_survey_selector.hips_handler import HiPsSurvey
+from src.widgets.image import fits_handler
 
 # All projection options available, can be edited to add more
 projection_options = ["TAN", "ARC", "AIT", "SIN"]
@@ -59,7 +61,6 @@ INVALID_RA = "Invalid RA, please enter a float"
 INVALID_DEC = "Invalid Dec, please enter a float"
 INVALID_FOV = "Invalid FOV, please enter a float"
 INVALID_FOV_LOW = "Invalid FOV, FOV must be greater then 0"
-ERROR_GENERATING = "Error generating image, either incorrect survey has been entered or selected image is to large"
 
 # Forced column widths for the dropdowns so that the dropdown box doesn't resize when selecting a dropdown option
 COL_WIDTHS = [37, 23]
@@ -87,7 +88,7 @@ class HiPsSelectorWidget(BaseWidget):
         self.selected_projection = None
         self.selected_hips_survey = None
         self.selected_data_type = None
-        self.selected_wcs = None
+        self.selected_image = None
 
         self.hips_survey = HiPsSurvey()
 
@@ -261,6 +262,15 @@ class HiPsSelectorWidget(BaseWidget):
         self.selected_hips_survey = hips_survey
         dropdown["text"] = hips_survey
 
+        # look it up now, so opening it can be checked without waiting (see
+        # image_controller.open_hips)
+        background.run_in_background(
+            self,
+            hips_metadata.try_get_metadata,
+            hips_survey,
+            pool=background.get_io_pool(),
+        )
+
     def clear_survey_options(self):
         """Resets all survey options to default"""
         self.optical_dropdown["text"] = NO_SURVEY_SELECTED
@@ -278,13 +288,13 @@ class HiPsSelectorWidget(BaseWidget):
         """Determines whether to set the RA,DEC and FOV to a selected images values or not by disabling the
         corresponding entry boxes if an image is selected"""
         if image is None:
-            self.selected_wcs = None
+            self.selected_image = None
             dropdown["text"] = NO_IMAGE_SELECTED
             self.ra_entry.configure(state="enabled")
             self.dec_entry.configure(state="enabled")
             self.FOV_entry.configure(state="enabled")
         else:
-            self.selected_wcs = image.image_wcs
+            self.selected_image = image
             dropdown["text"] = image.file_name
             self.ra_entry.configure(state="disabled")
             self.dec_entry.configure(state="disabled")
@@ -349,7 +359,7 @@ class HiPsSelectorWidget(BaseWidget):
         self.selected_projection = None
         self.selected_hips_survey = None
         self.selected_data_type = None
-        self.selected_wcs = None
+        self.selected_image = None
 
         self.clear_survey_options()
         self.data_type_dropdown["text"] = NO_DATA_TYPE_SELECTED
@@ -380,7 +390,7 @@ class HiPsSelectorWidget(BaseWidget):
             return
         self.hips_survey.projection = self.selected_projection
 
-        if self.selected_wcs is None:
+        if self.selected_image is None:
             self.hips_survey.ra = self.float_validation(
                 self.ra_entry, INVALID_INPUT, INVALID_RA
             )
@@ -403,12 +413,15 @@ class HiPsSelectorWidget(BaseWidget):
                 self.validation_error(INVALID_INPUT, INVALID_FOV_LOW)
                 return
 
-        try:
-            ic.open_hips(self, self.hips_survey, self.selected_wcs)
-        except AttributeError as e:
-            traceback.print_exc()
-            self.validation_error("Error", ERROR_GENERATING)
-            return
+        image_wcs = None
+        if self.selected_image is not None:
+            # only what's in view of the image, at the resolution it's shown at
+            image_wcs, _extent = fits_handler.get_view_wcs(
+                self.selected_image.fig, self.selected_image.image_wcs
+            )
+
+        # this downloads in the background, any errors are shown once it fails
+        ic.open_hips(self, self.hips_survey, image_wcs)
 
     def validation_error(self, title, error):
         """
@@ -0,0 +1,515 @@
+import http.client
+import io
+import json
+import math
+import os
+import queue
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from dataclasses import dataclass, field
+from functools import partial
+from multiprocessing.pool import ThreadPool
+from typing import TYPE_CHECKING, Iterator, List, Optional, Tuple
+
+import numpy as np
+import numpy.typing as npt
+from astropy import units as u
+from astropy.io import fits
+from astropy.wcs import WCS
+from astropy.wcs import utils as wcs_utils
+from PIL import Image
+
+from src.enums import DataType
+from src.lib import healpix
+from src.widgets.hips_survey_selector.hips_cache import CachedResponse, HiPSCache
+
+if TYPE_CHECKING:
+    from src.widgets.hips_survey_selector.hips_handler import HiPSDownload
+    from src.widgets.hips_survey_selector.hips_metadata import SurveyMetadata
+
+# Where to look up the url of a survey from its ID (i.e. CDS/P/DSS2/red)
+MOCSERVER_URL = "https://alasky.cds.unistra.fr/MocServer/query"
+# How long (in seconds) to wait on the server before giving up
+TIMEOUT = 30
+# How many tiles are downloaded at once, each over its own kept-alive connection
+CONNECTIONS = 6
+# How many orders are drawn on the way to the one matching the resolution of the
+#   image, each with a quarter of the tiles of the next
+PROGRESSIVE_ORDERS = 3
+
+# the extension of the tiles for each data type, and what it's called in properties
+TILE_FORMATS = {
+    DataType.FITS: ("fits", "fits"),
+    DataType.PNG: ("png", "png"),
+    DataType.JPG: ("jpg", "jpeg"),
+}
+
+# hips_frame -> the astropy frame
+FRAMES = {
+    "equatorial": "icrs",
+    "galactic": "galactic",
+    "ecliptic": "barycentrictrueecliptic",
+}
+
+
+class NativeUnavailable(Exception):
+    """Raised when a survey can't be read tile by tile, i.e. it couldn't be found or
+    doesn't have tiles in the format wanted. hips2fits may still be able to make it."""
+
+
+@dataclass
+class HiPSProperties:
+    """The properties of a HiPS survey (from its properties file) needed to read it.
+
+    :param max_order: the deepest order of tiles
+    :param min_order: the shallowest order of tiles
+    :param tile_width: the width (and height) of each tile, in pixels
+    :param formats: the formats the tiles are available in (i.e. fits, png, jpeg)
+    :param frame: the frame of the survey, see FRAMES
+    """
+
+    max_order: int
+    min_order: int = 0
+    tile_width: int = 512
+    formats: List[str] = field(default_factory=lambda: ["jpeg"])
+    frame: str = "equatorial"
+
+    @classmethod
+    def parse(cls, text: str) -> "HiPSProperties":
+        """Parse the properties file of a survey.
+
+        :raises NativeUnavailable: if it doesn't say the max order of the tiles
+        """
+
+        values = {}
+        for line in text.splitlines():
+            line = line.strip()
+            if line.startswith("#") or "=" not in line:
+                continue
+
+            key, value = line.split("=", 1)
+            values[key.strip()] = value.strip()
+
+        try:
+            return cls(
+                max_order=int(values["hips_order"]),
+                min_order=int(values.get("hips_order_min", 0)),
+                tile_width=int(values.get("hips_tile_width", 512)),
+                formats=values.get("hips_tile_format", "jpeg").split(),
+                frame=values.get("hips_frame", "equatorial"),
+            )
+        except (KeyError, ValueError) as e:
+            raise NativeUnavailable(f"Invalid properties: {e}") from e
+
+
+class TileSource:
+    """Reads the files of a HiPS survey, from a local directory or over HTTP.
+
+    Over HTTP, connections are kept alive and reused between requests (one per thread
+    reading at once), so each tile doesn't need a new connection.
+    """
+
+    def __init__(self, base: str):
+        """Construct a TileSource.
+
+        :param base: the url or directory the survey is in
+        """
+
+        self.base = base.rstrip("/")
+
+        url = urllib.parse.urlsplit(self.base)
+        self.local = url.scheme not in ("http", "https")
+        self.url = url
+
+        # connections which aren't being used right now
+        self._idle: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue()
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self.url.scheme == "https":
+            return http.client.HTTPSConnection(self.url.netloc, timeout=TIMEOUT)
+
+        return http.client.HTTPConnection(self.url.netloc, timeout=TIMEOUT)
+
+    def read(self, path: str) -> Optional[bytes]:
+        """Read a file of the survey.
+
+        :param path: the path of the file, relative to the survey
+        :return: the contents of the file, or None if it doesn't exist
+        """
+
+        if self.local:
+            try:
+                with open(os.path.join(self.base, path), "rb") as f:
+                    return f.read()
+            except FileNotFoundError:
+                return None
+
+        try:
+            connection = self._idle.get_nowait()
+        except queue.Empty:
+            connection = self._connect()
+
+        # a kept-alive connection can have been closed by the server since, so it's
+        # tried again on a new one once
+        for attempt in range(2):
+            try:
+                connection.request("GET", f"{self.url.path}/{path}")
+                response = connection.getresponse()
+                body = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                connection.close()
+                if attempt == 1:
+                    raise
+
+                connection = self._connect()
+
+        self._idle.put(connection)
+
+        if response.status == 404:
+            return None
+
+        if response.status != 200:
+            raise OSError(f"{response.status} {response.reason} reading {path}")
+
+        return body
+
+    def close(self):
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+
+
+def resolve_survey(survey: str, cache: HiPSCache) -> str:
+    """Find where the tiles of a survey are.
+
+    :param survey: the ID of the survey (looked up on the MocServer), or a url or
+        directory of a survey
+    :param cache: to keep the answer in, so this works offline after the first time
+    :return: the url or directory of the survey
+    :raises NativeUnavailable: if it couldn't be found
+    """
+
+    if os.path.isdir(survey) or survey.startswith(("http://", "https://")):
+        return survey
+
+    params = {"mocserver": survey}
+    response = cache.get(params)
+    cached = response is not None
+
+    if not cached:
+        query = urllib.parse.urlencode(
+            {"ID": survey, "get": "record", "fmt": "json", "fields": "hips_service_url"}
+        )
+
+        try:
+            with urllib.request.urlopen(
+                f"{MOCSERVER_URL}?{query}", timeout=TIMEOUT
+            ) as r:
+                response = CachedResponse(r.read(), dict(r.headers))
+        except (urllib.error.URLError, OSError) as e:
+            raise NativeUnavailable(f"Couldn't look up {survey}: {e}") from e
+
+    try:
+        url = json.loads(response.payload)[0]["hips_service_url"]
+    except (ValueError, LookupError, TypeError) as e:
+        raise NativeUnavailable(f"{survey} isn't a known survey") from e
+
+    if not cached:
+        cache.put(params, response)
+
+    return url
+
+
+def read_cached(source: TileSource, cache: HiPSCache, path: str) -> Optional[bytes]:
+    """Read a file of a survey (see TileSource.read), from the cache if it's in it.
+
+    Files of local surveys aren't cached, they're already on disk. Files which don't
+    exist are cached as empty, so they aren't asked for again.
+    """
+
+    if source.local:
+        return source.read(path)
+
+    params = {"hips": source.base, "file": path}
+    response = cache.get(params)
+
+    if response is None:
+        payload = source.read(path)
+        response = CachedResponse(b"" if payload is None else payload, {})
+        cache.put(params, response)
+
+    return response.payload or None
+
+
+def tile_path(order: int, npix: int, extension: str) -> str:
+    """The path of a tile within a survey, see the HiPS standard."""
+    return f"Norder{order}/Dir{(npix // 10000) * 10000}/Npix{npix}.{extension}"
+
+
+def decode_tile(payload: bytes, data_type: DataType) -> npt.ArrayLike:
+    """Decode a tile, in the orientation of a FITS tile (the first row is the bottom).
+
+    :return: float[][] for FITS, otherwise uint8[][][channels]
+    """
+
+    if data_type == DataType.FITS:
+        hdu = fits.HDUList.fromstring(payload)[0]
+        data = hdu.data.squeeze()
+
+        if data.dtype.kind in "iu":
+            blank = hdu.header.get("BLANK")
+            data = data.astype(np.float32)
+            if blank is not None:
+                data[data == blank] = np.nan
+
+        return data
+
+    image = Image.open(io.BytesIO(payload))
+    image = image.convert("RGBA" if data_type == DataType.PNG else "RGB")
+
+    return np.flipud(np.asarray(image))
+
+
+def get_order(image_wcs: WCS, properties: HiPSProperties) -> int:
+    """The order of tiles whose pixels are (just) smaller than those of an image."""
+
+    pixel_scale = np.mean(wcs_utils.proj_plane_pixel_scales(image_wcs))
+    tile_bits = int(math.log2(properties.tile_width))
+
+    # the pixels of order k tiles are those of HEALPix at nside 2^(k + tile_bits)
+    nside = healpix.pixel_size(1) / pixel_scale
+    order = math.ceil(math.log2(max(nside, 1))) - tile_bits
+
+    return int(np.clip(order, properties.min_order, properties.max_order))
+
+
+def world_coordinates(
+    image_wcs: WCS, shape: Tuple[int, int], frame: str
+) -> Tuple[npt.ArrayLike, npt.ArrayLike]:
+    """The co-ordinates of the centre of every pixel of an image, in the frame of a
+    survey.
+
+    :return: a tuple of (lon, lat), each float[rows][cols] in degrees. NaN outside of
+        the projection.
+    """
+
+    rows, cols = shape
+    x, y = np.meshgrid(np.arange(cols), np.arange(rows))
+
+    return pixel_coordinates(image_wcs, x, y, frame)
+
+
+def pixel_coordinates(
+    image_wcs: WCS, x: npt.ArrayLike, y: npt.ArrayLike, frame: str
+) -> Tuple[npt.ArrayLike, npt.ArrayLike]:
+    """The co-ordinates of pixels of an image, in the frame of a survey.
+
+    :param image_wcs: the (celestial) wcs of the image
+    :param x: the x of each pixel, 0-based
+    :param y: the y of each pixel
+    :param frame: the frame of the survey, see FRAMES
+
+    :return: a tuple of (lon, lat) in degrees, NaN outside of the projection
+    """
+
+    wcs_frame = wcs_utils.wcs_to_celestial_frame(image_wcs).name
+    survey_frame = FRAMES.get(frame)
+    if survey_frame is None:
+        raise NativeUnavailable(f"Unsupported frame {frame}")
+
+    with np.errstate(invalid="ignore"):
+        if wcs_frame in ("icrs", "fk5") and survey_frame == "icrs":
+            # close enough that converting isn't worth it
+            return image_wcs.wcs_pix2world(x, y, 0)
+
+        coords = image_wcs.pixel_to_world(x, y).transform_to(survey_frame)
+        coords = coords.spherical
+
+    return coords.lon.to_value(u.deg), coords.lat.to_value(u.deg)
+
+
+@dataclass
+class TileLookup:
+    """Which tile, and which pixel of it, each pixel of an image is drawn from.
+
+    :param tiles: the index of every tile needed
+    :param starts: where the pixels of each tile start in pixels
+    :param pixels: the (flat) index of each pixel of the image, grouped by tile
+    :param rows: the row of each pixel within its tile
+    :param cols: the column of each pixel within its tile
+    """
+
+    tiles: npt.ArrayLike
+    starts: npt.ArrayLike
+    pixels: npt.ArrayLike
+    rows: npt.ArrayLike
+    cols: npt.ArrayLike
+
+    def get(self, i: int) -> Tuple[npt.ArrayLike, npt.ArrayLike, npt.ArrayLike]:
+        """The pixels of the image in tile i, and where they are in it."""
+        span = slice(self.starts[i], self.starts[i + 1])
+        return self.pixels[span], self.rows[span], self.cols[span]
+
+
+def lookup_tiles(
+    lon: npt.ArrayLike, lat: npt.ArrayLike, order: int, tile_width: int
+) -> TileLookup:
+    """Find the tiles of an order which the pixels of an image are drawn from.
+
+    :param lon: the longitude of each pixel of the image, see world_coordinates
+    :param lat: the latitude of each pixel of the image
+    :param order: the order of the tiles
+    :param tile_width: the width of the tiles
+    """
+
+    tile_bits = int(math.log2(tile_width))
+
+    valid = np.flatnonzero(np.isfinite(lon) & np.isfinite(lat))
+    x, y, face = healpix.ang2xyf(
+        2 ** (order + tile_bits), lon.flat[valid], lat.flat[valid]
+    )
+
+    # the tile is the HEALPix pixel at order, the pixel within it the remaining bits
+    npix = face * 4**order + healpix.interleave(x >> tile_bits, y >> tile_bits)
+    x &= tile_width - 1
+    y &= tile_width - 1
+
+    by_tile = np.argsort(npix, kind="stable")
+    tiles, starts = np.unique(npix[by_tile], return_index=True)
+
+    # in a FITS tile, x runs down the rows and y along the columns
+    return TileLookup(
+        tiles,
+        np.append(starts, len(by_tile)),
+        valid[by_tile],
+        tile_width - 1 - x[by_tile],
+        y[by_tile],
+    )
+
+
+class TileReader:
+    """Reads and decodes the tiles of a survey, from the cache if they're in it.
+
+    This is called from several threads at once, see stream_tiles.
+    """
+
+    def __init__(
+        self,
+        source: TileSource,
+        cache: HiPSCache,
+        data_type: DataType,
+        download: "HiPSDownload",
+    ):
+        self.source = source
+        self.cache = cache
+        self.data_type = data_type
+        self.extension = TILE_FORMATS[data_type][0]
+        self.download = download
+
+        # bytes read so far, across all threads
+        self.done = 0
+        self._lock = threading.Lock()
+
+    def read(self, order: int, npix: int) -> Tuple[int, Optional[npt.ArrayLike]]:
+        """Read a tile, returning (npix, the tile), None if it doesn't exist. See
+        decode_tile."""
+
+        payload = read_cached(
+            self.source, self.cache, tile_path(order, npix, self.extension)
+        )
+
+        with self._lock:
+            self.done += len(payload or b"")
+            self.download.update(self.done, None)
+
+        if payload is None:
+            return npix, None
+
+        return npix, decode_tile(payload, self.data_type)
+
+
+def stream_tiles(
+    metadata: "SurveyMetadata",
+    image_wcs: WCS,
+    shape: Tuple[int, int],
+    data_type: DataType,
+    cache: HiPSCache,
+    download: "HiPSDownload",
+    progressive: bool = True,
+) -> Iterator[Tuple[npt.ArrayLike, bool]]:
+    """Draw an image from the tiles of a survey, coarse to fine.
+
+    The image is drawn from the tiles of the order matching its resolution (see
+    get_order), first (if progressive) from a couple of coarser orders with fewer
+    tiles so something can be shown quickly. Each order is drawn over the last, so
+    tiles missing from a finer order are left as they were.
+
+    :param metadata: the metadata of the survey, see hips_metadata.get_metadata
+    :param image_wcs: the (celestial) wcs of the image to draw
+    :param shape: the shape of the image, (rows, columns)
+    :param data_type: the type of tiles to draw the image from
+    :param cache: to cache the tiles in
+    :param download: to report progress to, and cancel with
+    :param progressive: whether to draw the coarser orders first, otherwise only the
+        matching order is read
+
+    :return: an iterator of (image, whether it's the last) for each order. The image
+        is float[][] for FITS and uint8[][][channels] otherwise, in FITS orientation.
+        It's the same array each time, drawn over for the next order, so only hold
+        on to a copy of it.
+    :raises NativeUnavailable: if the survey doesn't have tiles of data_type
+    """
+
+    properties = metadata.properties
+
+    if TILE_FORMATS[data_type][1] not in properties.formats:
+        raise NativeUnavailable(f"{metadata.survey} has no {data_type.value} tiles")
+
+    lon, lat = world_coordinates(image_wcs, shape, properties.frame)
+
+    target = get_order(image_wcs, properties)
+    first = target
+    if progressive:
+        first = max(properties.min_order, target - PROGRESSIVE_ORDERS + 1)
+
+    if data_type == DataType.FITS:
+        image = np.full(shape, np.nan, dtype=np.float32)
+    else:
+        channels = 4 if data_type == DataType.PNG else 3
+        image = np.zeros((*shape, channels), dtype=np.uint8)
+    flat = image.reshape(shape[0] * shape[1], *image.shape[2:])
+
+    # the tiles outside the coverage don't exist, so needn't be asked for. The
+    # coverage can be in a different frame to the tiles, then it can't tell
+    coverage = metadata.coverage
+    if coverage is not None and coverage.frame != properties.frame:
+        coverage = None
+
+    source = TileSource(metadata.base)
+    reader = TileReader(source, cache, data_type, download)
+
+    try:
+        with ThreadPool(CONNECTIONS) as pool:
+            for order in range(first, target + 1):
+                lookup = lookup_tiles(lon, lat, order, properties.tile_width)
+                index = {npix: i for i, npix in enumerate(lookup.tiles.tolist())}
+
+                wanted = lookup.tiles
+                if coverage is not None:
+                    wanted = wanted[coverage.contains_cells(wanted, order)]
+
+                tiles = pool.imap_unordered(
+                    partial(reader.read, order), wanted.tolist()
+                )
+                for npix, tile in tiles:
+                    if tile is None:
+                        continue
+
+                    pixels, rows, cols = lookup.get(index[npix])
+                    flat[pixels] = tile[rows, cols]
+
+                yield image, order == target
+    finally:
+        source.close()
@@ -0,0 +1,278 @@
+from typing import Optional
+
+import numpy as np
+import numpy.typing as npt
+from matplotlib.axes import Axes
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
+from matplotlib.text import Text
+
+from src.lib import geometry
+from src.lib.blit_manager import BlitManager
+from src.lib.spatial_index import Bounds, GridIndex
+
+# How many vertices a stroke's buffer starts with, it doubles whenever it fills up
+INITIAL_CAPACITY = 256
+# How far (in screen pixels) a simplified stroke can stray from what was drawn
+SIMPLIFY_TOLERANCE = 0.5
+# The size (in screen pixels, when the annotations are created) of the cells of the
+#   spatial index the strokes and texts are kept in
+CELL_SIZE = 32
+
+
+class Stroke:
+    """A freehand line drawn with the line tool, as a growing buffer of vertices."""
+
+    def __init__(self, colour: str, width: float, capacity: int = INITIAL_CAPACITY):
+        """Construct an empty Stroke.
+
+        :param colour: the colour of the line
+        :param width: the width of the line, in points
+        :param capacity: how many vertices to make room for up front
+        """
+        self.colour = colour
+        self.width = width
+
+        self._buffer = np.empty((capacity, 2), dtype=np.float64)
+        self._length = 0
+
+    @classmethod
+    def from_vertices(
+        cls, vertices: npt.ArrayLike, colour: str, width: float
+    ) -> "Stroke":
+        stroke = cls(colour, width, capacity=len(vertices))
+        stroke._buffer[:] = vertices
+        stroke._length = len(vertices)
+        return stroke
+
+    @property
+    def vertices(self) -> npt.ArrayLike:
+        """The vertices of the stroke, as float[n][2]. This is a view of the buffer."""
+        return self._buffer[: self._length]
+
+    def append(self, x: float, y: float):
+        if self._length == len(self._buffer):
+            self._buffer = np.concatenate([self._buffer, np.empty_like(self._buffer)])
+
+        self._buffer[self._length] = x, y
+        self._length += 1
+
+    def simplify(self, tolerance: float):
+        """Drop the vertices which don't change the shape of the stroke by more than
+        tolerance (see geometry.simplify)."""
+        vertices = geometry.simplify(self.vertices, tolerance)
+
+        self._buffer = vertices
+        self._length = len(vertices)
+
+
+class Annotations:
+    """The lines and text drawn with the line and text tools on an axes.
+
+    All of the finished strokes are drawn as one LineCollection, and the stroke being
+    drawn as one Line2D which grows as the mouse moves. This way drawing and erasing
+    cost a numpy operation per stroke, rather than an artist per mouse movement.
+
+    The strokes and texts are kept in spatial indexes, so the eraser only has to look
+    at those near it. Strokes are indexed in data co-ordinates, so don't change as the
+    view does, but the size of text is in points so the texts are re-indexed (the
+    next time they're erased) whenever the view changes.
+    """
+
+    def __init__(self, ax: Axes, blit_manager: BlitManager):
+        """Construct Annotations.
+
+        :param ax: the axes to draw on
+        :param blit_manager: the lines are drawn as overlays through this
+        """
+        self.ax = ax
+        self.blit_manager = blit_manager
+
+        self.strokes: list[Stroke] = []
+        self.active: Optional[Stroke] = None
+        self.stroke_index = GridIndex(CELL_SIZE * self._data_per_pixel())
+
+        self.texts: list[Text] = []
+        # built when it's needed, see _get_text_index
+        self.text_index: Optional[GridIndex] = None
+        self._text_bounds: dict[Text, Bounds] = {}
+
+        self.ax.callbacks.connect("xlim_changed", self._invalidate_text_index)
+        self.ax.callbacks.connect("ylim_changed", self._invalidate_text_index)
+
+        self.collection = LineCollection([], capstyle="round", joinstyle="round")
+        self.ax.add_collection(self.collection, autolim=False)
+        self.blit_manager.add_artist(self.collection)
+
+        self.active_line = Line2D(
+            [], [], solid_capstyle="round", solid_joinstyle="round"
+        )
+        self.ax.add_line(self.active_line)
+        self.blit_manager.add_artist(self.active_line)
+
+    def start_stroke(self, x: float, y: float, colour: str, width: float):
+        """Start drawing a new stroke at (x, y), in data co-ordinates."""
+        self.active = Stroke(colour, width)
+        self.active.append(x, y)
+
+        self.active_line.set_color(colour)
+        self.active_line.set_linewidth(width)
+
+    def extend_stroke(self, x: float, y: float):
+        """Add (x, y) to the stroke being drawn."""
+        if self.active is None:
+            return
+
+        self.active.append(x, y)
+        self.active_line.set_data(*self.active.vertices.T)
+
+    def finish_stroke(self):
+        """Finish the stroke being drawn, simplifying it and moving it to the collection."""
+        if self.active is None:
+            return
+
+        stroke, self.active = self.active, None
+        self.active_line.set_data([], [])
+
+        if len(stroke.vertices) < 2:
+            return
+
+        stroke.simplify(SIMPLIFY_TOLERANCE * self._data_per_pixel())
+        self._add_strokes([stroke])
+        self.update_collection()
+
+    def add_text(self, x: float, y: float, text: str, size: float, colour: str):
+        """Write text at (x, y), in data co-ordinates.
+
+        :param x: the x of the text
+        :param y: the y of the text
+        :param text: the text to write
+        :param size: the font size of the text
+        :param colour: the colour of the text
+        """
+        artist = self.ax.text(x, y, text, fontsize=size, color=colour)
+        self.blit_manager.add_artist(artist)
+
+        self.texts.append(artist)
+        self._invalidate_text_index()
+
+    def erase(self, x: float, y: float, radius: float) -> bool:
+        """Erase the parts of strokes within radius of (x, y), and any text under it.
+
+        A stroke that's erased through the middle is split in two, like an eraser.
+
+        :param x: the x of the eraser, in data co-ordinates
+        :param y: the y of the eraser, in data co-ordinates
+        :param radius: the radius of the eraser, in screen pixels
+
+        :return: whether anything was erased
+        """
+        erased_strokes = self._erase_strokes(x, y, radius * self._data_per_pixel())
+        erased_texts = self._erase_texts(x, y)
+
+        return erased_strokes or erased_texts
+
+    def _erase_strokes(self, x: float, y: float, radius: float) -> bool:
+        nearby = self.stroke_index.query(
+            (x - radius, y - radius, x + radius, y + radius)
+        )
+
+        erased = set()
+        pieces = []
+
+        for stroke in nearby:
+            hit = geometry.segment_distances(stroke.vertices, x, y) <= radius
+            if hit.any():
+                erased.add(stroke)
+                pieces.extend(_split_stroke(stroke, hit))
+
+        if len(erased) == 0:
+            return False
+
+        for stroke in erased:
+            self.stroke_index.remove(stroke)
+
+        self.strokes = [stroke for stroke in self.strokes if stroke not in erased]
+        self._add_strokes(pieces)
+        self.update_collection()
+
+        return True
+
+    def _erase_texts(self, x: float, y: float) -> bool:
+        if len(self.texts) == 0:
+            return False
+
+        index = self._get_text_index()
+
+        erased = set()
+        for text in index.query((x, y, x, y)):
+            x0, y0, x1, y1 = self._text_bounds[text]
+            if x0 <= x <= x1 and y0 <= y <= y1:
+                erased.add(text)
+
+        for text in erased:
+            text.remove()
+            index.remove(text)
+            del self._text_bounds[text]
+
+        self.texts = [text for text in self.texts if text not in erased]
+
+        return len(erased) > 0
+
+    def _add_strokes(self, strokes: list[Stroke]):
+        for stroke in strokes:
+            self.strokes.append(stroke)
+            self.stroke_index.insert_polyline(stroke, stroke.vertices)
+
+    def _get_text_index(self) -> GridIndex:
+        """Get the index of the texts, (re)building it if the view has changed."""
+        if self.text_index is not None:
+            return self.text_index
+
+        renderer = self.ax.figure.canvas.get_renderer()
+        to_data = self.ax.transData.inverted()
+
+        self.text_index = GridIndex(CELL_SIZE * self._data_per_pixel())
+        self._text_bounds = {}
+
+        for text in self.texts:
+            (x0, y0), (x1, y1) = to_data.transform(
+                text.get_window_extent(renderer).get_points()
+            )
+            bounds = (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+
+            self._text_bounds[text] = bounds
+            self.text_index.insert(text, bounds)
+
+        return self.text_index
+
+    def _invalidate_text_index(self, *_args):
+        self.text_index = None
+
+    def update_collection(self):
+        self.collection.set_segments([stroke.vertices for stroke in self.strokes])
+        self.collection.set_colors([stroke.colour for stroke in self.strokes])
+        self.collection.set_linewidths([stroke.width for stroke in self.strokes])
+
+    def _data_per_pixel(self) -> float:
+        (x0, y0), (x1, y1) = self.ax.transData.inverted().transform([(0, 0), (1, 1)])
+        return max(abs(x1 - x0), abs(y1 - y0))
+
+
+def _split_stroke(stroke: Stroke, hit: npt.ArrayLike) -> list[Stroke]:
+    """Split a stroke into the runs of segments which weren't hit."""
+
+    # segment i joins vertices i and i + 1, so a run of segments a..b keeps a..b + 1
+    kept = np.flatnonzero(~hit)
+    if len(kept) == 0:
+        return []
+
+    breaks = np.flatnonzero(np.diff(kept) > 1) + 1
+    runs = np.split(kept, breaks)
+
+    return [
+        Stroke.from_vertices(
+            stroke.vertices[run[0] : run[-1] + 2], stroke.colour, stroke.width
+        )
+        for run in runs
+    ]
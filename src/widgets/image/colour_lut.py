@@ -0,0 +1,152 @@
+from typing import Optional
+
+import astropy.visualization as vis
+import numpy as np
+import numpy.typing as npt
+from matplotlib.cm import ScalarMappable
+
+from src.enums import Scaling
+
+# The number of entries in the lookup table. The last is saved for NaN
+LUT_SIZE = 4096
+# How many values to sample from the image to place the quantile edges with
+SAMPLES = 2**16
+
+
+def quantisation_edges(
+    sample: npt.ArrayLike, min_value: float, max_value: float, levels: int
+) -> npt.ArrayLike:
+    """Work out the edges to quantise an image's values into levels with.
+
+    Half of the edges are spread evenly over the range of the data, and half are on
+    quantiles of the sample, so there's plenty of levels wherever most of the data
+    is (which is where a narrow vmin / vmax usually is), while still covering the
+    whole range.
+
+    :param sample: a sample of the (non-NaN) data, see percentiles.sample_data
+    :param min_value: the minimum of the data
+    :param max_value: the maximum of the data
+    :param levels: the (maximum) number of levels. Duplicate edges are dropped, so
+        there can be less.
+
+    :return: the sorted edges, the first being min_value and the last max_value
+    """
+
+    if not (np.isfinite(min_value) and np.isfinite(max_value)):
+        min_value, max_value = 0.0, 1.0
+
+    if max_value <= min_value:
+        min_value, max_value = min_value - 0.5, max_value + 0.5
+
+    linear = np.linspace(min_value, max_value, levels // 2 + 1)
+
+    if len(sample) == 0:
+        return linear
+
+    quantiles = np.quantile(sample, np.linspace(0, 1, levels - levels // 2))
+
+    return np.unique(np.concatenate([linear, np.clip(quantiles, min_value, max_value)]))
+
+
+class ColourLUT:
+    """Colour maps an image through a lookup table, rather than per pixel.
+
+    The image's values are quantised once (see quantise) into an index buffer, and
+    changing the colour map, stretch or vmin / vmax only rebuilds the LUT_SIZE entry
+    lookup table, which is then gathered over the index buffer (see apply). This keeps
+    re-rendering a large image as cheap as indexing an array with another.
+    """
+
+    def __init__(
+        self,
+        sample: npt.ArrayLike,
+        min_value: float,
+        max_value: float,
+        size: int = LUT_SIZE,
+    ):
+        """Construct a ColourLUT. Call set_render before applying it.
+
+        :param sample: a sample of the (non-NaN) image data, see percentiles.sample_data
+        :param min_value: the minimum of the image data
+        :param max_value: the maximum of the image data
+        :param size: the number of entries in the lookup table
+        """
+
+        self.sample = sample
+        self.size = size
+        self.lut: Optional[npt.ArrayLike] = None
+
+        # for the colour bar, as the image itself is drawn as RGBA
+        self.mappable = ScalarMappable()
+
+        self.set_range(min_value, max_value)
+
+    def set_range(self, min_value: float, max_value: float):
+        """Change the range of data the LUT covers, i.e. once the exact min / max is known.
+
+        Anything already quantised needs to be quantised again.
+        """
+
+        self.range = (min_value, max_value)
+        self.edges = quantisation_edges(
+            self.sample, min_value, max_value, self.size - 1
+        )
+        # the value each level is drawn as
+        self.values = (self.edges[:-1] + self.edges[1:]) / 2
+        self.nan_index = len(self.values)
+
+        if self.lut is not None:
+            self._build()
+
+    def set_render(
+        self, colour_map: str, vmin: float, vmax: float, scaling: Scaling
+    ) -> None:
+        """Rebuild the lookup table for the given render config.
+
+        :param colour_map: the colour map to use
+        :param vmin: the minimum value of the colour map - anything lower gets clipped
+        :param vmax: the maximum value of the colour map - anything higher gets clipped
+        :param scaling: the stretch / scaling of the image
+        """
+
+        norm = vis.ImageNormalize(
+            stretch=scaling.stretch(self.values, vmin, vmax), vmin=vmin, vmax=vmax
+        )
+
+        self.mappable.set_cmap(colour_map)
+        self.mappable.set_norm(norm)
+
+        self._build()
+
+    def _build(self):
+        norm, cmap = self.mappable.norm, self.mappable.get_cmap()
+
+        lut = np.empty((self.nan_index + 1, 4), dtype=np.uint8)
+        lut[:-1] = cmap(norm(self.values), bytes=True)
+        lut[-1] = cmap(np.ma.masked_invalid([np.nan]), bytes=True)[0]
+
+        self.lut = lut
+
+    def quantise(self, data: npt.ArrayLike) -> npt.ArrayLike:
+        """Quantise data into an index buffer for apply.
+
+        :param data: the data to quantise. Should be float[][].
+
+        :return: the index of the level of each value, as uint16
+        """
+
+        data = np.asarray(data)
+
+        index = np.searchsorted(self.edges, data, side="right") - 1
+        np.clip(index, 0, self.nan_index - 1, out=index)
+        index[np.isnan(data)] = self.nan_index
+
+        return index.astype(np.uint16)
+
+    def apply(self, index: npt.ArrayLike) -> npt.ArrayLike:
+        """Colour an index buffer from quantise.
+
+        :return: the RGBA image, as uint8[][][4]
+        """
+
+        return self.lut[index]
@@ -0,0 +1,243 @@
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+import numpy.typing as npt
+from astropy.wcs import WCS
+from matplotlib.axes import Axes
+
+# How many cells (in each dimension) the view is split into for interpolating
+GRID_SIZE = 16
+# The most cells the grid is refined to before giving up and using the WCS directly
+MAX_GRID_SIZE = 256
+# How far off (in arcseconds) interpolating can be. The readout shows hundredths of
+#   a second of RA (0.15") and of a second of Dec, so this is under half of that
+TOLERANCE_ARCSEC = 0.005
+# The grid covers this fraction of the view past each edge, so panning a little
+#   doesn't need a new one
+GRID_MARGIN = 0.5
+
+# (xlim, ylim) of a view
+View = Tuple[Tuple[float, float], Tuple[float, float]]
+
+
+def format_sexagesimal(lon: float, lat: float) -> str:
+    """Format a co-ordinate (in degrees) as "hh:mm:ss.ss, +dd:mm:ss.ss".
+
+    This is the same as SkyCoord.to_string(style="hmsdms", sep=":", pad=True,
+    precision=2), without the overhead of going through a SkyCoord and Angles.
+    """
+
+    # in hundredths of a second, rounded before splitting up so 59.999s carries over
+    hours = round((lon % 360) / 15 * 360000) % (24 * 360000)
+    h, rem = divmod(hours, 360000)
+    m, cs = divmod(rem, 6000)
+
+    sign = "-" if lat < 0 else "+"
+    degrees = round(abs(lat) * 360000)
+    d, rem = divmod(degrees, 360000)
+    dm, dcs = divmod(rem, 6000)
+
+    return (
+        f"{h:02d}:{m:02d}:{cs // 100:02d}.{cs % 100:02d}, "
+        f"{sign}{d:02d}:{dm:02d}:{dcs // 100:02d}.{dcs % 100:02d}"
+    )
+
+
+def format_decimal(lon: float, lat: float) -> str:
+    """Format a co-ordinate (in degrees) as "lon, lat", to 2 decimal places."""
+    return f"{lon:.2f}, {lat:.2f}"
+
+
+class WCSGrid:
+    """The world co-ordinates of a view of an image, sampled on a grid and
+    interpolated, which is much faster than the full WCS for distorted images.
+
+    The grid is refined until interpolating it is within TOLERANCE_ARCSEC of the WCS
+    everywhere it was checked. If it can't be (e.g. the view crosses a pole, or the
+    edge of the projection) it isn't usable, see accurate.
+    """
+
+    def __init__(self, image_wcs: WCS, view: View, size: int = GRID_SIZE):
+        """Construct a WCSGrid.
+
+        :param image_wcs: the (celestial) wcs of the image
+        :param view: the view to cover, as (xlim, ylim) in pixel co-ordinates
+        :param size: how many cells to start with in each dimension
+        """
+
+        (x0, x1), (y0, y1) = view
+        self.x0, self.y0 = min(x0, x1), min(y0, y1)
+        self.width = max(abs(x1 - x0), 1e-9)
+        self.height = max(abs(y1 - y0), 1e-9)
+
+        self.accurate = False
+
+        while size <= MAX_GRID_SIZE:
+            self.size = size
+            self.lon, self.lat = self._sample(image_wcs, size + 1, 0)
+
+            if self._check(image_wcs):
+                self.accurate = True
+                # indexing lists is a lot faster than numpy for single values
+                self.lon_rows = self.lon.tolist()
+                self.lat_rows = self.lat.tolist()
+                break
+
+            size *= 4
+
+    def _sample(self, image_wcs: WCS, n: int, offset: float):
+        """Sample the WCS on an n by n grid over the view, offset by offset cells."""
+
+        u = (np.arange(n) + offset) / self.size
+        x = self.x0 + u * self.width
+        y = self.y0 + u * self.height
+        xx, yy = np.meshgrid(x, y)
+
+        with np.errstate(invalid="ignore"):
+            lon, lat = image_wcs.all_pix2world(xx, yy, 0)
+
+        # unwrap RA across 0 / 360 so it interpolates smoothly, along both axes
+        lon = np.unwrap(np.unwrap(lon, period=360, axis=1), period=360, axis=0)
+        return lon, lat
+
+    def _check(self, image_wcs: WCS) -> bool:
+        """Whether interpolating at the centres of the cells matches the WCS."""
+
+        if not (np.all(np.isfinite(self.lon)) and np.all(np.isfinite(self.lat))):
+            return False
+
+        lon, lat = self._sample(image_wcs, self.size, 0.5)
+        centres = np.arange(self.size) + 0.5
+        xx, yy = np.meshgrid(centres, centres)
+        lon_i, lat_i = self._interpolate(xx, yy)
+
+        lon_error = np.abs((lon_i - lon + 180) % 360 - 180) * np.cos(np.radians(lat))
+        error = 3600 * np.maximum(lon_error, np.abs(lat_i - lat))
+
+        return bool(np.nanmax(error) <= TOLERANCE_ARCSEC)
+
+    def _interpolate(self, gx: npt.ArrayLike, gy: npt.ArrayLike):
+        """Bilinearly interpolate the grid at (fractional) grid co-ordinates."""
+
+        ix = np.clip(np.floor(gx).astype(int), 0, self.size - 1)
+        iy = np.clip(np.floor(gy).astype(int), 0, self.size - 1)
+        fx, fy = gx - ix, gy - iy
+
+        def lerp(grid):
+            bottom = grid[iy, ix] * (1 - fx) + grid[iy, ix + 1] * fx
+            top = grid[iy + 1, ix] * (1 - fx) + grid[iy + 1, ix + 1] * fx
+            return bottom * (1 - fy) + top * fy
+
+        return lerp(self.lon), lerp(self.lat)
+
+    def contains(self, x: float, y: float) -> bool:
+        return (
+            self.x0 <= x <= self.x0 + self.width
+            and self.y0 <= y <= self.y0 + self.height
+        )
+
+    def pixel_to_world(self, x: float, y: float) -> Tuple[float, float]:
+        """The world co-ordinates (lon, lat in degrees) of a pixel in the view."""
+
+        # this is _interpolate for a single point, without the overhead of numpy
+        gx = (x - self.x0) / self.width * self.size
+        gy = (y - self.y0) / self.height * self.size
+        ix = min(max(int(gx), 0), self.size - 1)
+        iy = min(max(int(gy), 0), self.size - 1)
+        fx, fy = gx - ix, gy - iy
+
+        def lerp(grid):
+            bottom = grid[iy][ix] * (1 - fx) + grid[iy][ix + 1] * fx
+            top = grid[iy + 1][ix] * (1 - fx) + grid[iy + 1][ix + 1] * fx
+            return bottom * (1 - fy) + top * fy
+
+        return lerp(self.lon_rows) % 360, lerp(self.lat_rows)
+
+
+class CoordReadout:
+    """Formats the co-ordinates and value under the mouse, see format_coord.
+
+    This runs on every mouse move, so rather than going through a SkyCoord, the world
+    co-ordinates come from a WCSGrid of the current view (built the first time the
+    mouse moves after the view changes) and are formatted by hand.
+    """
+
+    def __init__(self, ax: Axes, image_wcs: WCS, image_data: npt.ArrayLike):
+        """Construct a CoordReadout.
+
+        :param ax: the axes the image is drawn on
+        :param image_wcs: the (celestial) wcs of the image
+        :param image_data: the data of the image, for the value
+        """
+
+        self.ax = ax
+        self.image_wcs = image_wcs
+        self.image_data = image_data
+
+        self.view: Optional[View] = None
+        self.grid: Optional[WCSGrid] = None
+
+    def get_grid(self) -> WCSGrid:
+        """Get a grid covering the current view, only building a new one when the
+        view has moved off the last one or zoomed in on it."""
+
+        view = (tuple(self.ax.get_xlim()), tuple(self.ax.get_ylim()))
+        if view == self.view:
+            return self.grid
+
+        self.view = view
+        (x0, x1), (y0, y1) = view
+        width, height = abs(x1 - x0), abs(y1 - y0)
+
+        grid = self.grid
+        if (
+            grid is None
+            or not grid.contains(min(x0, x1), min(y0, y1))
+            or not grid.contains(max(x0, x1), max(y0, y1))
+            or grid.width > (1 + 4 * GRID_MARGIN) * width
+            or grid.height > (1 + 4 * GRID_MARGIN) * height
+        ):
+            margin_x, margin_y = GRID_MARGIN * width, GRID_MARGIN * height
+            self.grid = WCSGrid(
+                self.image_wcs,
+                (
+                    (min(x0, x1) - margin_x, max(x0, x1) + margin_x),
+                    (min(y0, y1) - margin_y, max(y0, y1) + margin_y),
+                ),
+            )
+
+        return self.grid
+
+    def pixel_to_world(self, x: float, y: float) -> Tuple[float, float]:
+        """The world co-ordinates (lon, lat in degrees) of a pixel."""
+
+        grid = self.get_grid()
+        if grid.accurate and grid.contains(x, y):
+            return grid.pixel_to_world(x, y)
+
+        lon, lat = self.image_wcs.all_pix2world(x, y, 0)
+        return float(lon), float(lat)
+
+    def format_coord(self, x: float, y: float) -> str:
+        lon, lat = self.pixel_to_world(x, y)
+        if not (math.isfinite(lon) and math.isfinite(lat)):
+            raise ValueError("no world co-ordinates here")
+
+        decimal = format_decimal(lon, lat)
+        sexagesimal = format_sexagesimal(lon, lat)
+
+        # Yes, round, not floor.
+        roundx = round(x)
+        roundy = round(y)
+
+        pix = f"{roundx}, {roundy}"
+
+        prefix = f"WCS: ({decimal});\n WCS: ({sexagesimal});\n Image: ({pix})"
+
+        rows, cols = self.image_data.shape[:2]
+        if 0 <= roundx < cols and 0 <= roundy < rows:
+            image_value = self.image_data[roundy, roundx]
+            return f"{prefix}\n Value: ({image_value:.3e})"
+
+        return prefix
@@ -1,9 +1,7 @@
 from tkinter import filedialog
-from typing import Dict, Tuple
+from typing import Callable, Dict, Optional, Tuple
 
-import astropy.visualization as vis
 import astropy.wcs.utils as sc
-import numpy as np
 import numpy.typing as npt
 from astropy.coordinates import SkyCoord
 from astropy.io import fits
@@ -14,29 +12,43 @@ from matplotlib.image import AxesImage
 
 from src import constants
 from src.enums import Scaling
+from src.lib import percentiles
+from src.widgets.image.colour_lut import ColourLUT
+from src.widgets.image.coord_readout import CoordReadout
+from src.widgets.image.image_pyramid import Extent, ImagePyramid, Region
 
 ImageLimits = Tuple[SkyCoord, SkyCoord]
 
 
-def open_fits_file(file_path: str) -> Tuple[npt.ArrayLike, fits.Header]:
+def open_fits_file(
+    file_path: str, memmap: bool = True
+) -> Tuple[npt.ArrayLike, fits.Header]:
     """Open and process a .fits file at file_path.
 
     Will always return the image at [0].
 
+    The data is memory-mapped by default rather than read into memory, so opening a
+    file is (close to) free and only the pages which are actually indexed get read from
+    disk. The returned array holds a reference to the mapping, so it stays valid for as
+    long as it's referenced (i.e. for the lifetime of the ImageFrame) even though the
+    file itself is closed here.
+
+    Note that astropy can't memory-map images which need scaling (BSCALE / BZERO
+    headers), so those will still be read into memory in full.
+
     :param file_path: Path to the file to open.
+    :param memmap: whether to memory-map the data instead of reading it into memory
 
     :return: a tuple of the image's data and the associated headers
     """
 
-    fits_file = fits.open(file_path)
-
-    hdu = fits_file[0]
-    image_data_header = fits_file[0].header
+    with fits.open(file_path, memmap=memmap, lazy_load_hdus=True) as fits_file:
+        hdu = fits_file[0]
+        image_data_header = hdu.header
 
-    # some files have (1, 1, x, y) or (x, y, 1, 1) shape so we use .squeeze
-    image_data = hdu.data.squeeze()
-
-    fits_file.close()
+        # some files have (1, 1, x, y) or (x, y, 1, 1) shape so we use .squeeze
+        # this is just a view, so nothing is read from the file yet
+        image_data = hdu.data.squeeze()
 
     return image_data, image_data_header
 
@@ -70,19 +82,23 @@ def save_fits_file(image_data: npt.ArrayLike, image_data_header: fits.Header):
 def create_figure_fits(
     image_data: npt.ArrayLike,
     image_wcs: WCS,
-    colour_map: str,
-    vmin: float,
-    vmax: float,
-    scaling: Scaling,
+    colour_lut: ColourLUT,
+    display_index: npt.ArrayLike,
+    extent: Optional[Extent] = None,
 ) -> Tuple[Figure, AxesImage, ImageLimits]:
     """Create a figure from image_data with default options.
 
+    The image is drawn as RGBA through colour_lut (which needs its render config
+    set), from display_index rather than image_data itself - this is usually a
+    preview or a region of the image pyramid, and it's up to the caller to swap in the
+    right region as the view changes (see get_view_region and set_image_display).
+
     :param image_data: numpy array with the image's data. Note that this should be float[][].
     :param image_wcs: the wcs of the image
-    :param colour_map: the colour map to use
-    :param vmin: the minimum value of the colour map - anything lower gets clipped
-    :param vmax: the maximum value of the colour map - anything higher gets clipped
-    :param s: the stretch / scaling of the image
+    :param colour_lut: the lookup table to colour the image with
+    :param display_index: the quantised (see ColourLUT.quantise) data to draw
+    :param extent: where to draw display_index, in pixels of image_data. None if
+        it's all of image_data.
 
     :return: the created figure, the image drawn on the figure, and the WCS limits of that image
     """
@@ -98,46 +114,26 @@ def create_figure_fits(
     ax.set_xlabel("RA")
     ax.set_ylabel("DEC")
 
-    def format_coord(x, y):
-        c = image_wcs.pixel_to_world(x, y)
-
-        decimal = c.to_string(style="decimal", precision=2).replace(" ", ", ")
-        sexigesimal = c.to_string(
-            style="hmsdms", sep=":", pad=True, precision=2
-        ).replace(" ", ", ")
-
-        # Yes, round, not floor.
-        roundx = round(x)
-        roundy = round(y)
-
-        pix = f"{roundx}, {roundy}"
-
-        prefix = f"WCS: ({decimal});\n WCS: ({sexigesimal});\n Image: ({pix})"
-
-        if 0 <= roundx < image_data.shape[1] and 0 <= roundy < image_data.shape[0]:
-            image_value = image_data[roundy][roundx]
-            return f"{prefix}\n Value: ({image_value:.3e})"
-
-        return prefix
-
     # https://matplotlib.org/stable/gallery/images_contours_and_fields/image_zcoord.html
-    ax.format_coord = format_coord
-
-    # Manually scaling the data leads to an issue where the colour bar does not update with correct values but this does
-    # fix the history buttons changing the render config
-    # data = scaling.stretch(image_data, vmin, vmax)
-    # image = ax.imshow(data, cmap=colour_map, origin="lower", interpolation="nearest")
-
-    norm = vis.ImageNormalize(
-        stretch=scaling.stretch(image_data, vmin, vmax), vmin=vmin, vmax=vmax
-    )
+    ax.format_coord = CoordReadout(ax, image_wcs, image_data).format_coord
 
-    # Render the scaled image data onto the figure
+    # Render the colour mapped image data onto the figure
     image = ax.imshow(
-        image_data, cmap=colour_map, norm=norm, origin="lower", interpolation="nearest"
+        colour_lut.apply(display_index),
+        origin="lower",
+        interpolation="nearest",
+        extent=extent,
     )
 
-    cbar = fig.colorbar(image, shrink=0.5)
+    if extent is not None:
+        # the display data can overhang the image a little, so set the limits to the
+        # actual image. Turning off autoscaling stops set_extent from moving the
+        # view whenever a different level / region gets swapped in
+        ax.set_xlim(-0.5, image_data.shape[1] - 0.5)
+        ax.set_ylim(-0.5, image_data.shape[0] - 0.5)
+        ax.set_autoscale_on(False)
+
+    cbar = fig.colorbar(colour_lut.mappable, ax=ax, shrink=0.5)
     tick_locator = ticker.MaxNLocator(nbins=10)
     cbar.locator = tick_locator
     cbar.ax.tick_params(labelsize=5)
@@ -146,28 +142,65 @@ def create_figure_fits(
     return fig, image, get_limits(fig, image_wcs)
 
 
-# TODO find a better pattern for "norm"
-def update_image_norm(image: AxesImage, image_data, vmin, vmax, scaling: Scaling):
-    """Update the norm on the given image based on the provided options."""
+def get_view_region(image: AxesImage, image_pyramid: ImagePyramid) -> Region:
+    """Get the level and region of image_pyramid which matches the current view.
+
+    :param image: the image drawn from the pyramid (see create_figure_fits)
+    :param image_pyramid: the pyramid the image is drawn from
+
+    :return: the region to draw
+    """
 
-    norm = vis.ImageNormalize(
-        stretch=scaling.stretch(image_data, vmin, vmax), vmin=vmin, vmax=vmax
+    ax = image.axes
+
+    return image_pyramid.region_for_view(
+        *ax.get_xlim(), *ax.get_ylim(), ax.bbox.width, ax.bbox.height
     )
 
-    image.set_norm(norm)
 
-    # Related to the colour bar/history button fix clash
-    # data = scaling.stretch(image_data, vmin, vmax)
-    # image.set_data(data)
+def set_image_display(
+    image: AxesImage,
+    colour_lut: ColourLUT,
+    display_index: npt.ArrayLike,
+    extent: Extent,
+):
+    """Swap what's drawn on the image, i.e. to a different region of the pyramid.
+
+    :param image: the image to update
+    :param colour_lut: the lookup table to colour the image with
+    :param display_index: the quantised (see ColourLUT.quantise) data to draw
+    :param extent: where to draw display_index, in pixels of the image data
+    """
+
+    image.set_data(colour_lut.apply(display_index))
+    image.set_extent(extent)
+
 
+def update_image_render(
+    image: AxesImage,
+    colour_lut: ColourLUT,
+    display_index: npt.ArrayLike,
+    colour_map: str,
+    vmin: float,
+    vmax: float,
+    scaling: Scaling,
+):
+    """Update the render config of the given image.
 
-def update_image_cmap(image: AxesImage, colour_map: str):
-    """Update the colour map on the given image to the given colour map.
+    This only rebuilds the lookup table and re-colours the data being drawn, so it's
+    cheap enough to do on every change (e.g. while dragging vmin / vmax).
 
-    :param image: the image to update the cmap on
-    :param colour_map: the colour map
+    :param image: the image to update
+    :param colour_lut: the lookup table the image is coloured with
+    :param display_index: the quantised data the image is drawn from
+    :param colour_map: the colour map to use
+    :param vmin: the minimum value of the colour map - anything lower gets clipped
+    :param vmax: the maximum value of the colour map - anything higher gets clipped
+    :param scaling: the stretch / scaling of the image
     """
-    image.set_cmap(colour_map)
+
+    colour_lut.set_render(colour_map, vmin, vmax, scaling)
+    image.set_data(colour_lut.apply(display_index))
 
 
 def set_grid_lines(fig: Figure, visible: bool):
@@ -182,13 +215,25 @@ def set_grid_lines(fig: Figure, visible: bool):
         fig.axes[0].grid(b=False, linewidth=0)
 
 
-def get_percentiles(image_data: npt.ArrayLike) -> Dict[str, Tuple[float, float]]:
+def get_percentiles(
+    image_data: npt.ArrayLike,
+    max_error: Optional[float] = None,
+    visit: Optional[Callable[[npt.ArrayLike], None]] = None,
+) -> Tuple[Dict[str, Tuple[float, float]], float]:
     """Calculate all the percentile values from the data in image_data.
 
+    By default this is exact, which needs a full pass over the data. With a max_error
+    they're estimated from a sample instead, which is fast regardless of the size of
+    the data (see src.lib.percentiles).
+
     :param image_data: numpy array with the image's data. Note that this should be float[][].
+    :param max_error: the acceptable error of the values, in percentile rank. None for exact values.
+    :param visit: for exact values, called with each chunk of image_data on the way,
+        so other reductions can share the pass (see ImageStatistics)
 
-    :return: a dict of percentiles (str version) to a tuple of (low, high)
-        values. e.g. { "95": (2.5 value, 97.5 value) }
+    :return: a tuple of (a dict of percentiles (str version) to a tuple of (low, high)
+        values. e.g. { "95": (2.5 value, 97.5 value) }, the error bound of the values - 0
+        if they are exact)
     """
     edges = []
     for percentile in constants.PERCENTILES:
@@ -196,13 +241,13 @@ def get_percentiles(image_data: npt.ArrayLike) -> Dict[str, Tuple[float, float]]
         lp, rp = edge, 100 - edge
         edges.extend([lp, rp])
 
-    values = np.nanpercentile(image_data, tuple(edges))
+    values, error = percentiles.get_percentiles(image_data, edges, max_error, visit)
 
     ret = {}
     for i, percentile in enumerate(constants.PERCENTILES):
         ret[str(percentile)] = (values[i * 2], values[i * 2 + 1])
 
-    return ret
+    return ret, error
 
 
 def get_limits(fig: Figure, image_wcs: WCS) -> ImageLimits:
@@ -225,6 +270,78 @@ def get_limits(fig: Figure, image_wcs: WCS) -> ImageLimits:
     return limits
 
 
+def scaled_wcs(
+    image_wcs: WCS, xlim: Tuple[float, float], ylim: Tuple[float, float], width: int
+) -> WCS:
+    """The WCS of a region of an image resampled to a different resolution, i.e. to
+    download a survey at just the part of the image and resolution that's shown.
+
+    Pixel (i, j) of the new WCS is centred on (x0 + (i + 0.5) * scale, y0 + (j + 0.5)
+    * scale) of the image, where x0, y0 are the lower limits. Any distortion (i.e. SIP)
+    of image_wcs is dropped, since it can't be rescaled.
+
+    :param image_wcs: the (celestial) wcs of the image
+    :param xlim: the x limits of the region, in pixel co-ordinates of the image
+    :param ylim: the y limits of the region, in pixel co-ordinates of the image
+    :param width: how many pixels across the region should be in the new WCS, the
+        height is whatever keeps the pixels square
+
+    :return: the WCS, with its pixel_shape set
+    """
+
+    x0, x1 = sorted(xlim)
+    y0, y1 = sorted(ylim)
+    width = max(int(width), 1)
+    scale = max(x1 - x0, 1e-9) / width
+    height = max(round((y1 - y0) / scale), 1)
+
+    new_wcs = image_wcs.celestial.deepcopy()
+    new_wcs.sip = None
+
+    # FITS pixels are 1-based, hence the 1s
+    crpix = new_wcs.wcs.crpix
+    new_wcs.wcs.crpix = [
+        (crpix[0] - x0 - 1) / scale + 0.5,
+        (crpix[1] - y0 - 1) / scale + 0.5,
+    ]
+
+    if new_wcs.wcs.has_cd():
+        new_wcs.wcs.cd = new_wcs.wcs.cd * scale
+    else:
+        new_wcs.wcs.cdelt = new_wcs.wcs.cdelt * scale
+
+    new_wcs.pixel_shape = (width, height)
+
+    return new_wcs
+
+
+def get_view_wcs(fig: Figure, image_wcs: WCS) -> Tuple[WCS, Extent]:
+    """The WCS of the current view of an image, at the resolution it's shown at on
+    the screen (one pixel per pixel of the canvas), see scaled_wcs.
+
+    :param fig: the figure
+    :param image_wcs: the image's wcs object
+
+    :return: a tuple of the WCS, and where an image with it should be drawn in pixel
+        co-ordinates of the image (the extent)
+    """
+
+    ax = fig.axes[0]
+
+    xlim = ax.get_xlim()
+    ylim = ax.get_ylim()
+
+    view_wcs = scaled_wcs(image_wcs, xlim, ylim, round(ax.bbox.width))
+
+    x0 = min(xlim)
+    y0 = min(ylim)
+    width, height = view_wcs.pixel_shape
+    scale = abs(xlim[1] - xlim[0]) / width
+    extent = (x0, x0 + width * scale, y0, y0 + height * scale)
+
+    return view_wcs, extent
+
+
 def set_limits(fig: Figure, image_wcs: WCS, limits: ImageLimits):
     """Set the limits on the plot from the given limits.
 
@@ -0,0 +1,461 @@
+import math
+import traceback
+from collections import OrderedDict, deque
+from functools import partial
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+import numpy.typing as npt
+from astropy.wcs import WCS
+
+from src.lib import background
+from src.widgets.hips_survey_selector import hips_handler, hips_metadata
+from src.widgets.image import fits_handler
+from src.widgets.image.image_pyramid import Extent
+
+if TYPE_CHECKING:
+    from src.widgets.image.image_frame import ImageFrame
+
+# How far (as screen pixels per pixel of the data) an image can be zoomed in before
+#   its view is downloaded again at a finer resolution
+ZOOM_THRESHOLD = 1.5
+# How long (ms) the view has to stay still before it's downloaded, so zooming and
+#   panning doesn't start a download at every step
+SETTLE_DELAY = 300
+
+# The size (in pixels) of the blocks the view is downloaded in
+BLOCK_SIZE = 512
+# How many blocks are kept in memory besides those of the view, each is BLOCK_SIZE^2
+#   float32s (1 MiB). Also the most blocks prefetched at once, so they don't evict
+#   each other
+BLOCK_CACHE_SIZE = 64
+# The coarsest and finest levels blocks are downloaded at, which have 2**level pixels
+#   for every pixel of the image
+MIN_LEVEL = -8
+MAX_LEVEL = 8
+
+# (level, x, y) of a block, see block_extent
+Block = Tuple[int, int, int]
+# (level, first column, last column, first row, last row) of the blocks in a view
+BlockRange = Tuple[int, int, int, int, int]
+# the blocks of a view, and which of them have to be downloaded, see view_blocks
+ViewBlocks = Tuple[BlockRange, Tuple[Block, ...]]
+
+
+def block_span(level: int) -> float:
+    """How many pixels of the image a block covers across at a level."""
+    return BLOCK_SIZE * 2.0**-level
+
+
+def block_extent(block: Block) -> Extent:
+    """Where a block is, in pixel co-ordinates of the image. Block (level, 0, 0) starts
+    at the corner of the image, the rest are tiled out from there."""
+
+    level, bx, by = block
+    span = block_span(level)
+
+    return (
+        bx * span - 0.5,
+        (bx + 1) * span - 0.5,
+        by * span - 0.5,
+        (by + 1) * span - 0.5,
+    )
+
+
+def get_level(screen_pixels: float, view_pixels: float) -> int:
+    """The level of blocks to show a view at, the coarsest one which is fine enough
+    not to be zoomed in past ZOOM_THRESHOLD.
+
+    :param screen_pixels: how many pixels of the screen the view is shown on
+    :param view_pixels: how many pixels of the image are in the view
+    """
+
+    ratio = screen_pixels / max(view_pixels, 1e-9)
+    level = math.ceil(math.log2(max(ratio / ZOOM_THRESHOLD, 2.0**MIN_LEVEL)))
+
+    return min(max(level, MIN_LEVEL), MAX_LEVEL)
+
+
+def blocks_for_view(
+    level: int, xlim: Tuple[float, float], ylim: Tuple[float, float]
+) -> BlockRange:
+    """The range of blocks at a level which cover a view."""
+
+    span = block_span(level)
+
+    def axis_range(lim):
+        low, high = sorted(lim)
+        first = math.floor((low + 0.5) / span)
+        last = max(math.ceil((high + 0.5) / span) - 1, first)
+        return first, last
+
+    bx0, bx1 = axis_range(xlim)
+    by0, by1 = axis_range(ylim)
+
+    return level, bx0, bx1, by0, by1
+
+
+def blocks_in(block_range: BlockRange) -> List[Block]:
+    level, bx0, bx1, by0, by1 = block_range
+    return [(level, bx, by) for by in range(by0, by1 + 1) for bx in range(bx0, bx1 + 1)]
+
+
+def download_block(
+    hips_survey: hips_handler.HiPsSurvey,
+    image_wcs: WCS,
+    block: Block,
+    download: hips_handler.HiPSDownload,
+) -> npt.ArrayLike:
+    """Download a block of a survey (see hips_handler.open_hips).
+
+    :param hips_survey: the survey
+    :param image_wcs: the wcs of the image the blocks are of
+    :param block: the block to download
+    :param download: to cancel it with
+    :return: the data of the block, BLOCK_SIZE by BLOCK_SIZE
+    """
+
+    left, right, bottom, top = block_extent(block)
+    block_wcs = fits_handler.scaled_wcs(
+        image_wcs, (left, right), (bottom, top), BLOCK_SIZE
+    )
+
+    try:
+        # nothing shows the coarser versions of a block, so don't draw them
+        image_data, _header = hips_handler.open_hips(
+            hips_survey,
+            block_wcs,
+            None,
+            hips_handler.fetch_hips2fits,
+            download,
+            progressive=False,
+        )
+    except hips_metadata.InvalidSurveyRequest:
+        # i.e. the survey doesn't cover the block, which is known without downloading
+        return np.full((BLOCK_SIZE, BLOCK_SIZE), np.nan, dtype=np.float32)
+
+    if image_data.shape != (BLOCK_SIZE, BLOCK_SIZE):
+        raise ValueError(f"Expected a {BLOCK_SIZE}px block, got {image_data.shape}")
+
+    return image_data
+
+
+class HiPSDetail:
+    """Downloads the view of an image opened from a HiPs survey again where the image
+    itself can't show it: zoomed in past the resolution it was opened at, or panned
+    past its edges.
+
+    The image is opened only as large as the screen (see hips_handler.fit_size and
+    fits_handler.get_view_wcs), so zooming in on it would just show bigger pixels. The
+    view is downloaded in blocks on a grid of levels (like the image pyramid, but
+    finer than the image), so that they can be reused as the view moves.
+
+    Zoomed out, only the blocks showing past the edges of the image within the view
+    are downloaded, the rest are drawn from the image itself (see image_block).
+
+    Once the view has been downloaded, the blocks around it and those of the next
+    level in are downloaded one at a time in the background (see prefetch), so panning
+    and zooming around don't have to wait.
+
+    The blocks are only drawn, they don't replace the image data, so statistics etc.
+    are still of the image as it was opened.
+    """
+
+    def __init__(self, frame: "ImageFrame", hips_survey: hips_handler.HiPsSurvey):
+        """Construct a HiPSDetail.
+
+        :param frame: the (fits) image opened from the survey
+        :param hips_survey: the survey it was opened from
+        """
+
+        self.frame = frame
+        self.hips_survey = hips_survey
+
+        # the downloaded blocks, least recently used first, see evict
+        self.blocks: "OrderedDict[Block, npt.ArrayLike]" = OrderedDict()
+        # the blocks being downloaded, and those that couldn't be (until the next fetch
+        #   or prefetch)
+        self.loading: Dict[Block, hips_handler.HiPSDownload] = {}
+        self.failed: Set[Block] = set()
+
+        # the blocks to download once nothing else is, see prefetch
+        self.queue: "deque[Block]" = deque()
+        self.prefetching: Optional[Block] = None
+
+        # the view waiting to settle before it's downloaded
+        self.after_id: Optional[str] = None
+        # the blocks the view needs, and those that are currently drawn
+        self.needed: Optional[ViewBlocks] = None
+        self.shown: Optional[ViewBlocks] = None
+
+    def get_view(self):
+        ax = self.frame.fig.axes[0]
+        return ax.get_xlim(), ax.get_ylim(), ax.bbox.width
+
+    def useful(self, block: Block, view: Optional[Extent] = None) -> bool:
+        """Whether a block shows something the image itself can't: it's finer than
+        the image, or shows past its edges.
+
+        :param block: the block
+        :param view: only count what's past the edges within this, (left, right,
+            bottom, top) in pixels of the image. All of the block by default
+        """
+
+        level = block[0]
+        pyramid = self.frame.image_pyramid
+        # the image can only stand in for blocks matching the tiles of its pyramid
+        if (
+            level > 0
+            or pyramid is None
+            or pyramid.tile_size != BLOCK_SIZE
+            or -level > pyramid.max_level
+        ):
+            return True
+
+        left, right, bottom, top = block_extent(block)
+        if view is not None:
+            left, right = max(left, view[0]), min(right, view[1])
+            bottom, top = max(bottom, view[2]), min(top, view[3])
+
+        rows, cols = self.frame.image_data.shape[:2]
+        return left < -0.5 or right > cols - 0.5 or bottom < -0.5 or top > rows - 0.5
+
+    def view_blocks(self) -> Optional[ViewBlocks]:
+        """The blocks needed to draw the current view, and which of those have to be
+        downloaded, or None if the image itself shows the view well enough."""
+
+        xlim, ylim, screen_pixels = self.get_view()
+        level = get_level(screen_pixels, abs(xlim[1] - xlim[0]))
+        block_range = blocks_for_view(level, xlim, ylim)
+
+        view = (*sorted(xlim), *sorted(ylim))
+        download = tuple(
+            block for block in blocks_in(block_range) if self.useful(block, view)
+        )
+
+        if not download:
+            return None
+
+        return block_range, download
+
+    def image_block(self, block: Block) -> npt.ArrayLike:
+        """A block drawn from the image itself, for a block at or coarser than the
+        image which isn't useful (see useful). The blocks line up with the tiles of
+        the image pyramid, so it's the tile of the matching level."""
+
+        level, bx, by = block
+        data, _extent = self.frame.image_pyramid.get_region((-level, bx, bx, by, by))
+
+        # the tiles at the edges of the image are cut short
+        padded = np.full((BLOCK_SIZE, BLOCK_SIZE), np.nan, dtype=np.float32)
+        padded[: data.shape[0], : data.shape[1]] = data
+
+        return padded
+
+    def update(self) -> bool:
+        """Check the view against the blocks, called whenever the view changes (see
+        ImageFrame.update_view). If all the blocks the view needs are there they're
+        drawn, otherwise they're downloaded once the view settles.
+
+        :return: whether the blocks are drawn, in which case the image pyramid
+            shouldn't be drawn over them
+        """
+
+        if self.after_id is not None:
+            self.frame.after_cancel(self.after_id)
+            self.after_id = None
+
+        self.needed = self.view_blocks()
+
+        if self.needed is None:
+            self.shown = None
+            return False
+
+        if self.needed == self.shown:
+            return True
+
+        if self.draw():
+            return True
+
+        self.shown = None
+        self.after_id = self.frame.after(SETTLE_DELAY, self.fetch)
+        return False
+
+    def draw(self) -> bool:
+        """Draw the blocks the view needs, if they're all downloaded."""
+
+        block_range, download = self.needed
+        if not all(block in self.blocks for block in download):
+            return False
+
+        for block in download:
+            self.blocks.move_to_end(block)
+
+        level, bx0, bx1, by0, by1 = block_range
+        data = np.block(
+            [
+                [
+                    (
+                        self.blocks[(level, bx, by)]
+                        if (level, bx, by) in download
+                        else self.image_block((level, bx, by))
+                    )
+                    for bx in range(bx0, bx1 + 1)
+                ]
+                for by in range(by0, by1 + 1)
+            ]
+        )
+
+        left, _right, bottom, _top = block_extent((level, bx0, by0))
+        _left, right, _bottom, top = block_extent((level, bx1, by1))
+
+        self.shown = self.needed
+        self.frame.show_detail(data, (left, right, bottom, top))
+        return True
+
+    def fetch(self):
+        """Download the blocks the view needs that aren't downloaded yet."""
+
+        self.after_id = None
+        self.failed.clear()
+
+        if self.needed is None:
+            return
+
+        for block in self.needed[1]:
+            self.load(block)
+
+    def load(self, block: Block):
+        if block in self.blocks or block in self.loading or block in self.failed:
+            return
+
+        download = hips_handler.HiPSDownload()
+        self.loading[block] = download
+
+        background.run_in_background(
+            self.frame,
+            download_block,
+            self.hips_survey,
+            self.frame.image_wcs,
+            block,
+            download,
+            callback=partial(self.on_downloaded, block),
+            error_callback=partial(self.on_error, block),
+            pool=background.get_io_pool(),
+        )
+
+    def on_downloaded(self, block: Block, data: npt.ArrayLike):
+        self.loading.pop(block, None)
+
+        self.blocks[block] = data
+        self.evict()
+
+        if self.needed is not None and self.needed != self.shown:
+            if self.draw():
+                # the view is done, so start on what's around it
+                self.prefetch()
+
+        self.next_prefetch(block)
+
+    def evict(self):
+        """Drop the least recently used blocks, past BLOCK_CACHE_SIZE of them. The
+        blocks the view needs are kept however many there are, else it could never
+        be drawn."""
+
+        pinned = set(self.needed[1]) if self.needed is not None else set()
+        excess = len(self.blocks.keys() - pinned) - BLOCK_CACHE_SIZE
+
+        for block in list(self.blocks):
+            if excess <= 0:
+                break
+
+            if block not in pinned:
+                del self.blocks[block]
+                excess -= 1
+
+    def on_error(self, block: Block, error: BaseException):
+        self.loading.pop(block, None)
+
+        # the image as it was opened is still shown, so there's nothing to tell
+        if not isinstance(error, hips_handler.DownloadCancelled):
+            self.failed.add(block)
+            traceback.print_exception(error)
+
+        self.next_prefetch(block)
+
+    def prefetch(self):
+        """Queue up the blocks around the view, and those of the next level in over
+        the middle of it, to download in the background. Called once the view is
+        drawn, and whenever the toolbar pans or zooms (see ImageFrame.on_navigate).
+
+        Any blocks still queued for the last view are dropped, and those that
+        couldn't be downloaded are tried again.
+        """
+
+        self.failed.clear()
+
+        xlim, ylim, screen_pixels = self.get_view()
+        view_width = abs(xlim[1] - xlim[0])
+        level, bx0, bx1, by0, by1 = blocks_for_view(
+            get_level(screen_pixels, view_width), xlim, ylim
+        )
+
+        around = blocks_in((level, bx0 - 1, bx1 + 1, by0 - 1, by1 + 1))
+
+        # zooming in (i.e. with the zoom tool) is usually to somewhere in the middle
+        centre_x, centre_y = sum(xlim) / 2, sum(ylim) / 2
+        quarter_x, quarter_y = abs(xlim[1] - xlim[0]) / 4, abs(ylim[1] - ylim[0]) / 4
+        zoomed = []
+        if level < MAX_LEVEL:
+            zoomed = blocks_in(
+                blocks_for_view(
+                    level + 1,
+                    (centre_x - quarter_x, centre_x + quarter_x),
+                    (centre_y - quarter_y, centre_y + quarter_y),
+                )
+            )
+
+        self.queue.clear()
+        self.queue.extend(self.wanted(around + zoomed)[:BLOCK_CACHE_SIZE])
+
+        self.next_prefetch()
+
+    def wanted(self, blocks: Iterable[Block]) -> List[Block]:
+        return [
+            block
+            for block in blocks
+            if block not in self.blocks
+            and block not in self.loading
+            and block not in self.failed
+            and self.useful(block)
+        ]
+
+    def next_prefetch(self, finished: Optional[Block] = None):
+        """Start downloading the next queued block, if nothing else is."""
+
+        if finished is not None and finished == self.prefetching:
+            self.prefetching = None
+
+        # the blocks of the view itself come first
+        if self.prefetching is not None or self.loading:
+            return
+
+        while self.queue:
+            block = self.queue.popleft()
+
+            if self.wanted([block]):
+                self.prefetching = block
+                self.load(block)
+                return
+
+    def cancel(self):
+        """Stop downloading anything, i.e. once the image is closed."""
+
+        if self.after_id is not None:
+            self.frame.after_cancel(self.after_id)
+            self.after_id = None
+
+        self.queue.clear()
+
+        for download in self.loading.values():
+            download.cancel()
@@ -1,5 +1,7 @@
+import dataclasses
 import os
-from multiprocessing.pool import ThreadPool
+import traceback
+from functools import partial
 from tkinter import messagebox
 from typing import TYPE_CHECKING, Optional, Tuple
 
@@ -10,10 +12,13 @@ from astropy.io import fits
 from numpy import typing as npt
 
 from src.enums import DataType, Matching
+from src.lib import background
 from src.lib.event_handler import EventHandler
 from src.lib.util import index_default
-from src.widgets.hips_survey_selector import hips_handler
+from src.widgets.hips_survey_selector import hips_handler, hips_metadata
+from src.widgets.hips_survey_selector.hips_download_window import HiPSDownloadWindow
 from src.widgets.image import fits_handler, image_frame, png_handler
+from src.widgets.image.hips_detail import HiPSDetail
 from src.widgets.image.image_standalone_toplevel import StandaloneImage
 
 if TYPE_CHECKING:
@@ -57,11 +62,17 @@ def set_selected_image(image: Optional[image_frame.ImageFrame]):
 
     Will invoke the event handler `selected_image_eh`.
 
+    Images which are still loading can't be selected, selecting one acts as None
+    until it's ready (when it's selected, see _on_image_ready).
+
     :param image: the image to set as selected. None is valid and passed
         on to consumers of the event, will act as "no images open".
     """
     global _selected_image
 
+    if image is not None and not image.ready:
+        image = None
+
     if _selected_image == image:
         # Do nothing, return early to avoid the event handler invocation
         return
@@ -71,7 +82,7 @@ def set_selected_image(image: Optional[image_frame.ImageFrame]):
 
 
 def get_images() -> list[image_frame.ImageFrame]:
-    """Get all the currently open ImageFrames.
+    """Get all the currently open ImageFrames, not including those still loading.
 
     :return: a list of ImageFrames
     """
@@ -86,7 +97,7 @@ def get_images() -> list[image_frame.ImageFrame]:
         # unwrap the image_frame from the windows
         images.append(w.image_frame)
 
-    return images
+    return [image for image in images if image.ready]
 
 
 def get_images_matched_to(match: Matching) -> list[image_frame.ImageFrame]:
@@ -128,6 +139,7 @@ def _open_image(
     file_name: str,
     data_type: DataType,
     from_hips: bool = False,
+    file_path: Optional[str] = None,
 ):
     """Open a new image with an ImageFrame.
 
@@ -139,8 +151,11 @@ def _open_image(
     :param file_name: the name of the file where the data came from. HiPs survey name for hips
     :param data_type: The type of the data in image_data.
     :param from_hips: if the data came from a HiPs survey
+    :param file_path: the path of the file the data came from, if any
+
+    :return: the ImageFrame
     """
-    global _main_window, _standalone_windows, update_image_list_eh
+    global _main_window, _standalone_windows
 
     if _main_window.main_image is None:
         # open to main window if nothing is currently open there
@@ -152,15 +167,34 @@ def _open_image(
             file_name,
             data_type,
             from_hips,
+            file_path,
         )
-        set_selected_image(_main_window.main_image)
+        image = _main_window.main_image
     else:
         # otherwise open up a new top-level image
         new_window = StandaloneImage(
-            _main_window, image_data, image_data_header, file_name, data_type, from_hips
+            _main_window,
+            image_data,
+            image_data_header,
+            file_name,
+            data_type,
+            from_hips,
+            file_path,
         )
         _standalone_windows.append(new_window)
-        set_selected_image(new_window.image_frame)
+        image = new_window.image_frame
+
+    # the image loads in the background, so we can only select it once it's shown
+    image.on_ready_eh.add(_on_image_ready)
+
+    return image
+
+
+def _on_image_ready(image: image_frame.ImageFrame):
+    """Select an image once it's loaded (see ImageFrame.show)."""
+    global update_image_list_eh
+
+    set_selected_image(image)
 
     # TODO this invoke is a bit weird
     update_image_list_eh.invoke(get_selected_image(), get_images())
@@ -175,7 +209,9 @@ def open_fits(file_path: str):
     """
     image_data, image_data_header = fits_handler.open_fits_file(file_path)
     file_name = os.path.basename(file_path)
-    _open_image(image_data, image_data_header, file_name, DataType.FITS)
+    _open_image(
+        image_data, image_data_header, file_name, DataType.FITS, file_path=file_path
+    )
 
 
 def open_png(file_path: str):
@@ -195,43 +231,187 @@ def open_hips(
 ):
     """Open a HiPs survey from a survey name, and optionally a WCS.
 
-    Will download the survey at once with the given configuration and convert it to it's
-    underlying type. This is currently slow, but unfortunately the best we have.
+    The survey is downloaded in the background (or opened from the cache, see
+    hips_cache), with a window showing the progress which can cancel it. Any number
+    can be downloading at once. Where the survey can be drawn from its tiles (see
+    hips_handler.open_tiles) it opens as soon as a coarse version is ready, and is
+    refined as the finer tiles arrive, otherwise it opens once it's done.
 
-    Note that the surveys must be contactable by the
+    Surveys which can't be drawn from their tiles must be contactable by the
     [hips2fits](https://astroquery.readthedocs.io/en/latest/hips2fits/hips2fits.html) service. The list of valid survey
     names is available [here](https://aladin.cds.unistra.fr/hips/list).
 
-    :param box_parent: a tk widget to own the message box which appears
+    FITS surveys are only downloaded as large as they can be shown (see
+    hips_handler.fit_size), and are downloaded again when zoomed in on (see
+    HiPSDetail). Colour surveys can't be, so are opened at COLOUR_SIZE.
+
+    :param box_parent: a tk widget to own the progress window
     :param hips_survey: the hips survey to open with the respective information about where to open it
-    :param Optional[wcs.WCS] image_wcs: a WCS to open the survey at
+    :param Optional[wcs.WCS] image_wcs: a WCS to open the survey at, which needs its
+        pixel_shape. Usually the view of another image (see fits_handler.get_view_wcs)
     """
 
-    # so the message box doesn't block the downloading of the survey
-    # i imagine that could be quite frustrating
-    pool = ThreadPool(processes=1)
-    r = pool.apply_async(hips_handler.open_hips, (hips_survey, image_wcs))
+    # the caller can change its options while this is still downloading
+    hips_survey = dataclasses.replace(hips_survey)
+
+    if hips_survey.data_type != DataType.FITS:
+        image_wcs = _fit_colour(hips_survey, image_wcs)
+    elif image_wcs is None:
+        size = hips_handler.fit_size(_display_pixels(box_parent))
+        hips_survey.width = hips_survey.height = size
+
+    # if the survey's been looked up already this can fail straight away, otherwise
+    # it's checked in the background before anything's downloaded
+    metadata = hips_metadata.peek_metadata(hips_survey.survey)
+    if metadata is not None:
+        try:
+            hips_metadata.validate(
+                metadata,
+                hips_survey,
+                hips_handler.get_target_wcs(hips_survey, image_wcs),
+            )
+        except hips_metadata.InvalidSurveyRequest as e:
+            _show_invalid_request(e)
+            return
+
+    download = hips_handler.HiPSDownload()
+    window = HiPSDownloadWindow(box_parent, hips_survey.survey, download)
+
+    background.run_in_background(
+        window,
+        hips_handler.open_hips,
+        hips_survey,
+        image_wcs,
+        None,
+        hips_handler.fetch_hips2fits,
+        download,
+        callback=partial(_on_hips_downloaded, window, hips_survey),
+        error_callback=partial(_on_hips_error, window, hips_survey),
+        pool=background.get_io_pool(),
+    )
 
-    dialogs.Messagebox.show_info(
-        "Attempting to download HiPs survey - close this box so image can open once done",
-        parent=box_parent,
-        title="Download",
-        alert=False,
+    window.after(
+        background.POLL_INTERVAL, partial(_poll_hips_layers, window, hips_survey)
+    )
+
+
+def _fit_colour(
+    hips_survey: hips_handler.HiPsSurvey, image_wcs: Optional[wcs.WCS]
+) -> Optional[wcs.WCS]:
+    """Size a colour survey to hips_handler.COLOUR_SIZE, see open_hips.
+
+    :return: the wcs to open it at, image_wcs resampled up to COLOUR_SIZE if given
+    """
+
+    if image_wcs is None:
+        hips_survey.width = hips_survey.height = hips_handler.COLOUR_SIZE
+        return None
+
+    width, height = image_wcs.pixel_shape
+    if max(width, height) >= hips_handler.COLOUR_SIZE:
+        return image_wcs
+
+    return fits_handler.scaled_wcs(
+        image_wcs,
+        (-0.5, width - 0.5),
+        (-0.5, height - 0.5),
+        round(hips_handler.COLOUR_SIZE * width / max(width, height)),
+    )
+
+
+def _display_pixels(widget) -> float:
+    """Roughly how many pixels of the screen across a new image will be shown on.
+    That's the size of the main image if there is one, otherwise of the screen."""
+    main_image = _main_window.main_image if _main_window is not None else None
+
+    if main_image is not None and main_image.ready:
+        bbox = main_image.fig.axes[0].bbox
+        return max(bbox.width, bbox.height)
+
+    return min(widget.winfo_screenwidth(), widget.winfo_screenheight())
+
+
+def _poll_hips_layers(window: HiPSDownloadWindow, hips_survey: hips_handler.HiPsSurvey):
+    """Show the coarse versions of a HiPs survey as they're drawn, see open_hips."""
+    if not window.winfo_exists():
+        return
+
+    layer = window.download.get_layer()
+    if layer is not None:
+        _show_hips_layer(window, hips_survey, *layer)
+
+    window.after(
+        background.POLL_INTERVAL, partial(_poll_hips_layers, window, hips_survey)
     )
 
-    image_data, image_header = r.get()
 
-    if len(image_data.shape) > 2 and hips_survey.data_type == DataType.FITS:
-        dialogs.Messagebox.show_error(
-            "This HiPs survey does not support FITS, please select png or jpeg instead",
-            parent=None,
-            title="Incorrect Data Type",
-            alert=False,
+def _show_hips_layer(
+    window: HiPSDownloadWindow,
+    hips_survey: hips_handler.HiPsSurvey,
+    image_data: npt.ArrayLike,
+    image_header: Optional[fits.Header],
+):
+    """Show a version of a HiPs survey, in a new image the first time and replacing
+    that image's data after."""
+    image = window.image_frame
+
+    if image is None:
+        window.image_frame = _open_image(
+            image_data, image_header, hips_survey.survey, hips_survey.data_type, True
         )
+
+        # png/jpg images can't be zoomed in on past their pixels
+        if hips_survey.data_type == DataType.FITS:
+            window.image_frame.hips_detail = HiPSDetail(window.image_frame, hips_survey)
+    elif image.winfo_exists():
+        image.update_data(image_data)
+
+
+def _on_hips_downloaded(
+    window: HiPSDownloadWindow,
+    hips_survey: hips_handler.HiPsSurvey,
+    result: Tuple[npt.ArrayLike, Optional[fits.Header]],
+):
+    """Open a HiPs survey once it's downloaded, see open_hips."""
+    window.destroy()
+
+    image_data, image_header = result
+
+    _show_hips_layer(window, hips_survey, image_data, image_header)
+
+
+def _on_hips_error(
+    window: HiPSDownloadWindow,
+    hips_survey: hips_handler.HiPsSurvey,
+    error: BaseException,
+):
+    """Show why a HiPs survey couldn't be downloaded, see open_hips."""
+    window.destroy()
+
+    if isinstance(error, hips_handler.DownloadCancelled):
         return
 
-    _open_image(
-        image_data, image_header, hips_survey.survey, hips_survey.data_type, True
+    if isinstance(error, hips_metadata.InvalidSurveyRequest):
+        _show_invalid_request(error)
+        return
+
+    traceback.print_exception(error)
+    dialogs.Messagebox.show_error(
+        f"Error downloading {hips_survey.survey}, either an incorrect survey has "
+        f"been entered or the selected image is too large.\n\n{error}",
+        parent=None,
+        title="Download Failed",
+        alert=False,
+    )
+
+
+def _show_invalid_request(error: hips_metadata.InvalidSurveyRequest):
+    """Show why a HiPs survey can't be opened as it was asked for."""
+    dialogs.Messagebox.show_error(
+        str(error),
+        parent=None,
+        title="Invalid Request",
+        alert=False,
     )
 
 
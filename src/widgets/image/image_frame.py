@@ -1,29 +1,44 @@
 import tkinter as tk
+import traceback
 import warnings
-from typing import Optional
+from functools import partial
+from typing import Optional, Tuple
 
+import numpy as np
 import numpy.typing as npt
 import ttkbootstrap as tb
 from astropy import wcs
 from astropy.io import fits
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.collections import PathCollection
-from matplotlib.contour import QuadContourSet
 
 from src._overrides.matplotlib.ImageToolbar import ImageToolbar
 from src.enums import DataType, Matching, Scaling
+from src.lib import background
+from src.lib.blit_manager import BlitManager
+from src.lib.event_handler import EventHandler
+from src.lib.redraw_scheduler import RedrawScheduler
 from src.lib.util import index_default
 from src.widgets import widget_controller as wc
 from src.widgets.catalogue import catalogue
-from src.widgets.contour import contour
+from src.widgets.contour import contour, contour_geometry
+from src.widgets.contour.contour_overlay import ContourOverlay
 from src.widgets.image import fits_handler
 from src.widgets.image import image_controller as ic
-from src.widgets.image import png_handler
+from src.widgets.image import png_handler, regions
+from src.widgets.image.colour_lut import ColourLUT
+from src.widgets.image.hips_detail import HiPSDetail
 from src.widgets.image.image_context_menu import ImageContextMenu
+from src.widgets.image.image_ingest import ImageIngest
+from src.widgets.image.image_pyramid import Extent, ImagePyramid, Region
+from src.widgets.image.image_statistics import ImageStatistics
 from src.widgets.renderer import histogram
 
 warnings.simplefilter(action="ignore", category=wcs.FITSFixedWarning)
 
+# The colour regions are outlined in
+REGION_COLOUR = "cyan"
+
 
 class ImageFrame(tb.Frame):
     """The frame containing the matplotlib plot and the toolbar."""
@@ -37,6 +52,7 @@ class ImageFrame(tb.Frame):
         file_name: str,
         data_type: DataType,
         from_hips: bool,
+        file_path: Optional[str] = None,
     ):
         """Construct an ImageFrame.
 
@@ -44,11 +60,15 @@ class ImageFrame(tb.Frame):
             In practice, this is either a StandaloneImage or the MainWindow.
         :param root: the main window
         :param image_data: numpy array with the image's data (fits image or png image). Note that this should
-            be float[][].
+            be float[][]. For .fits files this is usually memory-mapped (see fits_handler.open_fits_file),
+            and the frame holding on to it is what keeps the mapping alive.
         :param image_data_header: HDU header for the .fits file. None for png/jpg.
         :param file_name: the name of the file where the data came from. HiPs survey name for hips
         :param data_type: the type of the data in image_data.
         :param from_hips: if the data came from a HiPs survey
+        :param file_path: the path of the file the data came from. The statistics of the
+            image are saved alongside it (see ImageStatistics). None if it didn't come
+            from a file.
         """
 
         super().__init__(parent)
@@ -67,56 +87,290 @@ class ImageFrame(tb.Frame):
         self.data_type = data_type
         self.from_hips = from_hips
 
+        # shared by everything which needs (e.g.) the mean or percentiles of the image
+        self.statistics = ImageStatistics(image_data, file_path)
+
         # Default render config
         self.colour_map = "inferno"
         self.scaling = Scaling.LINEAR
-        self.cached_percentiles = fits_handler.get_percentiles(image_data)
+        # these are all filled in as the image loads, see show
+        self.cached_percentiles = None
         self.selected_percentile = "99.5"
-        self.set_selected_percentile(self.selected_percentile)
+        self.vmin = None
+        self.vmax = None
         self.grid_lines = False
 
         self.matched = {matching.value: False for matching in Matching}
 
-        if self.image_data_header is not None:
-            self.image_wcs = wcs.WCS(self.image_data_header).celestial
-
         self.catalogue_set: Optional[PathCollection] = None
-        self.contour_set: Optional[QuadContourSet] = None
+        # the regions drawn with the toolbar's region tool, and the patch of each
+        self.regions: list[regions.Region] = []
+        self.region_patches = []
+        self.on_regions_change_eh = EventHandler()
+        self.contour_set: Optional[ContourOverlay] = None
+
+        self.image_pyramid: Optional[ImagePyramid] = None
+        self.view_region: Optional[Region] = None
+        # for (fits) images from a HiPs survey, downloads the view again when zoomed
+        # in or panned past the edges, see image_controller.open_hips
+        self.hips_detail: Optional[HiPSDetail] = None
+
+        # what's currently drawn, as (data, extent), and that data quantised for
+        # the colour LUT (see set_display)
+        self.colour_lut: Optional[ColourLUT] = None
+        self.display: Optional[Tuple[npt.ArrayLike, Extent]] = None
+        self.display_index: Optional[npt.ArrayLike] = None
+
+        self.histogram: Optional[histogram.HistogramPyramid] = None
+        self.histogram_range = None
+
+        # Whether the figure is up yet. Until it is, the frame shows a placeholder and
+        # shouldn't be touched by anything else (see image_controller._open_image)
+        self.ready = False
+        self.on_ready_eh = EventHandler()
+
+        self.placeholder = tb.Frame(self)
+        self.placeholder.grid(column=0, row=0, sticky=tk.NSEW, padx=10, pady=10)
+        self.placeholder.rowconfigure((0, 1), weight=1)
+        self.placeholder.columnconfigure(0, weight=1)
+
+        self.placeholder_label = tb.Label(self.placeholder, text=f"Loading {file_name}")
+        self.placeholder_label.grid(column=0, row=0, sticky=tk.S, padx=10, pady=10)
+
+        self.placeholder_progress = tb.Progressbar(
+            self.placeholder, mode="indeterminate", bootstyle="info-striped"
+        )
+        self.placeholder_progress.grid(column=0, row=1, sticky=tk.N, padx=10, pady=10)
+        self.placeholder_progress.start()
+
+        self.ingest = ImageIngest(self)
+        self.ingest.start()
+
+    def show(
+        self,
+        percentiles,
+        image_wcs: Optional[wcs.WCS] = None,
+        preview: Optional[Tuple[npt.ArrayLike, Extent]] = None,
+        sample: Optional[npt.ArrayLike] = None,
+    ):
+        """Replace the placeholder with the figure, once the image has loaded enough.
+
+        Called by the ImageIngest.
+
+        :param percentiles: the (possibly approximate) percentiles of the image
+        :param image_wcs: the wcs of the image. None for png/jpg.
+        :param preview: a tuple of (data, extent) to draw until the pyramid is built.
+            None for png/jpg.
+        :param sample: a sample of the image data, to build the colour LUT from.
+            None for png/jpg.
+        """
+        self.cached_percentiles = percentiles
+        self.set_selected_percentile(self.selected_percentile)
+        self.image_wcs = image_wcs
+
+        if self.data_type == DataType.FITS:
+            self.colour_lut = ColourLUT(sample, *self.cached_percentiles["100"])
+            self.colour_lut.set_render(
+                self.colour_map, self.vmin, self.vmax, self.scaling
+            )
+
+            self.display = preview
+            self.display_index = self.colour_lut.quantise(preview[0])
 
-        if data_type == DataType.FITS:
             self.fig, self.image, self.limits = fits_handler.create_figure_fits(
                 self.image_data,
                 self.image_wcs,
-                self.colour_map,
-                self.vmin,
-                self.vmax,
-                self.scaling,
+                self.colour_lut,
+                self.display_index,
+                preview[1],
             )
 
             self.original_limits = self.limits
 
-            min_value, max_value = self.cached_percentiles["100"]
-
-            self.histo_counts, self.histo_bins = histogram.create_histogram_data(
-                self.image_data, min_value, max_value
-            )
-
             self.fig.canvas.mpl_connect("button_press_event", self.on_click)
             self.coord_matching_cid = None
         else:
             self.fig, self.image = png_handler.create_figure_png(self.image_data)
 
+        self.placeholder.destroy()
+
         self.canvas = FigureCanvasTkAgg(self.fig, master=self)
         self.canvas.get_tk_widget().grid(
             column=0, row=0, sticky=tk.NSEW, padx=10, pady=10
         )
         self.canvas.draw()
+        self.redraw = RedrawScheduler(self.canvas)
+        self.blit = BlitManager(self.canvas)
 
-        self.toolbar = ImageToolbar(self.canvas, self, False)
+        self.toolbar = ImageToolbar(self.canvas, self, False, self.blit)
         self.toolbar.grid(column=0, row=1, sticky=tk.NSEW, padx=10, pady=10)
 
         self.toolbar.update()
 
+        self.ready = True
+        self.on_ready_eh.invoke(self)
+
+    def destroy(self):
+        if self.hips_detail is not None:
+            self.hips_detail.cancel()
+
+        super().destroy()
+
+    def show_error(self, error: BaseException):
+        """Show that the image failed to load on the placeholder."""
+        traceback.print_exception(error)
+
+        if self.ready:
+            return
+
+        self.placeholder_progress.stop()
+        self.placeholder_label.configure(
+            text=f"Unable to open {self.file_name}: {error}", bootstyle="danger"
+        )
+
+    def update_data(self, image_data: npt.ArrayLike):
+        """Replace the image data with a new version of the same image, i.e. a finer
+        one as a HiPs survey streams in.
+
+        The data is copied in to the existing array, so everything holding on to it
+        sees the new data, then everything calculated from it is recalculated.
+
+        :param image_data: the new data, the same shape as the current data
+        """
+        np.copyto(self.image_data, image_data)
+
+        # contours are cached by the identity of the data, which hasn't changed
+        contour_geometry.forget(self.image_data)
+        self.statistics.invalidate()
+        self.ingest.refresh()
+
+    def set_image_pyramid(self, image_pyramid: ImagePyramid):
+        """Start drawing the image from the given (built) pyramid, in place of the preview.
+
+        :param image_pyramid: the pyramid of the image data
+        """
+        if self.image_pyramid is None:
+            ax = self.fig.axes[0]
+            ax.callbacks.connect("xlim_changed", self.update_view)
+            ax.callbacks.connect("ylim_changed", self.update_view)
+            self.canvas.mpl_connect("resize_event", self.update_view)
+
+        self.image_pyramid = image_pyramid
+
+        # a new pyramid (i.e. of new data) needs drawing even if the view hasn't moved
+        self.view_region = None
+        if self.hips_detail is not None:
+            self.hips_detail.shown = None
+        self.update_view()
+        self.redraw.request()
+
+    def set_cached_percentiles(self, percentiles):
+        """Replace the cached percentiles, i.e. once the exact ones have been calculated.
+
+        Re-renders the image, and recalculates the histogram (in the background) if
+        the range of the data changed.
+
+        :param percentiles: a tuple of (percentiles, error) from fits_handler.get_percentiles
+        """
+        cached_percentiles, _error = percentiles
+        self.cached_percentiles = cached_percentiles
+
+        if self.data_type != DataType.FITS:
+            return
+
+        if self.cached_percentiles["100"] != self.colour_lut.range:
+            # the colour LUT only covers the range it was built with
+            self.colour_lut.set_range(*self.cached_percentiles["100"])
+            self.set_display(*self.display)
+
+        if self.selected_percentile != "Custom":
+            self.set_selected_percentile(self.selected_percentile)
+
+        self.update_norm()
+
+        if self.cached_percentiles["100"] != self.histogram_range:
+            self.update_histogram()
+        else:
+            self.update_renderer()
+
+    def update_histogram(self):
+        """Recalculate the histogram (in the background) over the range of the data."""
+        self.histogram_range = self.cached_percentiles["100"]
+
+        background.run_in_background(
+            self,
+            histogram.create_histogram_data,
+            self.image_data,
+            *self.histogram_range,
+            callback=partial(self.set_histogram_data, self.histogram_range),
+        )
+
+    def set_histogram_data(
+        self, histogram_range, histogram_data: histogram.HistogramPyramid
+    ):
+        """Replace the histogram of the image.
+
+        :param histogram_range: the range the histogram was calculated over. If the
+            range has changed since, the histogram is out of date and is dropped.
+        :param histogram_data: the HistogramPyramid from histogram.create_histogram_data
+        """
+        if histogram_range != self.histogram_range:
+            return
+
+        self.histogram = histogram_data
+        self.update_renderer()
+
+    def update_renderer(self):
+        """Refresh the renderer widget, if it's open and showing this image."""
+        renderer = wc.get_widget(wc.Widget.RENDERER)
+
+        if renderer is not None and self.is_selected():
+            renderer.on_image_change(self)
+
+    def update_view(self, *_args):
+        """Swap in the level of the image pyramid that matches the current view.
+
+        Called whenever the limits of the axes or the size of the canvas change.
+        """
+        if self.hips_detail is not None and self.hips_detail.update():
+            return
+
+        region = fits_handler.get_view_region(self.image, self.image_pyramid)
+        if region == self.view_region:
+            return
+
+        self.view_region = region
+        self.set_display(*self.image_pyramid.get_region(region))
+
+    def show_detail(self, data: npt.ArrayLike, extent: Extent):
+        """Draw more of the current view than the image itself can, i.e. blocks
+        downloaded by the HiPSDetail.
+
+        :param data: the data to draw
+        :param extent: where to draw it, in pixels of the image data
+        """
+        # so the pyramid is drawn again once the view moves off it
+        self.view_region = None
+
+        self.set_display(data, extent)
+        self.redraw.request()
+
+    def set_display(self, data: npt.ArrayLike, extent: Extent):
+        """Draw the given data (i.e. a region of the pyramid) on the image.
+
+        The data is quantised for the colour LUT here, once, so that changing the
+        render config after only needs to re-colour it (see update_norm).
+
+        :param data: the data to draw
+        :param extent: where to draw it, in pixels of the image data
+        """
+        self.display = (data, extent)
+        self.display_index = self.colour_lut.quantise(data)
+
+        fits_handler.set_image_display(
+            self.image, self.colour_lut, self.display_index, extent
+        )
+
     def is_matched(self, matching: Matching) -> bool:
         """Is the image currently being matched on this dimension?"""
 
@@ -179,19 +433,23 @@ class ImageFrame(tb.Frame):
     def set_colour_map(self, colour_map):
         self.colour_map = colour_map
 
-    def update_norm(self):
-        fits_handler.update_image_norm(
+    def update_render(self):
+        fits_handler.update_image_render(
             self.image,
-            self.image_data,
+            self.colour_lut,
+            self.display_index,
+            self.colour_map,
             self.vmin,
             self.vmax,
             self.scaling,
         )
-        self.canvas.draw()
+        self.redraw.request()
+
+    def update_norm(self):
+        self.update_render()
 
     def update_colour_map(self):
-        fits_handler.update_image_cmap(self.image, self.colour_map)
-        self.canvas.draw()
+        self.update_render()
 
     def match_render(self, source_image=None):
         if source_image is None:
@@ -219,24 +477,56 @@ class ImageFrame(tb.Frame):
         self.catalogue_set = catalogue.draw_catalogue(
             self.fig, self.catalogue_set, options
         )
-        self.canvas.draw()
+        # the markers are an overlay, so the image under them isn't redrawn
+        self.blit.add_artist(self.catalogue_set)
+        self.blit.update()
 
     def clear_catalogue(self):
         """Clear the catalogue on this image."""
         self.catalogue_set = catalogue.clear_catalogue(self.catalogue_set)
-        self.canvas.draw()
+        self.blit.update()
+
+    def add_region(self, region: regions.Region):
+        """Add a region (i.e. drawn with the region tool) to measure statistics over.
+
+        :param region: the region, in the pixel co-ordinates of the image
+        """
+        self.regions.append(region)
+
+        patch = region.patch(fill=False, edgecolor=REGION_COLOUR, linewidth=1.5)
+        self.fig.axes[0].add_patch(patch)
+        self.region_patches.append(patch)
+
+        # the regions are an overlay, like the catalogue
+        self.blit.add_artist(patch)
+        self.blit.update()
+
+        self.on_regions_change_eh.invoke(self)
+
+    def clear_regions(self):
+        """Remove all the regions on this image."""
+        for patch in self.region_patches:
+            patch.remove()
+
+        self.regions = []
+        self.region_patches = []
+        self.blit.update()
+
+        self.on_regions_change_eh.invoke(self)
 
     def update_contours(self, options: contour.RenderContourOptions):
         """Draw the contours on this image with the given options and data.
 
         :param options: the options for the contour drawing"""
-        self.contour_set = contour.update_contours(self.fig, self.contour_set, options)
-        self.canvas.draw()
+        self.contour_set = contour.update_contours(
+            self.fig, self.contour_set, options, self, self.redraw.request
+        )
+        self.redraw.request()
 
     def clear_contours(self):
         """Clear the contours on this image."""
         self.contour_set = contour.clear_contours(self.contour_set)
-        self.canvas.draw()
+        self.redraw.request()
 
     def set_limits(self, limits):
         if not self.data_type == DataType.FITS:
@@ -246,7 +536,7 @@ class ImageFrame(tb.Frame):
         self.toolbar.update_stack()
 
         fits_handler.set_limits(self.fig, self.image_wcs, self.limits)
-        self.canvas.draw()
+        self.redraw.request()
 
     def add_coords_event(self):
         self.coord_matching_cid = self.fig.canvas.callbacks.connect(
@@ -256,6 +546,11 @@ class ImageFrame(tb.Frame):
     def remove_coords_event(self):
         self.fig.canvas.callbacks.disconnect(self.coord_matching_cid)
 
+    def on_navigate(self):
+        """Called by the toolbar once it's panned or zoomed the view."""
+        if self.hips_detail is not None:
+            self.hips_detail.prefetch()
+
     def on_lims_change(self, event):
         if (
             self.fig.canvas.toolbar.mode == "pan/zoom"
@@ -284,7 +579,7 @@ class ImageFrame(tb.Frame):
 
         self.grid_lines = visible
         fits_handler.set_grid_lines(self.fig, visible)
-        self.canvas.draw()
+        self.redraw.request()
         return visible
 
     def on_click(self, event):
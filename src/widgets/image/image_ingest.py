@@ -0,0 +1,175 @@
+from functools import partial
+from typing import TYPE_CHECKING, Callable, Dict, Tuple
+
+from astropy import wcs
+from astropy.io import fits
+
+from src import constants
+from src.enums import DataType
+from src.lib import background, percentiles
+from src.widgets.image import colour_lut, image_pyramid
+from src.widgets.image.image_pyramid import ImagePyramid
+from src.widgets.image.image_statistics import ImageStatistics
+
+if TYPE_CHECKING:
+    from src.widgets.image.image_frame import ImageFrame
+
+# name of a stage -> (the function to run, *the args to run it with)
+Stages = Dict[str, Tuple]
+
+
+def decode_wcs(image_data_header: fits.Header) -> wcs.WCS:
+    """Build the (celestial) WCS of an image from its header."""
+    return wcs.WCS(image_data_header).celestial
+
+
+def load_percentiles(statistics: ImageStatistics, max_error: float):
+    """Get the percentiles of an image, from its saved statistics if there are any."""
+    statistics.load()
+    return statistics.get_percentiles(max_error)
+
+
+def build_pyramid(image_data) -> ImagePyramid:
+    """Build the ImagePyramid of an image."""
+    pyramid = ImagePyramid(image_data)
+    pyramid.build()
+    return pyramid
+
+
+class ImageIngest:
+    """Loads an ImageFrame in stages on the background worker pool.
+
+    The stages only ever touch the image data, and hand their results back to the
+    frame on the Tk thread (see background.run_in_background), so the GUI stays
+    responsive while a large image loads.
+
+    1. decode (the WCS), statistics (saved or sampled percentiles), preview (a decimated
+       copy of the image) and sample (for the colour LUT) run at the same time. Once
+       they're all done the frame swaps its placeholder for the figure, drawn from
+       the preview.
+    2. then the pyramid, histogram and exact percentiles run at the same time, each
+       filling in the frame as it finishes.
+
+    If the image data changes after (see refresh), everything from 2. runs again.
+    """
+
+    def __init__(self, image_frame: "ImageFrame"):
+        """Construct an ImageIngest.
+
+        :param image_frame: the frame to load. Its image_data and headers need to be set.
+        """
+        self.image_frame = image_frame
+        self.results = {}
+
+        # incremented each time the data changes, so results for old data are dropped
+        self.generation = 0
+
+    def start(self):
+        """Start loading the frame."""
+        frame = self.image_frame
+
+        stages = {
+            "statistics": (
+                load_percentiles,
+                frame.statistics,
+                constants.PERCENTILE_MAX_ERROR,
+            ),
+        }
+
+        if frame.data_type == DataType.FITS:
+            stages["decode"] = (decode_wcs, frame.image_data_header)
+            stages["preview"] = (image_pyramid.preview, frame.image_data)
+            stages["sample"] = (
+                percentiles.sample_data,
+                frame.image_data,
+                colour_lut.SAMPLES,
+            )
+
+        self._run_all(stages, self._on_preview_ready)
+
+    def _run_all(self, stages: Stages, callback: Callable[[], None]):
+        """Run all the stages at once, calling callback once they're all done.
+
+        The result of each stage is stored in self.results under its name.
+        """
+        pending = set(stages)
+
+        for name, (func, *args) in stages.items():
+            background.run_in_background(
+                self.image_frame,
+                func,
+                *args,
+                callback=partial(self._on_stage_done, name, pending, callback),
+                error_callback=self.image_frame.show_error,
+            )
+
+    def _on_stage_done(self, name, pending, callback, result):
+        self.results[name] = result
+        pending.discard(name)
+
+        if len(pending) == 0:
+            callback()
+
+    def _on_preview_ready(self):
+        frame = self.image_frame
+        cached_percentiles, percentile_error = self.results["statistics"]
+
+        frame.show(
+            cached_percentiles,
+            self.results.get("decode"),
+            self.results.get("preview"),
+            self.results.get("sample"),
+        )
+
+        if frame.data_type != DataType.FITS:
+            return
+
+        frame.update_histogram()
+        self._build(exact_percentiles=percentile_error > 0)
+
+    def refresh(self):
+        """Recalculate everything from the image data, once it has changed in place
+        (see ImageFrame.update_data)."""
+        frame = self.image_frame
+        self.generation += 1
+
+        if not frame.ready:
+            # everything is calculated once it's shown, from the data as it is then
+            return
+
+        if frame.data_type != DataType.FITS:
+            frame.image.set_data(frame.image_data)
+            frame.redraw.request()
+            return
+
+        # the histogram is recalculated once the new range is known
+        frame.histogram_range = None
+        self._build(exact_percentiles=True)
+
+    def _build(self, exact_percentiles: bool):
+        """Build the pyramid and (if needed) the exact percentiles in the background."""
+        frame = self.image_frame
+
+        background.run_in_background(
+            frame,
+            build_pyramid,
+            frame.image_data,
+            callback=partial(
+                self._if_current, self.generation, frame.set_image_pyramid
+            ),
+        )
+
+        if exact_percentiles:
+            # the exact ones come from the full statistics pass, so everything
+            # else needing statistics has them at the same time
+            background.run_in_background(
+                frame,
+                frame.statistics.get_percentiles,
+                callback=partial(
+                    self._if_current, self.generation, frame.set_cached_percentiles
+                ),
+            )
+
+    def _if_current(self, generation: int, callback: Callable, result):
+        if generation == self.generation:
+            callback(result)
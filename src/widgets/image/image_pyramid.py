@@ -0,0 +1,279 @@
+import math
+import warnings
+from collections import OrderedDict
+from typing import Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+# The size (in pixels, at whatever level) of the tiles the pyramid is cut into
+TILE_SIZE = 512
+# Levels which are at most this big in both dimensions are kept in memory in full,
+#   anything finer than that is built tile-by-tile when it's actually looked at
+MAX_STORED_SIZE = 4096
+# How many of the on-demand tiles to keep around
+TILE_CACHE_SIZE = 64
+# Roughly how many pixels of the full resolution data to read in at once when building
+CHUNK_SIZE = 2**24
+
+# (left, right, bottom, top) in full resolution pixel co-ordinates, as imshow wants
+Extent = Tuple[float, float, float, float]
+# (level, first tile column, last tile column, first tile row, last tile row)
+Region = Tuple[int, int, int, int, int]
+
+
+def block_reduce(
+    image_data: npt.ArrayLike, factor: int, method: str = "mean"
+) -> npt.ArrayLike:
+    """Downsample image_data by factor in both dimensions, ignoring NaNs.
+
+    The edges are padded with NaN when the shape isn't a multiple of factor, so the
+    partial blocks there are reduced over whatever pixels they do have.
+
+    :param image_data: the data to downsample. Should be float[][].
+    :param factor: how many pixels (in each dimension) go into one output pixel
+    :param method: either "mean" or "max"
+
+    :return: the downsampled data, as float32
+    """
+
+    data = np.asarray(image_data, dtype=np.float32)
+    if factor == 1:
+        return data
+
+    height, width = data.shape
+    pad_y, pad_x = -height % factor, -width % factor
+    if pad_y or pad_x:
+        data = np.pad(data, ((0, pad_y), (0, pad_x)), constant_values=np.nan)
+
+    blocks = data.reshape(
+        data.shape[0] // factor, factor, data.shape[1] // factor, factor
+    )
+
+    # all-NaN blocks are expected (blanked edges of mosaics), and are just NaN
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+
+        if method == "max":
+            return np.nanmax(blocks, axis=(1, 3))
+
+        return np.nanmean(blocks, axis=(1, 3))
+
+
+class ImagePyramid:
+    """A mipmap pyramid of an image, for drawing it at the resolution of the screen.
+
+    Level 0 is the image data itself, and each level after that is half the size of
+    the last (so level k is downsampled by 2**k). The coarse levels are built in one
+    pass and kept in memory, and the finer levels are built per-tile as they're
+    needed, so a zoomed in view only ever reads the part of the data it's showing.
+    """
+
+    def __init__(
+        self,
+        image_data: npt.ArrayLike,
+        method: str = "mean",
+        tile_size: int = TILE_SIZE,
+        max_stored_size: int = MAX_STORED_SIZE,
+    ):
+        """Construct an ImagePyramid. Call build before getting any regions from it.
+
+        :param image_data: the full resolution data, this isn't copied. Should be float[][].
+        :param method: how to downsample, "mean" or "max"
+        :param tile_size: the size of the tiles the pyramid is cut into
+        :param max_stored_size: the largest level which is kept in memory in full
+        """
+
+        self.image_data = image_data
+        self.method = method
+        self.tile_size = tile_size
+        self.shape = image_data.shape[:2]
+
+        largest = max(self.shape)
+        # the level at which the whole image fits in to a single tile
+        self.max_level = max(0, math.ceil(math.log2(largest / tile_size)))
+        # the finest level which is kept in memory
+        self.stored_level = min(
+            self.max_level, max(0, math.ceil(math.log2(largest / max_stored_size)))
+        )
+
+        self._levels = {0: image_data}
+        self._tiles = OrderedDict()
+
+    @property
+    def built(self) -> bool:
+        return self.max_level in self._levels
+
+    def build(self):
+        """Build the stored levels of the pyramid.
+
+        This reads all of the data once, in chunks of rows, so it never needs more
+        than a chunk of the full resolution data in memory.
+        """
+
+        if self.built:
+            return
+
+        factor = 2**self.stored_level
+
+        if factor > 1:
+            width = self.shape[1]
+            rows = factor * max(1, CHUNK_SIZE // (factor * width))
+
+            self._levels[self.stored_level] = np.concatenate(
+                [
+                    block_reduce(self.image_data[i : i + rows], factor, self.method)
+                    for i in range(0, self.shape[0], rows)
+                ]
+            )
+
+        for level in range(self.stored_level + 1, self.max_level + 1):
+            self._levels[level] = block_reduce(self._levels[level - 1], 2, self.method)
+
+    def level_shape(self, level: int) -> Tuple[int, int]:
+        """The shape of the data at the given level."""
+
+        factor = 2**level
+        return -(-self.shape[0] // factor), -(-self.shape[1] // factor)
+
+    def overview(self) -> Tuple[npt.ArrayLike, Extent]:
+        """Get the coarsest level of the pyramid, which is the whole image in one tile."""
+
+        return self.get_region(self.region_for_view(*self._bounds(), 1, 1))
+
+    def region_for_view(
+        self,
+        xlim_low: float,
+        xlim_high: float,
+        ylim_low: float,
+        ylim_high: float,
+        width_px: float,
+        height_px: float,
+    ) -> Region:
+        """Work out which level and tiles are needed to draw the given view.
+
+        The level is the coarsest one that still has at least one data pixel per
+        screen pixel.
+
+        :param xlim_low: the lower x limit of the view, in full resolution pixels
+        :param xlim_high: the upper x limit of the view, in full resolution pixels
+        :param ylim_low: the lower y limit of the view, in full resolution pixels
+        :param ylim_high: the upper y limit of the view, in full resolution pixels
+        :param width_px: the width of the view on the screen
+        :param height_px: the height of the view on the screen
+
+        :return: the Region to draw
+        """
+
+        x0, x1 = sorted((xlim_low, xlim_high))
+        y0, y1 = sorted((ylim_low, ylim_high))
+
+        density = max((x1 - x0) / max(width_px, 1), (y1 - y0) / max(height_px, 1))
+        level = 0 if density <= 1 else int(math.log2(density))
+        level = min(level, self.max_level)
+
+        # which tiles of that level the view covers, clamped to the image
+        span = self.tile_size * 2**level
+        rows, cols = self.shape
+
+        tx0 = int(np.clip((x0 + 0.5) // span, 0, (cols - 1) // span))
+        tx1 = int(np.clip((x1 + 0.5) // span, 0, (cols - 1) // span))
+        ty0 = int(np.clip((y0 + 0.5) // span, 0, (rows - 1) // span))
+        ty1 = int(np.clip((y1 + 0.5) // span, 0, (rows - 1) // span))
+
+        return level, tx0, tx1, ty0, ty1
+
+    def get_region(self, region: Region) -> Tuple[npt.ArrayLike, Extent]:
+        """Get the data for a Region (see region_for_view).
+
+        :param region: the region to get
+
+        :return: a tuple of the data at the region's level, and where it should be drawn
+            (the extent) in full resolution pixel co-ordinates
+        """
+
+        level, tx0, tx1, ty0, ty1 = region
+        size = self.tile_size
+        height, width = self.level_shape(level)
+
+        x0, x1 = tx0 * size, min((tx1 + 1) * size, width)
+        y0, y1 = ty0 * size, min((ty1 + 1) * size, height)
+
+        if level in self._levels:
+            data = np.asarray(self._levels[level][y0:y1, x0:x1])
+        else:
+            data = np.block(
+                [
+                    [self._get_tile(level, tx, ty) for tx in range(tx0, tx1 + 1)]
+                    for ty in range(ty0, ty1 + 1)
+                ]
+            )
+
+        factor = 2**level
+        extent = (
+            x0 * factor - 0.5,
+            x0 * factor + data.shape[1] * factor - 0.5,
+            y0 * factor - 0.5,
+            y0 * factor + data.shape[0] * factor - 0.5,
+        )
+
+        return data, extent
+
+    def _get_tile(self, level: int, tx: int, ty: int) -> npt.ArrayLike:
+        """Get a single tile of a level which isn't stored, building it if needed."""
+
+        key = (level, tx, ty)
+
+        if key in self._tiles:
+            self._tiles.move_to_end(key)
+            return self._tiles[key]
+
+        span = self.tile_size * 2**level
+        tile = block_reduce(
+            self.image_data[ty * span : (ty + 1) * span, tx * span : (tx + 1) * span],
+            2**level,
+            self.method,
+        )
+
+        self._tiles[key] = tile
+        if len(self._tiles) > TILE_CACHE_SIZE:
+            self._tiles.popitem(last=False)
+
+        return tile
+
+    def _bounds(self) -> Tuple[float, float, float, float]:
+        rows, cols = self.shape
+        return -0.5, cols - 0.5, -0.5, rows - 0.5
+
+
+def preview(
+    image_data: npt.ArrayLike, max_size: int = TILE_SIZE * 2
+) -> Tuple[npt.ArrayLike, Extent]:
+    """Get a quick, decimated copy of image_data to show while the pyramid is built.
+
+    This just takes every n-th pixel (rather than averaging), so only every n-th row
+    has to be read from disk. The pixels taken are the middle of each n by n block,
+    and are drawn centred on where they are in the image.
+
+    :param image_data: the full resolution data. Should be float[][].
+    :param max_size: the largest the preview can be in either dimension
+
+    :return: a tuple of the preview data and the extent to draw it at
+    """
+
+    rows, cols = image_data.shape[:2]
+    step = max(1, math.ceil(max(rows, cols) / max_size))
+
+    offset = step // 2
+    data = np.asarray(image_data[offset::step, offset::step], dtype=np.float32)
+
+    # pixel i is at offset + i * step, and covers step pixels either side of that
+    start = offset - step / 2
+    extent = (
+        start,
+        start + data.shape[1] * step,
+        start,
+        start + data.shape[0] * step,
+    )
+
+    return data, extent
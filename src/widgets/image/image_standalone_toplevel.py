@@ -30,6 +30,7 @@ class StandaloneImage(tk.Toplevel):
         file_name: str,
         data_type: DataType,
         from_hips: bool,
+        file_path: Optional[str] = None,
     ):
         """Construct a StandaloneImage.
 
@@ -40,6 +41,7 @@ class StandaloneImage(tk.Toplevel):
         :param file_name: the name of the file where the data came from. HiPs survey name for hips
         :param data_type: the type of the data in image_data.
         :param from_hips: if the data came from a HiPs survey
+        :param file_path: the path of the file the data came from, if any
         """
 
         super().__init__(root)
@@ -64,6 +66,7 @@ class StandaloneImage(tk.Toplevel):
             file_name,
             data_type,
             from_hips,
+            file_path,
         )
 
         self.menu = StandaloneImageMenuBar(self)
@@ -0,0 +1,227 @@
+import hashlib
+import json
+import math
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import numpy.typing as npt
+
+from src.lib import stats
+from src.widgets.image import fits_handler
+
+# Bump whenever what's saved changes, so old files are ignored
+VERSION = 1
+# Where the statistics of files are saved between runs, as <hash of the path>.json
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "emu-viewer", "statistics")
+
+
+class ImageStatistics:
+    """The statistics of an image, calculated once and shared by everything that needs them.
+
+    The summary (count, NaN count, sum, mean, standard deviation, min, max and exact
+    percentiles) is calculated in a single chunked pass over the data, and everything
+    is kept once it's calculated, so after the first time any statistic is just a
+    lookup. When the image came from a file, the statistics are saved (in cache_dir)
+    and loaded again the next time it's opened, as long as the file hasn't changed.
+
+    Calculating is slow for large images so is intended to be done in the background
+    (see ImageIngest). Only calculating takes the lock: values is replaced rather than
+    changed, so looking up (get) and invalidating never wait on a calculation.
+    """
+
+    def __init__(
+        self,
+        image_data: npt.ArrayLike,
+        file_path: Optional[str] = None,
+        cache_dir: str = CACHE_DIR,
+    ):
+        """Construct an ImageStatistics.
+
+        :param image_data: the data. Should be float[][].
+        :param file_path: the file image_data came from, to save the statistics for.
+            None to not save them.
+        :param cache_dir: the directory to save them in, created if needed
+        """
+
+        self.image_data = image_data
+        self.file_path = file_path
+        self.cache_dir = cache_dir
+        self.values: Dict[str, Any] = {}
+
+        # bumped whenever the data changes, so calculations of the old data are
+        # thrown away rather than kept
+        self.generation = 0
+
+        # only one thing calculates at once, anything else waiting on it then
+        # just uses the result
+        self._lock = threading.Lock()
+
+    def get(self, name: str, default=None):
+        """Get a statistic if it has been calculated, without calculating it."""
+        return self.values.get(name, default)
+
+    def invalidate(self):
+        """Forget everything, i.e. once the data has changed. This doesn't wait for a
+        calculation in progress, its result is just dropped."""
+
+        self.generation += 1
+        self.values = {}
+
+        if self.file_path is not None:
+            try:
+                os.remove(self._saved_path())
+            except OSError:
+                pass
+
+    def _update(self, generation: int, **values) -> Dict[str, Any]:
+        """Keep values calculated from the data as of generation, if it's still the
+        current data."""
+
+        if generation != self.generation:
+            return values
+
+        self.values = {**self.values, **values}
+
+        # invalidated while they were being kept
+        if generation != self.generation:
+            self.values = {}
+            return values
+
+        self.save()
+        return self.values
+
+    def summary(self) -> Dict[str, Any]:
+        """Get the summary statistics, calculating them if they haven't been yet.
+
+        :return: a dict of count, nan_count, sum, mean, std, min, max and percentiles
+            (in the format of fits_handler.get_percentiles)
+        """
+
+        values = self.values
+        if "percentiles" in values:
+            return values
+
+        with self._lock:
+            values = self.values
+            if "percentiles" in values:
+                return values
+
+            generation = self.generation
+            moments = stats.Moments()
+            percentiles, _error = fits_handler.get_percentiles(
+                self.image_data, visit=moments.add
+            )
+
+            return self._update(
+                generation,
+                count=int(moments.count),
+                nan_count=int(moments.nan_count),
+                sum=float(moments.sum),
+                mean=float(moments.mean),
+                std=float(moments.std),
+                min=float(moments.min) if moments.count > 0 else math.nan,
+                max=float(moments.max) if moments.count > 0 else math.nan,
+                percentiles=percentiles,
+            )
+
+    def get_percentiles(
+        self, max_error: Optional[float] = None
+    ) -> Tuple[Dict[str, Tuple[float, float]], float]:
+        """Get the percentiles, see fits_handler.get_percentiles.
+
+        If the exact percentiles are already known they're used, otherwise with a
+        max_error they're estimated (and not kept).
+        """
+
+        if "percentiles" in self.values or max_error is None:
+            return self.summary()["percentiles"], 0.0
+
+        return fits_handler.get_percentiles(self.image_data, max_error)
+
+    def mean(self) -> float:
+        """The mean of the (non-NaN) data."""
+        return self.summary()["mean"]
+
+    def sigma(self) -> float:
+        """The standard deviation of the data clipped at stats.CLIP times itself, see
+        stats.clipped_sigma."""
+
+        values = self.values
+        if "sigma" in values:
+            return values["sigma"]
+
+        summary = self.summary()
+
+        with self._lock:
+            values = self.values
+            if "sigma" in values:
+                return values["sigma"]
+
+            generation = self.generation
+            sigma = float(
+                stats.clipped_sigma(
+                    self.image_data,
+                    moments_all=(summary["count"], summary["mean"], summary["std"]),
+                )
+            )
+
+            return self._update(generation, sigma=sigma)["sigma"]
+
+    def load(self) -> bool:
+        """Load the saved statistics, if there are any and they're still valid.
+
+        :return: whether any were loaded
+        """
+
+        if self.file_path is None:
+            return False
+
+        try:
+            with open(self._saved_path()) as f:
+                saved = json.load(f)
+
+            file_key = self._file_key()
+        except (OSError, ValueError):
+            return False
+
+        if saved.get("version") != VERSION or saved.get("file") != file_key:
+            return False
+
+        values = saved["values"]
+        if "percentiles" in values:
+            values["percentiles"] = {
+                percentile: tuple(value)
+                for percentile, value in values["percentiles"].items()
+            }
+
+        self.values = {**values, **self.values}
+
+        return True
+
+    def save(self):
+        """Save the statistics of the file, if there is one. Failing to save (i.e. the
+        directory is read only) is ignored, they'll just be calculated again."""
+
+        if self.file_path is None:
+            return
+
+        try:
+            saved = json.dumps(
+                {"version": VERSION, "file": self._file_key(), "values": self.values}
+            )
+
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(self._saved_path(), "w") as f:
+                f.write(saved)
+        except (OSError, TypeError, ValueError):
+            pass
+
+    def _saved_path(self) -> str:
+        name = hashlib.sha256(os.path.abspath(self.file_path).encode("utf-8"))
+        return os.path.join(self.cache_dir, name.hexdigest() + ".json")
+
+    def _file_key(self):
+        """Identifies the version of the file, so changed files aren't matched."""
+        stat = os.stat(self.file_path)
+        return [stat.st_size, stat.st_mtime_ns]
@@ -0,0 +1,209 @@
+import math
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Tuple, Union
+
+import numpy as np
+import numpy.typing as npt
+from matplotlib import patches
+from matplotlib.path import Path
+
+# How many region masks to keep around
+CACHE_SIZE = 64
+# Roughly how many pixels of a region's bounding box to test at once when rasterising
+CHUNK_SIZE = 2**22
+
+# (x min, y min, x max, y max) in pixel co-ordinates
+Bounds = Tuple[float, float, float, float]
+
+
+@dataclass(frozen=True)
+class BoxRegion:
+    """An axis aligned box, in the pixel co-ordinates of an image."""
+
+    x0: float
+    y0: float
+    x1: float
+    y1: float
+
+    kind = "Box"
+
+    def bounds(self) -> Bounds:
+        x0, x1 = sorted((self.x0, self.x1))
+        y0, y1 = sorted((self.y0, self.y1))
+        return x0, y0, x1, y1
+
+    def contains(self, x: npt.ArrayLike, y: npt.ArrayLike) -> npt.ArrayLike:
+        x0, y0, x1, y1 = self.bounds()
+        return (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+
+    def patch(self, **kwargs) -> patches.Patch:
+        x0, y0, x1, y1 = self.bounds()
+        return patches.Rectangle((x0, y0), x1 - x0, y1 - y0, **kwargs)
+
+
+@dataclass(frozen=True)
+class EllipseRegion:
+    """An axis aligned ellipse, in the pixel co-ordinates of an image."""
+
+    x: float
+    y: float
+    radius_x: float
+    radius_y: float
+
+    kind = "Ellipse"
+
+    def bounds(self) -> Bounds:
+        rx, ry = abs(self.radius_x), abs(self.radius_y)
+        return self.x - rx, self.y - ry, self.x + rx, self.y + ry
+
+    def contains(self, x: npt.ArrayLike, y: npt.ArrayLike) -> npt.ArrayLike:
+        rx, ry = abs(self.radius_x), abs(self.radius_y)
+        if rx == 0 or ry == 0:
+            return np.zeros(np.broadcast(x, y).shape, dtype=bool)
+
+        return ((x - self.x) / rx) ** 2 + ((y - self.y) / ry) ** 2 <= 1
+
+    def patch(self, **kwargs) -> patches.Patch:
+        return patches.Ellipse(
+            (self.x, self.y), 2 * abs(self.radius_x), 2 * abs(self.radius_y), **kwargs
+        )
+
+
+@dataclass(frozen=True)
+class PolygonRegion:
+    """A polygon, in the pixel co-ordinates of an image.
+
+    :param vertices: the vertices, as ((x, y), ...). The polygon is closed between the
+        last and first vertices.
+    """
+
+    vertices: Tuple[Tuple[float, float], ...]
+
+    kind = "Polygon"
+
+    def bounds(self) -> Bounds:
+        vertices = np.asarray(self.vertices)
+        return (*vertices.min(axis=0), *vertices.max(axis=0))
+
+    def contains(self, x: npt.ArrayLike, y: npt.ArrayLike) -> npt.ArrayLike:
+        x, y = np.broadcast_arrays(x, y)
+        points = np.column_stack([x.ravel(), y.ravel()])
+
+        path = Path(np.asarray(self.vertices), closed=False)
+        return path.contains_points(points).reshape(x.shape)
+
+    def patch(self, **kwargs) -> patches.Patch:
+        return patches.Polygon(np.asarray(self.vertices), closed=True, **kwargs)
+
+
+@dataclass
+class RegionMask:
+    """The pixels of an image inside a region, stored as a bit-packed mask over the
+    (clamped) bounding box of the region.
+
+    :param rows: the rows of the image the bounding box covers
+    :param cols: the columns of the image the bounding box covers
+    :param packed: the mask, flattened and packed with np.packbits
+    """
+
+    rows: slice
+    cols: slice
+    packed: npt.ArrayLike
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.rows.stop - self.rows.start, self.cols.stop - self.cols.start
+
+    def unpack(self) -> npt.ArrayLike:
+        """The mask over the bounding box, as bool[][]."""
+
+        height, width = self.shape
+        return (
+            np.unpackbits(self.packed, count=height * width)
+            .reshape(height, width)
+            .astype(bool)
+        )
+
+    def values(self, image_data: npt.ArrayLike) -> npt.ArrayLike:
+        """The values of image_data inside the region, as a 1D array.
+
+        Only the bounding box of the region is read.
+        """
+
+        return np.asarray(image_data[self.rows, self.cols])[self.unpack()]
+
+
+Region = Union[BoxRegion, EllipseRegion, PolygonRegion]
+
+# (region, image shape) -> the mask
+_cache: "OrderedDict[Tuple, RegionMask]" = OrderedDict()
+
+
+def rasterise(region: Region, shape: Tuple[int, int]) -> RegionMask:
+    """Find which pixels of an image are inside a region, see get_mask.
+
+    A pixel is inside when its centre is.
+    """
+
+    rows, cols = shape[:2]
+    x0, y0, x1, y1 = region.bounds()
+
+    # the pixels whose centres could be inside, clamped to the image
+    col_slice = slice(
+        int(np.clip(math.ceil(x0), 0, cols)), int(np.clip(math.floor(x1) + 1, 0, cols))
+    )
+    row_slice = slice(
+        int(np.clip(math.ceil(y0), 0, rows)), int(np.clip(math.floor(y1) + 1, 0, rows))
+    )
+
+    height = max(0, row_slice.stop - row_slice.start)
+    width = max(0, col_slice.stop - col_slice.start)
+    row_slice = slice(row_slice.start, row_slice.start + height)
+    col_slice = slice(col_slice.start, col_slice.start + width)
+
+    x = np.arange(col_slice.start, col_slice.stop, dtype=np.float64)
+    # rasterised in blocks of rows, so a large region never needs a full bool mask
+    # and co-ordinate grids at once
+    block = max(1, CHUNK_SIZE // max(width, 1))
+
+    blocks = []
+    for r in range(row_slice.start, row_slice.stop, block):
+        y = np.arange(r, min(r + block, row_slice.stop), dtype=np.float64)
+        blocks.append(region.contains(x[None, :], y[:, None]).ravel())
+
+    packed = np.packbits(np.concatenate(blocks)) if blocks else np.zeros(0, np.uint8)
+
+    return RegionMask(row_slice, col_slice, packed)
+
+
+def get_mask(region: Region, shape: Tuple[int, int]) -> RegionMask:
+    """Get the mask of the pixels of an image inside a region.
+
+    The mask is rasterised once and cached, so measuring a region again (i.e. after
+    the image is re-rendered, or for a different statistic) only needs to reduce over
+    the pixels in its bounding box.
+
+    :param region: the region, a BoxRegion, EllipseRegion or PolygonRegion
+    :param shape: the shape of the image data
+
+    :return: the mask
+    """
+
+    key = (region, tuple(shape[:2]))
+
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+
+    mask = rasterise(region, shape)
+
+    _cache[key] = mask
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+
+    return mask
+
+
+def clear_cache():
+    _cache.clear()
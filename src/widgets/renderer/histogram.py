@@ -1,25 +1,175 @@
-from typing import Tuple
+import math
+import os
+from functools import partial
+from multiprocessing.pool import ThreadPool
+from typing import Optional, Tuple
 
 import numpy as np
 import numpy.typing as npt
 from matplotlib.figure import Figure
 
 from src import constants
+from src.lib.util import iter_chunks
+
+# How many bins the finest level of a HistogramPyramid has
+FINE_BINS = 2**17
+# The coarsest level of a HistogramPyramid has at most this many bins
+MIN_BINS = 64
+# How many threads to bin the data with by default
+THREADS = os.cpu_count() or 1
+
+
+def _bin_chunk(
+    chunk: npt.ArrayLike, min_value: float, scale: float, bins: int
+) -> npt.ArrayLike:
+    # subtract in float64 so float32 data near the edges lands in the right bin
+    index = np.subtract(chunk, min_value, dtype=np.float64)
+    index *= scale
+
+    # NaNs fail both comparisons, so are dropped here too
+    index = index[(index >= 0) & (index <= bins)].astype(np.intp)
+    # like np.histogram, the last bin includes max_value
+    np.minimum(index, bins - 1, out=index)
+
+    return np.bincount(index, minlength=bins)
+
+
+def bin_counts(
+    image_data: npt.ArrayLike,
+    min_value: float,
+    max_value: float,
+    bins: int = FINE_BINS,
+    threads: int = THREADS,
+) -> npt.ArrayLike:
+    """Count the values of image_data into equal width bins between min_value and max_value.
+
+    Equivalent to np.histogram(image_data, bins, (min_value, max_value))[0], but done
+    in one pass over image_data in chunks, so it never holds a copy of all of it.
+
+    :param image_data: numpy array with the image's data. Note that this should be float[][].
+    :param min_value: lower bound of the histogram
+    :param max_value: upper bound of the histogram
+    :param bins: the number of bins
+    :param threads: how many threads to bin the chunks with. 1 to bin them on this thread.
+
+    :return: the count of each bin, as int64
+    """
+
+    if not (np.isfinite(min_value) and np.isfinite(max_value)):
+        raise ValueError(f"Range [{min_value}, {max_value}] is not finite")
+
+    if max_value <= min_value:
+        min_value, max_value = min_value - 0.5, max_value + 0.5
+
+    bin_chunk = partial(
+        _bin_chunk,
+        min_value=min_value,
+        scale=bins / (max_value - min_value),
+        bins=bins,
+    )
+
+    counts = np.zeros(bins, dtype=np.int64)
+
+    if threads <= 1:
+        for chunk in iter_chunks(image_data):
+            counts += bin_chunk(chunk)
+    else:
+        with ThreadPool(threads) as pool:
+            for chunk_counts in pool.imap_unordered(bin_chunk, iter_chunks(image_data)):
+                counts += chunk_counts
+
+    return counts
+
+
+class HistogramPyramid:
+    """The histogram of an image at a range of resolutions.
+
+    Level 0 is the finest, with FINE_BINS bins between the min and max of the data,
+    and each level after that sums pairs of bins of the last. This way any part of the
+    histogram can be drawn at the resolution of the screen (see counts_for_view)
+    without going back to the image data.
+    """
+
+    def __init__(self, counts: npt.ArrayLike, min_value: float, max_value: float):
+        """Construct a HistogramPyramid.
+
+        :param counts: the finest counts, from bin_counts
+        :param min_value: the lower edge of the first bin
+        :param max_value: the upper edge of the last bin
+        """
+
+        self.min_value = min_value
+        self.bin_width = (max_value - min_value) / len(counts)
+
+        self.levels = [np.asarray(counts)]
+        while len(self.levels[-1]) > MIN_BINS:
+            counts = self.levels[-1]
+            if len(counts) % 2 == 1:
+                # pad on an empty bin past the max, so there's pairs all the way up
+                counts = np.append(counts, 0)
+
+            self.levels.append(counts[0::2] + counts[1::2])
+
+    def level_for_view(self, xlim_low: float, xlim_high: float, width_px: float) -> int:
+        """The coarsest level with at least one bin per pixel over the given view."""
+
+        span = abs(xlim_high - xlim_low) / max(width_px, 1)
+        if span <= self.bin_width:
+            return 0
+
+        return min(int(math.log2(span / self.bin_width)), len(self.levels) - 1)
+
+    def counts_for_view(
+        self, xlim_low: float, xlim_high: float, width_px: float
+    ) -> Tuple[npt.ArrayLike, npt.ArrayLike]:
+        """Get the counts to draw for the given view of the histogram.
+
+        :param xlim_low: the lower x limit of the view
+        :param xlim_high: the upper x limit of the view
+        :param width_px: the width of the view on the screen
+
+        :return: tuple of (the values of the histogram, the edges of the bins), only
+            covering the view
+        """
+
+        level = self.level_for_view(xlim_low, xlim_high, width_px)
+        counts = self.levels[level]
+        bin_width = self.bin_width * 2**level
+
+        low, high = sorted((xlim_low, xlim_high))
+        start = int(np.clip((low - self.min_value) // bin_width, 0, len(counts) - 1))
+        end = int(
+            np.clip(-((self.min_value - high) // bin_width), start + 1, len(counts))
+        )
+
+        edges = self.min_value + np.arange(start, end + 1) * bin_width
+
+        return counts[start:end], edges
+
+    def range(self) -> Tuple[float, float]:
+        """The (low, high) of all of the bins."""
+
+        return self.min_value, self.min_value + self.bin_width * len(self.levels[0])
 
 
 def create_histogram_data(
     image_data: npt.ArrayLike, min_value: float, max_value: float
-) -> Tuple[npt.ArrayLike, npt.ArrayLike]:
+) -> HistogramPyramid:
     """Creates the data for the histogram from the given image_data.
 
     :param image_data: numpy array with the image's data. Note that this should be float[][].
     :param min_value: lower bound of the histogram
     :param max_value: upper bound of the histogram
 
-    :return: tuple of (the values of the histogram, the edges of the bins)
+    :return: the HistogramPyramid of the data
     """
 
-    return np.histogram(image_data, bins=20000, range=(min_value, max_value))
+    counts = bin_counts(image_data, min_value, max_value)
+
+    if max_value <= min_value:
+        min_value, max_value = min_value - 0.5, max_value + 0.5
+
+    return HistogramPyramid(counts, min_value, max_value)
 
 
 def create_histogram_graph(width_px=1, height_px=1):
@@ -56,13 +206,19 @@ def create_histogram_graph(width_px=1, height_px=1):
 
 
 def draw_histogram_graph(
-    fig: Figure, count: npt.ArrayLike, bins: npt.ArrayLike, vmin: float, vmax: float
+    fig: Figure,
+    histogram: Optional[HistogramPyramid],
+    vmin: float,
+    vmax: float,
 ):
     """Draw the histogram on the given figure, given some data
 
+    The bins are redrawn from the histogram's pyramid whenever the x limits change
+    (i.e. zooming / panning with the HistogramToolbar), at the resolution of the axes.
+
     :param fig: the figure
-    :param count: the histogram frequencies (generated via create_histogram_data)
-    :param bins: the bin edges (generated via create_histogram_data)
+    :param histogram: the histogram (generated via create_histogram_data).
+        None if it's still being calculated, in which case only the lines are drawn.
     :param vmin: the set vmin value, which draws a red line (representing the
         lower bound in the colour map)
     :param vmax: the set vmin value, which draws a red line (representing the
@@ -72,14 +228,39 @@ def draw_histogram_graph(
     ax.clear()
     ax.set_yscale("log")
 
-    ax.stairs(count, bins)
-    ax.autoscale(enable=True, axis="both")
+    if histogram is not None:
+        low, high = histogram.range()
+        stairs = ax.stairs(*histogram.counts_for_view(low, high, ax.bbox.width))
+        ax.set_xlim(low, high)
+        ax.autoscale(enable=True, axis="y")
+
+        # clearing the axes resets its callbacks, so this is only ever connected once
+        ax.callbacks.connect(
+            "xlim_changed", partial(update_histogram_bins, stairs, histogram)
+        )
+    else:
+        ax.autoscale(enable=True, axis="both")
 
     fig = draw_histogram_lines(fig, vmin, vmax)
 
     return fig
 
 
+def update_histogram_bins(stairs, histogram: HistogramPyramid, ax):
+    """Rebin the drawn histogram to the current view of the axes.
+
+    :param stairs: the StepPatch drawn by draw_histogram_graph
+    :param histogram: the histogram being drawn
+    :param ax: the axes the histogram is drawn on
+    """
+    low, high = ax.get_xlim()
+    counts, edges = histogram.counts_for_view(low, high, ax.bbox.width)
+
+    stairs.set_data(counts, edges)
+    ax.relim()
+    ax.autoscale_view(scalex=False)
+
+
 def draw_histogram_lines(fig: Figure, vmin: float, vmax: float):
     """Draw the vmin / vmax lines on the image.
 
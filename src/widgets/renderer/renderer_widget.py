@@ -11,6 +11,8 @@ import src.widgets.renderer.histogram_context_menu as hcm
 from src import constants
 from src._overrides.matplotlib.HistogramToolbar import HistogramToolbar
 from src.enums import DataType, Matching, Scaling
+from src.lib.blit_manager import BlitManager
+from src.lib.redraw_scheduler import RedrawScheduler
 from src.lib.util import get_size_inches
 from src.widgets.base_widget import BaseWidget
 from src.widgets.renderer import histogram
@@ -110,6 +112,9 @@ class RendererWidget(BaseWidget):
         self.canvas.get_tk_widget().grid(column=0, row=0, sticky=tk.NSEW)
         self.canvas.mpl_connect("button_press_event", self.on_histo_click)
         self.canvas.draw()
+        self.redraw = RedrawScheduler(self.canvas)
+        # the vmin / vmax lines are overlays, so moving them doesn't redraw the bins
+        self.blit = BlitManager(self.canvas)
 
         self.toolbar = HistogramToolbar(self.canvas, self.histogram_frame, pack=False)
         self.toolbar.grid(column=0, row=1, sticky=tk.NSEW, padx=10, pady=10)
@@ -133,12 +138,12 @@ class RendererWidget(BaseWidget):
 
         self.histo_fig = histogram.draw_histogram_graph(
             self.histo_fig,
-            image_selected.histo_counts,
-            image_selected.histo_bins,
+            image_selected.histogram,
             image_selected.vmin,
             image_selected.vmax,
         )
-        self.canvas.draw()
+        self.blit.add_artists(self.histo_fig.axes[0].lines)
+        self.redraw.request()
 
     def update_histogram_lines(self):
         if not self.check_if_image_selected():
@@ -151,7 +156,8 @@ class RendererWidget(BaseWidget):
             image_selected.vmin,
             image_selected.vmax,
         )
-        self.canvas.draw()
+        self.blit.add_artists(self.histo_fig.axes[0].lines)
+        self.blit.update()
 
     def render_options(self):
         render = tb.Frame(self, width=100, bootstyle="light")
@@ -0,0 +1,194 @@
+import math
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+import numpy.typing as npt
+from astropy import wcs
+from astropy.io import fits
+from astropy.wcs import utils as wcs_utils
+
+from src.lib import percentiles, stats
+from src.widgets.image import regions
+from src.widgets.image.regions import RegionMask
+
+# (rows, columns) of the image data to calculate over
+Region = Tuple[slice, slice]
+
+# The area of a gaussian beam is this times its major * minor axes (FWHM)
+BEAM_AREA_FACTOR = math.pi / (4 * math.log(2))
+
+
+@dataclass
+class RegionStatistics:
+    """The statistics of a region of an image.
+
+    :param count: the number of (non-NaN) pixels
+    :param nan_count: the number of NaN pixels
+    :param sum: the sum of the pixels, i.e. the flux sum
+    :param mean: the mean of the pixels
+    :param median: the median of the pixels
+    :param rms: the root mean square of the pixels
+    :param std: the standard deviation of the pixels
+    :param min: the smallest pixel
+    :param max: the largest pixel
+    :param beam_flux: the sum divided by the beam area (in pixels), i.e. the
+        integrated flux for an image in Jy/beam. None when the image has no beam.
+    """
+
+    count: int
+    nan_count: int
+    sum: float
+    mean: float
+    median: float
+    rms: float
+    std: float
+    min: float
+    max: float
+    beam_flux: Optional[float] = None
+
+    def rows(self) -> list[Tuple[str, str]]:
+        """The statistics as (name, formatted value) rows, for a table."""
+
+        rows = [
+            ("Pixels", str(self.count)),
+            ("NaN Pixels", str(self.nan_count)),
+            ("Flux Sum", f"{self.sum:.6g}"),
+            ("Mean", f"{self.mean:.6g}"),
+            ("Median", f"{self.median:.6g}"),
+            ("RMS", f"{self.rms:.6g}"),
+            ("Std. Dev.", f"{self.std:.6g}"),
+            ("Min", f"{self.min:.6g}"),
+            ("Max", f"{self.max:.6g}"),
+        ]
+
+        if self.beam_flux is not None:
+            rows.append(("Beam Flux", f"{self.beam_flux:.6g}"))
+
+        return rows
+
+
+def viewport_region(
+    shape: Tuple[int, int], xlim: Tuple[float, float], ylim: Tuple[float, float]
+) -> Region:
+    """The pixels of an image inside the given axes limits.
+
+    :param shape: the shape of the image data
+    :param xlim: the x limits of the axes, in pixel co-ordinates
+    :param ylim: the y limits of the axes, in pixel co-ordinates
+
+    :return: the Region, clamped to the image (so it may be empty)
+    """
+
+    rows, cols = shape[:2]
+    x0, x1 = sorted(xlim)
+    y0, y1 = sorted(ylim)
+
+    # pixel i covers i - 0.5 to i + 0.5
+    col_slice = slice(
+        int(np.clip(math.floor(x0 + 0.5), 0, cols)),
+        int(np.clip(math.ceil(x1 + 0.5), 0, cols)),
+    )
+    row_slice = slice(
+        int(np.clip(math.floor(y0 + 0.5), 0, rows)),
+        int(np.clip(math.ceil(y1 + 0.5), 0, rows)),
+    )
+
+    return row_slice, col_slice
+
+
+def beam_area(header: Optional[fits.Header], image_wcs: Optional[wcs.WCS]):
+    """The area of the beam of an image in pixels, from its BMAJ and BMIN headers.
+
+    :param header: the header of the image
+    :param image_wcs: the (celestial) wcs of the image
+
+    :return: the area, or None if the image doesn't have a beam
+    """
+
+    if header is None or image_wcs is None:
+        return None
+
+    bmaj, bmin = header.get("BMAJ"), header.get("BMIN")
+    if bmaj is None or bmin is None:
+        return None
+
+    # both are in degrees
+    pixel_area = wcs_utils.proj_plane_pixel_area(image_wcs)
+    if not pixel_area > 0:
+        return None
+
+    return BEAM_AREA_FACTOR * bmaj * bmin / pixel_area
+
+
+def compute_statistics(
+    image_data: npt.ArrayLike,
+    region: Optional[Region] = None,
+    header: Optional[fits.Header] = None,
+    image_wcs: Optional[wcs.WCS] = None,
+    mask: Optional[RegionMask] = None,
+) -> RegionStatistics:
+    """Calculate the statistics of a region of an image.
+
+    Everything is done in one chunked pass over the region (see
+    percentiles.exact_percentiles), so this works on memory-mapped data larger than
+    memory, but is slow for large regions so is intended to be run in the background.
+
+    :param image_data: the data. Should be float[][].
+    :param region: the region to calculate over, None for the whole image
+    :param header: the header of the image, for the beam
+    :param image_wcs: the wcs of the image, for the beam
+    :param mask: only calculate over the pixels in this mask (see regions.get_mask),
+        within region if given
+
+    :return: the statistics
+    """
+
+    data = image_data if region is None else image_data[region]
+    if mask is not None:
+        data = mask.values(data)
+
+    moments = stats.Moments()
+    (median,) = percentiles.exact_percentiles(data, [50], visit=moments.add)
+
+    count = moments.count
+    mean, std = moments.mean, moments.std
+
+    area = beam_area(header, image_wcs)
+
+    return RegionStatistics(
+        count=count,
+        nan_count=moments.nan_count,
+        sum=float(moments.sum),
+        mean=float(mean),
+        median=float(median),
+        # the mean of the squares is the variance plus the mean squared
+        rms=math.sqrt(std**2 + mean**2) if count > 0 else math.nan,
+        std=float(std),
+        min=float(moments.min) if count > 0 else math.nan,
+        max=float(moments.max) if count > 0 else math.nan,
+        beam_flux=None if area is None else float(moments.sum) / area,
+    )
+
+
+def compute_region_statistics(
+    image_data: npt.ArrayLike,
+    region: regions.Region,
+    header: Optional[fits.Header] = None,
+    image_wcs: Optional[wcs.WCS] = None,
+) -> RegionStatistics:
+    """Calculate the statistics of the pixels inside a drawn region of an image.
+
+    The region's mask is only rasterised the first time (see regions.get_mask), after
+    that this only reads the bounding box of the region.
+
+    :param image_data: the data. Should be float[][].
+    :param region: the region, in the pixel co-ordinates of the image
+    :param header: the header of the image, for the beam
+    :param image_wcs: the wcs of the image, for the beam
+
+    :return: the statistics
+    """
+
+    mask = regions.get_mask(region, image_data.shape)
+    return compute_statistics(image_data, None, header, image_wcs, mask)
@@ -5,7 +5,11 @@ from tkinter import ttk
 import ttkbootstrap as tb
 
 import src.widgets.image.image_controller as ic
+from src.lib import background
 from src.widgets.base_widget import BaseWidget
+from src.widgets.statistics import statistics
+
+REGIONS = ["Image", "Viewport"]
 
 
 class StatisticsWidget(BaseWidget):
@@ -18,6 +22,11 @@ class StatisticsWidget(BaseWidget):
         self.grid_columnconfigure(0, weight=1)
 
         self.image_dropdown = None
+        self.image = None
+        self.region = tk.StringVar(master=self, value=REGIONS[0])
+
+        # incremented for each calculation, so only the latest one is shown
+        self.job = 0
 
         self.stats_window()
 
@@ -27,44 +36,124 @@ class StatisticsWidget(BaseWidget):
         self.window = tb.Frame(self, bootstyle="light")
         self.window.grid(column=0, row=0, sticky=tk.NSEW, padx=10, pady=10)
 
+        self.region_options(self.window, "Region", 0, 1)
+        self.image_stats_table(self.window, 0, 2)
+
+        self.buttons = tb.Frame(self.window, bootstyle="light")
+        self.buttons.grid(column=0, columnspan=2, row=3, sticky=tk.NSEW)
+        self.buttons.columnconfigure(0, weight=1)
+
+        clear_button = tb.Button(
+            self.buttons,
+            text="Clear Regions",
+            bootstyle="warning",
+            command=self.clear_regions,
+        )
+        clear_button.grid(column=0, row=0, sticky=tk.E, padx=10, pady=10)
+
+        calculate_button = tb.Button(
+            self.buttons,
+            text="Calculate",
+            bootstyle="success",
+            command=self.calculate,
+        )
+        calculate_button.grid(column=1, row=0, sticky=tk.E, padx=10, pady=10)
+
         if ic.get_selected_image() is not None:
             if ic.get_selected_image().image_wcs is not None:
-                self.image_options(
-                    self.window,
-                    "Select Image",
-                    ic.get_selected_image().file_name,
-                    0,
-                    0,
-                )
+                self.image_options(self.window, "Select Image", 0, 0)
+                self.select_image(ic.get_selected_image())
 
-        self.image_stats_table(self.window, 0, 1)
-
-    def image_options(self, parent, text, selected_option, gridX, gridY):
+    def image_options(self, parent, text, gridX, gridY):
         label = tb.Label(parent, text=text, bootstyle="inverse-light")
         label.grid(column=gridX, row=gridY, sticky=tk.NSEW, padx=10, pady=10)
 
-        self.image_dropdown = tb.Menubutton(
-            parent, text=selected_option, bootstyle="dark"
-        )
+        self.image_dropdown = tb.Menubutton(parent, bootstyle="dark")
         self.image_dropdown.grid(
             column=gridX + 1, row=gridY, sticky=tk.NSEW, padx=10, pady=10
         )
 
         self.update_dropdown(ic.get_images())
 
+    def region_options(self, parent, text, gridX, gridY):
+        label = tb.Label(parent, text=text, bootstyle="inverse-light")
+        label.grid(column=gridX, row=gridY, sticky=tk.NSEW, padx=10, pady=10)
+
+        self.region_dropdown = tb.Menubutton(
+            parent, textvariable=self.region, bootstyle="dark"
+        )
+        self.region_dropdown.grid(
+            column=gridX + 1, row=gridY, sticky=tk.NSEW, padx=10, pady=10
+        )
+
+        self.update_region_dropdown()
+
+    def region_labels(self):
+        """The options for the region dropdown, to the drawn region (None for the
+        image and viewport)."""
+        labels = {region: None for region in REGIONS}
+
+        if self.image is not None:
+            for i, region in enumerate(self.image.regions):
+                labels[f"{region.kind} {i + 1}"] = region
+
+        return labels
+
+    def update_region_dropdown(self, *_args):
+        labels = self.region_labels()
+
+        dropdown_menu = tk.Menu(self.region_dropdown, tearoff=0)
+        for label in labels:
+            dropdown_menu.add_command(
+                label=label, command=partial(self.select_region, label)
+            )
+
+        self.region_dropdown["menu"] = dropdown_menu
+
+        if self.region.get() not in labels:
+            self.select_region(REGIONS[0])
+
+    def select_region(self, label):
+        self.region.set(label)
+        self.calculate()
+
+    def on_regions_change(self, image):
+        self.update_region_dropdown()
+
+        # show the newest region straight away
+        if len(image.regions) > 0:
+            self.select_region(list(self.region_labels())[-1])
+
+    def clear_regions(self):
+        if self.image is not None:
+            self.image.clear_regions()
+
     def update_dropdown(self, image_list):
         dropdown_menu = tk.Menu(self.image_dropdown, tearoff=0)
         for image in image_list:
             if image.image_wcs is not None:
                 dropdown_menu.add_command(
                     label=image.file_name,
-                    command=partial(self.select_image, image.file_name),
+                    command=partial(self.select_image, image),
                 )
 
         self.image_dropdown["menu"] = dropdown_menu
 
-    def select_image(self, option):
-        self.image_dropdown["text"] = option
+    def select_image(self, image):
+        self.set_image(image)
+        self.image_dropdown["text"] = image.file_name
+        self.calculate()
+
+    def set_image(self, image):
+        if self.image is not None:
+            self.image.on_regions_change_eh.remove(self.on_regions_change)
+
+        self.image = image
+
+        if self.image is not None:
+            self.image.on_regions_change_eh.add(self.on_regions_change)
+
+        self.update_region_dropdown()
 
     def image_stats_table(self, parent, gridX, gridY):
         self.table = ttk.Treeview(parent, columns=("values"))
@@ -73,22 +162,83 @@ class StatisticsWidget(BaseWidget):
         )
         self.table.heading("#0", text="Stat")
         self.table.heading("values", text="Value")
-        # self.insert_row("Flux", "850")
 
     def insert_row(self, stat, value):
-        self.table.insert("", tk.END, text=stat, values=value)
+        self.table.insert("", tk.END, text=stat, values=(value,))
+
+    def clear_table(self):
+        self.table.delete(*self.table.get_children())
+
+    def calculate(self):
+        """Calculate the statistics of the selected image (or its viewport) in the
+        background, filling the table in once they're done."""
+        self.job += 1
+        self.clear_table()
+
+        if self.image is None or not self.image.winfo_exists():
+            return
+
+        label = self.region.get()
+        drawn_region = self.region_labels().get(label)
+
+        if drawn_region is not None:
+            func = statistics.compute_region_statistics
+            region = drawn_region
+        elif label == "Viewport":
+            ax = self.image.fig.axes[0]
+            func = statistics.compute_statistics
+            region = statistics.viewport_region(
+                self.image.image_data.shape, ax.get_xlim(), ax.get_ylim()
+            )
+        else:
+            func = statistics.compute_statistics
+            region = None
+
+        self.insert_row("Calculating...", "")
+
+        background.run_in_background(
+            self,
+            func,
+            self.image.image_data,
+            region,
+            self.image.image_data_header,
+            self.image.image_wcs,
+            callback=partial(self.show_statistics, self.job),
+            error_callback=partial(self.show_error, self.job),
+        )
+
+    def show_statistics(self, job, region_statistics):
+        if job != self.job:
+            return
+
+        self.clear_table()
+        for stat, value in region_statistics.rows():
+            self.insert_row(stat, value)
+
+    def show_error(self, job, error):
+        if job != self.job:
+            return
+
+        self.clear_table()
+        self.insert_row("Error", str(error))
 
     def update_open_images(self, selected_image, image_list):
         if self.image_dropdown is None:
-            if selected_image.image_wcs is not None:
-                self.image_options(
-                    self.window, "Select Image", selected_image.file_name, 0, 0
-                )
+            if selected_image is not None and selected_image.image_wcs is not None:
+                self.image_options(self.window, "Select Image", 0, 0)
+                self.select_image(selected_image)
         else:
             self.update_dropdown(image_list)
 
+            if self.image is not None and self.image not in image_list:
+                # the image we were showing was closed
+                self.set_image(None)
+                self.image_dropdown["text"] = ""
+                self.calculate()
+
         self.root.update()
 
     def close(self):
         ic.update_image_list_eh.remove(self.update_open_images)
+        self.set_image(None)
         super().close()
@@ -0,0 +1,89 @@
+from unittest import TestCase
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from src.lib.blit_manager import BlitManager
+from src.widgets.image.annotations import Annotations, Stroke
+
+
+class StrokeTest(TestCase):
+    def test_buffer_grows(self):
+        stroke = Stroke("red", 1, capacity=2)
+        for i in range(5):
+            stroke.append(i, -i)
+
+        np.testing.assert_array_equal(stroke.vertices[:, 0], np.arange(5))
+        np.testing.assert_array_equal(stroke.vertices[:, 1], -np.arange(5))
+
+
+class AnnotationsTest(TestCase):
+    def setUp(self):
+        fig = Figure(figsize=(2, 2), dpi=100)
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        ax.set_xlim(0, 100)
+        ax.set_ylim(0, 100)
+
+        self.annotations = Annotations(ax, BlitManager(fig.canvas))
+
+    def draw(self, points):
+        self.annotations.start_stroke(*points[0], "red", 2)
+        for point in points[1:]:
+            self.annotations.extend_stroke(*point)
+        self.annotations.finish_stroke()
+
+    def test_strokes_in_one_collection(self):
+        self.draw([(x, 10) for x in range(0, 50)])
+        self.draw([(10, y) for y in range(0, 50)])
+
+        self.assertEqual(len(self.annotations.strokes), 2)
+        self.assertEqual(len(self.annotations.collection.get_segments()), 2)
+        # straight strokes are simplified down to their ends
+        np.testing.assert_array_equal(
+            self.annotations.strokes[0].vertices, [(0, 10), (49, 10)]
+        )
+
+    def test_erase_splits_stroke(self):
+        self.draw([(0, 50), (25, 50), (50, 52), (75, 50), (100, 50)])
+
+        self.assertFalse(self.annotations.erase(50, 0, 1))
+        self.assertTrue(self.annotations.erase(90, 50, 1))
+
+        self.assertEqual(len(self.annotations.strokes), 1)
+        self.assertEqual(len(self.annotations.strokes[0].vertices), 4)
+
+        self.assertTrue(self.annotations.erase(37, 51, 1))
+        self.assertEqual(len(self.annotations.strokes), 2)
+
+    def test_erase_only_checks_nearby(self):
+        for y in range(0, 100, 5):
+            self.draw([(0, y), (100, y)])
+
+        nearby = self.annotations.stroke_index.query((48, 48, 52, 52))
+        self.assertLess(len(nearby), 5)
+
+        # each stroke is a single segment, so the one erased is gone entirely
+        self.assertTrue(self.annotations.erase(50, 50, 1))
+        self.assertEqual(len(self.annotations.strokes), 19)
+
+    def test_erase_text(self):
+        self.annotations.add_text(10, 10, "hello", 10, "red")
+
+        self.assertFalse(self.annotations.erase(90, 90, 1))
+        self.assertTrue(self.annotations.erase(11, 11, 1))
+        self.assertEqual(self.annotations.texts, [])
+
+    def test_text_reindexed_on_view_change(self):
+        self.annotations.add_text(10, 10, "hello", 10, "red")
+        self.annotations.erase(90, 90, 1)
+        self.assertIsNotNone(self.annotations.text_index)
+
+        self.annotations.ax.set_xlim(0, 50)
+        self.assertIsNone(self.annotations.text_index)
+
+    def test_click_is_not_a_stroke(self):
+        self.draw([(5, 5)])
+
+        self.assertEqual(self.annotations.strokes, [])
@@ -0,0 +1,53 @@
+from unittest import TestCase, mock
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from src.lib.blit_manager import BlitManager, unanimated
+
+
+class BlitManagerTest(TestCase):
+    def setUp(self):
+        self.fig = Figure(figsize=(2, 2), dpi=50)
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot()
+        self.ax.imshow(np.zeros((10, 10)))
+
+        self.blit = BlitManager(self.canvas)
+        (self.line,) = self.ax.plot([0, 9], [0, 9], color="red")
+        self.blit.add_artist(self.line)
+
+    def test_overlay_drawn_over_background(self):
+        self.canvas.draw()
+        with_line = np.asarray(self.canvas.buffer_rgba()).copy()
+
+        self.line.remove()
+        self.blit.update()
+        without_line = np.asarray(self.canvas.buffer_rgba())
+
+        self.assertFalse(np.array_equal(with_line, without_line))
+        self.assertEqual(self.blit.artists, [])
+
+    def test_background_excludes_overlay(self):
+        self.canvas.draw()
+        self.line.set_visible(False)
+        self.blit.update()
+        blitted = np.asarray(self.canvas.buffer_rgba()).copy()
+
+        self.line.remove()
+        self.canvas.draw()
+
+        np.testing.assert_array_equal(blitted, np.asarray(self.canvas.buffer_rgba()))
+
+    def test_update_before_draw(self):
+        self.canvas.draw_idle = mock.Mock()
+        self.blit.update()
+
+        self.canvas.draw_idle.assert_called_once()
+
+    def test_unanimated(self):
+        with unanimated(self.fig):
+            self.assertFalse(self.line.get_animated())
+
+        self.assertTrue(self.line.get_animated())
@@ -0,0 +1,66 @@
+from unittest import TestCase
+
+import astropy.visualization as vis
+import numpy as np
+from matplotlib import colormaps
+
+from src.enums import Scaling
+from src.widgets.image.colour_lut import ColourLUT, quantisation_edges
+
+
+class QuantisationEdgesTest(TestCase):
+    def test_covers_range(self):
+        sample = np.random.default_rng(0).normal(size=1000)
+        edges = quantisation_edges(sample, -10, 10, 255)
+
+        self.assertEqual(edges[0], -10)
+        self.assertEqual(edges[-1], 10)
+        self.assertTrue(np.all(np.diff(edges) > 0))
+        self.assertLessEqual(len(edges), 256)
+
+    def test_constant_data(self):
+        edges = quantisation_edges(np.ones(10), 1, 1, 15)
+
+        self.assertLess(edges[0], 1)
+        self.assertGreater(edges[-1], 1)
+
+
+class ColourLUTTest(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.data = rng.normal(size=(100, 100))
+        self.data[0, 0] = np.nan
+
+        self.colour_lut = ColourLUT(self.data[1:].ravel(), -5, 5)
+
+    def test_quantise(self):
+        index = self.colour_lut.quantise(self.data)
+
+        self.assertEqual(index.dtype, np.uint16)
+        self.assertEqual(index[0, 0], self.colour_lut.nan_index)
+
+        # every value is within the level it's quantised to
+        edges = self.colour_lut.edges
+        values, levels = self.data[1:], index[1:]
+        self.assertTrue(np.all(edges[levels] <= values))
+        self.assertTrue(np.all(values <= edges[levels + 1]))
+
+    def test_apply_matches_norm(self):
+        self.colour_lut.set_render("inferno", -1, 1, Scaling.SQRT)
+        rgba = self.colour_lut.apply(self.colour_lut.quantise(self.data))
+
+        norm = vis.ImageNormalize(stretch=vis.SqrtStretch(), vmin=-1, vmax=1)
+        expected = colormaps["inferno"](norm(self.data), bytes=True)
+
+        self.assertEqual(rgba.shape, (100, 100, 4))
+        self.assertEqual(rgba[0, 0, 3], 0)
+        # the quantisation error is well under a step of the colour map
+        diff = np.abs(rgba[1:].astype(int) - expected[1:].astype(int))
+        self.assertLessEqual(np.percentile(diff, 99), 1)
+
+    def test_set_range_rebuilds(self):
+        self.colour_lut.set_render("viridis", -1, 1, Scaling.LINEAR)
+        self.colour_lut.set_range(-20, 20)
+
+        self.assertEqual(self.colour_lut.edges[-1], 20)
+        self.assertEqual(len(self.colour_lut.lut), self.colour_lut.nan_index + 1)
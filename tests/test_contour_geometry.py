@@ -0,0 +1,164 @@
+from unittest import TestCase, mock
+
+import numpy as np
+
+from src.widgets.contour import contour_geometry, smoothing
+
+
+class ContourPathsTest(TestCase):
+    def setUp(self):
+        contour_geometry.clear_cache()
+        smoothing.clear_cache()
+
+        y, x = np.mgrid[0:200, 0:300]
+        self.data = np.exp(-((x - 150) ** 2 + (y - 100) ** 2) / (2 * 30**2))
+
+    def test_circle(self):
+        paths = contour_geometry.get_contour_paths(self.data, [0.5, 0.1], 0)
+
+        self.assertEqual(paths.levels, [0.1, 0.5])
+        self.assertEqual([len(lines) for lines in paths.lines], [1, 1])
+
+        # the 0.5 contour of the gaussian is a circle of radius sigma * sqrt(2 ln 2)
+        line = paths.lines[1][0]
+        radius = np.hypot(line[:, 0] - 150, line[:, 1] - 100)
+        np.testing.assert_allclose(radius, 30 * np.sqrt(2 * np.log(2)), rtol=0.01)
+
+    def test_decimated_in_source_pixels(self):
+        paths = contour_geometry.get_contour_paths(self.data, [0.5], 8)
+        line = paths.lines[0][0]
+
+        self.assertAlmostEqual(line[:, 0].mean(), 150, delta=1)
+        self.assertAlmostEqual(line[:, 1].mean(), 100, delta=1)
+
+    def test_computed_once(self):
+        with mock.patch.object(
+            contour_geometry,
+            "compute_contour_paths",
+            wraps=contour_geometry.compute_contour_paths,
+        ) as compute:
+            first = contour_geometry.get_contour_paths(self.data, [0.5, 0.1], 2)
+            second = contour_geometry.get_contour_paths(self.data, [0.1, 0.5], 2)
+            contour_geometry.get_contour_paths(self.data, [0.5], 2)
+
+        self.assertIs(first, second)
+        self.assertEqual(compute.call_count, 2)
+
+    def test_forget_after_update(self):
+        # as ImageFrame.update_data does when a finer version of the image streams in
+        first = contour_geometry.get_contour_paths(self.data, [0.5], 2)
+
+        y, x = np.mgrid[0:200, 0:300]
+        np.copyto(self.data, np.exp(-((x - 60) ** 2 + (y - 60) ** 2) / (2 * 20**2)))
+        self.assertIs(contour_geometry.get_contour_paths(self.data, [0.5], 2), first)
+
+        contour_geometry.forget(self.data)
+        second = contour_geometry.get_contour_paths(self.data, [0.5], 2)
+
+        self.assertIsNot(second, first)
+        line = second.lines[0][0]
+        self.assertAlmostEqual(line[:, 0].mean(), 60, delta=1)
+        self.assertAlmostEqual(line[:, 1].mean(), 60, delta=1)
+
+    def test_segments(self):
+        paths = contour_geometry.get_contour_paths(self.data, [0.1, 0.5, 2], 0)
+        segments, levels = paths.segments()
+
+        self.assertEqual(len(segments), 2)
+        self.assertEqual(levels, [0.1, 0.5])
+
+
+class TraceLinesTest(TestCase):
+    def setUp(self):
+        y, x = np.mgrid[0:200, 0:300]
+        self.x, self.y = np.arange(300), np.arange(200)
+        self.z = np.exp(-((x - 150) ** 2 + (y - 100) ** 2) / (2 * 30**2)) + np.exp(
+            -((x - 40) ** 2 + (y - 40) ** 2) / (2 * 10**2)
+        )
+
+    def test_tiles_are_stitched(self):
+        whole = contour_geometry.trace_lines(self.x, self.y, self.z, [0.5], 1000)
+        tiled = contour_geometry.trace_lines(
+            self.x, self.y, self.z, [0.5], tile_size=32, threads=4
+        )
+
+        self.assertEqual(len(whole[0]), 2)
+        self.assertEqual(len(tiled[0]), 2)
+
+        for line in tiled[0]:
+            # every line is still a closed loop
+            np.testing.assert_allclose(line[0], line[-1])
+
+        self.assertEqual(
+            sorted(len(line) for line in whole[0]),
+            sorted(len(line) for line in tiled[0]),
+        )
+
+    def test_stitch_reversed(self):
+        lines = [
+            np.array([[0, 0], [1, 0]], dtype=float),
+            np.array([[2, 0], [1, 0]], dtype=float),
+            np.array([[2, 0], [3, 0]], dtype=float),
+            np.array([[5, 5], [6, 6], [5, 5]], dtype=float),
+        ]
+
+        stitched = contour_geometry.stitch_lines(lines)
+
+        # closed lines are left as they are, and come first
+        self.assertEqual(len(stitched), 2)
+        self.assertIs(stitched[0], lines[3])
+        np.testing.assert_array_equal(stitched[1][:, 0], [0, 1, 2, 3])
+
+
+class DetailLevelTest(TestCase):
+    def setUp(self):
+        theta = np.linspace(0, 2 * np.pi, 2000)
+        circle = np.column_stack([np.cos(theta), np.sin(theta)])
+        self.paths = contour_geometry.ContourPaths(
+            [0.5], [[100 * circle + 150, 5 * circle + 1000]]
+        )
+
+    def test_detail_level(self):
+        self.assertIsNone(contour_geometry.detail_level(0.1))
+        self.assertEqual(contour_geometry.detail_level(1), 0)
+        self.assertEqual(contour_geometry.detail_level(3.9), 1)
+        self.assertEqual(contour_geometry.detail_level(64), 6)
+        self.assertIsNone(contour_geometry.detail_level(np.nan))
+
+    def test_simplified(self):
+        full = self.paths.simplified(None)
+        coarse = self.paths.simplified(4)
+
+        self.assertTrue(self.paths.has_detail_level(4))
+        self.assertFalse(self.paths.has_detail_level(5))
+        self.assertLess(len(coarse[0]), len(full[0]) / 10)
+
+        # the simplified circle is still within tolerance of the radius
+        radius = np.hypot(*(coarse[0] - 150).T)
+        np.testing.assert_array_less(
+            np.abs(radius - 100), contour_geometry.DETAIL_TOLERANCE * 2**4 + 1e-9
+        )
+
+    def test_visible_lines(self):
+        bounds = self.paths.bounds()
+
+        np.testing.assert_allclose(bounds[1], [995, 995, 1005, 1005])
+        np.testing.assert_array_equal(
+            contour_geometry.visible_lines(bounds, (0, 0, 60, 60)), [0]
+        )
+        np.testing.assert_array_equal(
+            contour_geometry.visible_lines(bounds, (300, 300, 400, 400)), []
+        )
+        np.testing.assert_array_equal(
+            contour_geometry.visible_lines(bounds, (0, 0, 2000, 2000)), [0, 1]
+        )
+
+    def test_closest_detail_level(self):
+        self.assertIsNone(self.paths.closest_detail_level(3))
+
+        self.paths.simplified(1)
+        self.assertEqual(self.paths.closest_detail_level(3), 1)
+
+        self.paths.simplified(6)
+        self.paths.simplified(5)
+        self.assertEqual(self.paths.closest_detail_level(3), 5)
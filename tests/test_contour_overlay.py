@@ -0,0 +1,82 @@
+from unittest import TestCase, mock
+
+import numpy as np
+from matplotlib.figure import Figure
+
+from src.widgets.contour import contour_overlay
+from src.widgets.contour.contour_geometry import ContourPaths
+
+
+class ContourOverlayTest(TestCase):
+    def setUp(self):
+        theta = np.linspace(0, 2 * np.pi, 20000)
+        circle = np.column_stack([np.cos(theta), np.sin(theta)])
+        self.paths = ContourPaths([1.0], [[1000 * circle + 1500]])
+
+        self.fig = Figure(figsize=(5, 5), dpi=100)
+        self.ax = self.fig.add_subplot()
+        self.ax.set_xlim(0, 3000)
+        self.ax.set_ylim(0, 3000)
+
+        # background jobs are only run when the test says so
+        self.jobs = []
+        patcher = mock.patch.object(
+            contour_overlay.background, "run_in_background", self.record_job
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def record_job(self, _widget, func, *args, callback=None, **_kwargs):
+        self.jobs.append((func, args, callback))
+
+    def run_jobs(self):
+        jobs, self.jobs = self.jobs, []
+        for func, args, callback in jobs:
+            callback(func(*args))
+
+    def overlay(self):
+        return contour_overlay.ContourOverlay(
+            None, self.ax, self.paths, self.ax.transData, mock.Mock()
+        )
+
+    def drawn_points(self, overlay):
+        return sum(len(segment) for segment in overlay.collection.get_segments())
+
+    def test_nothing_full_detail_while_simplifying(self):
+        overlay = self.overlay()
+
+        self.assertIsNotNone(overlay.level)
+        self.assertEqual(overlay.collection.get_segments(), [])
+
+        self.run_jobs()
+
+        self.assertEqual(overlay.drawn_level, overlay.level)
+        self.assertLess(self.drawn_points(overlay), 20000 / 10)
+        overlay.on_change.assert_called_once()
+
+    def test_coarser_level_while_simplifying(self):
+        overlay = self.overlay()
+        self.run_jobs()
+        level = overlay.level
+
+        # zooming in needs a finer level, the coarser one is drawn until it's done
+        self.ax.set_xlim(1000, 2000)
+        self.ax.set_ylim(1000, 2000)
+
+        self.assertLess(overlay.level, level)
+        self.assertEqual(overlay.drawn_level, level)
+
+        self.run_jobs()
+        self.assertEqual(overlay.drawn_level, overlay.level)
+
+    def test_shared_paths_simplified_once(self):
+        first = self.overlay()
+        second = self.overlay()
+
+        self.assertEqual(len(self.jobs), 1)
+
+        self.run_jobs()
+
+        self.assertEqual(first.drawn_level, first.level)
+        self.assertEqual(second.drawn_level, second.level)
+        self.assertGreater(len(second.collection.get_segments()), 0)
@@ -0,0 +1,168 @@
+from unittest import TestCase
+
+import numpy as np
+from astropy.coordinates import SkyCoord
+from astropy.wcs import WCS, Sip
+from matplotlib.figure import Figure
+
+from src.widgets.image import coord_readout
+
+
+def make_wcs(crval=(150.0, -30.0), cdelt=0.001, sip=False):
+    image_wcs = WCS(naxis=2)
+    image_wcs.wcs.ctype = ["RA---TAN", "DEC--TAN"]
+    image_wcs.wcs.crval = crval
+    image_wcs.wcs.crpix = [500, 500]
+    image_wcs.wcs.cdelt = [-cdelt, cdelt]
+
+    if sip:
+        image_wcs.wcs.ctype = ["RA---TAN-SIP", "DEC--TAN-SIP"]
+        a = np.zeros((4, 4))
+        a[2, 0] = 1e-5
+        a[0, 3] = 2e-8
+        b = np.zeros((4, 4))
+        b[1, 1] = 1e-5
+        image_wcs.sip = Sip(a, b, None, None, image_wcs.wcs.crpix)
+
+    return image_wcs
+
+
+def max_error(image_wcs, grid, points):
+    """The largest difference (in arcseconds) between the grid and the WCS."""
+    error = 0
+
+    for x, y in points:
+        lon, lat = grid.pixel_to_world(x, y)
+        wcs_lon, wcs_lat = image_wcs.all_pix2world(x, y, 0)
+
+        lon_error = abs((lon - wcs_lon + 180) % 360 - 180) * np.cos(np.radians(lat))
+        error = max(error, 3600 * lon_error, 3600 * abs(lat - wcs_lat))
+
+    return error
+
+
+class WCSGridTest(TestCase):
+    def setUp(self):
+        self.points = np.random.default_rng(0).uniform(0, 1000, (500, 2))
+
+    def test_matches_wcs(self):
+        image_wcs = make_wcs()
+        grid = coord_readout.WCSGrid(image_wcs, ((0, 1000), (0, 1000)))
+
+        self.assertTrue(grid.accurate)
+        self.assertLess(
+            max_error(image_wcs, grid, self.points), coord_readout.TOLERANCE_ARCSEC
+        )
+
+    def test_wraps_ra(self):
+        # the view crosses RA 0, which shouldn't be interpolated across 360 degrees
+        image_wcs = make_wcs(crval=(0.0, -30.0))
+        grid = coord_readout.WCSGrid(image_wcs, ((0, 1000), (0, 1000)))
+
+        self.assertTrue(grid.accurate)
+        self.assertLess(
+            max_error(image_wcs, grid, self.points), coord_readout.TOLERANCE_ARCSEC
+        )
+
+        lon, _lat = grid.pixel_to_world(0, 500)
+        self.assertTrue(0 <= lon < 360)
+
+    def test_distorted(self):
+        image_wcs = make_wcs(sip=True)
+        grid = coord_readout.WCSGrid(image_wcs, ((0, 1000), (0, 1000)))
+
+        self.assertTrue(grid.accurate)
+        self.assertGreater(grid.size, coord_readout.GRID_SIZE)
+        self.assertLess(
+            max_error(image_wcs, grid, self.points), coord_readout.TOLERANCE_ARCSEC
+        )
+
+    def test_off_projection(self):
+        # most of this view is off the edge of the projection
+        image_wcs = make_wcs(cdelt=1.0)
+        grid = coord_readout.WCSGrid(image_wcs, ((0, 1000), (0, 1000)))
+
+        self.assertFalse(grid.accurate)
+
+
+class FormatTest(TestCase):
+    def test_sexagesimal(self):
+        for lon, lat in [
+            (0, 0),
+            (150.123456, -30.987654),
+            (10.5, 89.9999999),
+            (359.9, -0.0001),
+            (45.0, -45.0),
+            (12.3456789, 0.00012),
+        ]:
+            c = SkyCoord(lon, lat, unit="deg")
+            expected = c.to_string(
+                style="hmsdms", sep=":", pad=True, precision=2
+            ).replace(" ", ", ")
+
+            self.assertEqual(coord_readout.format_sexagesimal(lon, lat), expected)
+
+    def test_decimal(self):
+        for lon, lat in [(0, 0), (150.123456, -30.987654), (359.996, -0.004)]:
+            c = SkyCoord(lon, lat, unit="deg")
+            expected = c.to_string(style="decimal", precision=2).replace(" ", ", ")
+
+            self.assertEqual(coord_readout.format_decimal(lon, lat), expected)
+
+
+class CoordReadoutTest(TestCase):
+    def setUp(self):
+        self.image_wcs = make_wcs()
+        self.image_data = np.arange(1000 * 1000, dtype=np.float64).reshape(1000, 1000)
+
+        self.ax = Figure().add_subplot()
+        self.ax.set_xlim(0, 1000)
+        self.ax.set_ylim(0, 1000)
+
+        self.readout = coord_readout.CoordReadout(
+            self.ax, self.image_wcs, self.image_data
+        )
+
+    def test_format_coord(self):
+        text = self.readout.format_coord(250.4, 749.6)
+
+        c = self.image_wcs.pixel_to_world(250.4, 749.6)
+        self.assertIn(
+            c.to_string(style="decimal", precision=2).replace(" ", ", "), text
+        )
+        self.assertIn("Image: (250, 750)", text)
+        self.assertIn(f"Value: ({self.image_data[750, 250]:.3e})", text)
+
+        self.assertNotIn("Value", self.readout.format_coord(-10, 500))
+
+    def test_reuses_grid(self):
+        self.readout.format_coord(500, 500)
+        grid = self.readout.grid
+
+        # a small pan stays inside the margin of the grid
+        self.ax.set_xlim(100, 1100)
+        self.readout.format_coord(500, 500)
+        self.assertIs(self.readout.grid, grid)
+
+        # zooming in a long way needs a finer one
+        self.ax.set_xlim(400, 450)
+        self.ax.set_ylim(400, 450)
+        self.readout.format_coord(425, 425)
+        self.assertIsNot(self.readout.grid, grid)
+
+    def test_distorted_matches_pixel_to_world(self):
+        image_wcs = make_wcs()
+        image_wcs.wcs.ctype = ["RA---TAN-SIP", "DEC--TAN-SIP"]
+        a = np.zeros((3, 3))
+        a[2, 0] = 1e-5
+        b = np.zeros((3, 3))
+        b[0, 2] = 1e-5
+        image_wcs.sip = Sip(a, b, None, None, image_wcs.wcs.crpix)
+
+        readout = coord_readout.CoordReadout(self.ax, image_wcs, self.image_data)
+
+        for x, y in [(900, 900), (100, 850), (2000, 2000)]:
+            expected = image_wcs.pixel_to_world(x, y).to_string(
+                style="hmsdms", sep=":", pad=True, precision=2
+            )
+            self.assertIn(expected.replace(" ", ", "), readout.format_coord(x, y))
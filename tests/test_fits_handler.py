@@ -0,0 +1,115 @@
+import mmap
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+from astropy.io import fits
+from astropy.wcs import WCS
+from matplotlib.figure import Figure
+
+from src.widgets.image import fits_handler
+
+
+def _root_base(array):
+    base = array
+    while getattr(base, "base", None) is not None:
+        base = base.base
+    return base
+
+
+class OpenFitsFileTest(TestCase):
+    def setUp(self):
+        fd, self.file_path = tempfile.mkstemp(suffix=".fits")
+        os.close(fd)
+
+        self.data = np.arange(4 * 5, dtype=np.float32).reshape((1, 1, 4, 5))
+        fits.writeto(self.file_path, self.data, overwrite=True)
+
+    def tearDown(self):
+        os.remove(self.file_path)
+
+    def test_data_is_memory_mapped(self):
+        image_data, _ = fits_handler.open_fits_file(self.file_path)
+
+        self.assertIsInstance(_root_base(image_data), mmap.mmap)
+
+    def test_data_valid_after_open_returns(self):
+        image_data, header = fits_handler.open_fits_file(self.file_path)
+
+        self.assertEqual(image_data.shape, (4, 5))
+        self.assertEqual(header["NAXIS"], 4)
+        np.testing.assert_array_equal(image_data, self.data.squeeze())
+
+    def test_memmap_can_be_disabled(self):
+        image_data, _ = fits_handler.open_fits_file(self.file_path, memmap=False)
+
+        self.assertNotIsInstance(_root_base(image_data), mmap.mmap)
+
+
+def _image_wcs(cd: bool = False) -> WCS:
+    image_wcs = WCS(naxis=2)
+    image_wcs.wcs.ctype = ["RA---SIN", "DEC--SIN"]
+    image_wcs.wcs.crval = [150.0, -30.0]
+    image_wcs.wcs.crpix = [2000.5, 1500.5]
+    if cd:
+        image_wcs.wcs.cd = [[-1e-3, 2e-4], [2e-4, 1e-3]]
+    else:
+        image_wcs.wcs.cdelt = [-1e-3, 1e-3]
+    image_wcs.pixel_shape = (4000, 3000)
+    return image_wcs
+
+
+class ScaledWCSTest(TestCase):
+    def assert_matches(self, image_wcs, xlim, ylim, width):
+        new_wcs = fits_handler.scaled_wcs(image_wcs, xlim, ylim, width)
+        new_width, new_height = new_wcs.pixel_shape
+        scale = (xlim[1] - xlim[0]) / new_width
+
+        i, j = np.meshgrid(np.arange(0, new_width, 7), np.arange(0, new_height, 7))
+        x = xlim[0] + (i + 0.5) * scale
+        y = ylim[0] + (j + 0.5) * scale
+
+        expected = image_wcs.wcs_pix2world(x, y, 0)
+        actual = new_wcs.wcs_pix2world(i, j, 0)
+        np.testing.assert_allclose(actual, expected, atol=1e-9)
+
+    def test_coarser(self):
+        self.assert_matches(_image_wcs(), (-0.5, 3999.5), (-0.5, 2999.5), 500)
+
+    def test_finer_region(self):
+        self.assert_matches(_image_wcs(), (1000.25, 1100.25), (700.0, 760.0), 600)
+
+    def test_cd_matrix(self):
+        self.assert_matches(_image_wcs(cd=True), (200.0, 1800.0), (100.0, 900.0), 400)
+
+    def test_square_pixels(self):
+        new_wcs = fits_handler.scaled_wcs(_image_wcs(), (0, 400), (0, 100), 200)
+
+        self.assertEqual(new_wcs.pixel_shape, (200, 50))
+
+    def test_image_wcs_unchanged(self):
+        image_wcs = _image_wcs()
+        fits_handler.scaled_wcs(image_wcs, (0, 400), (0, 100), 200)
+
+        np.testing.assert_array_equal(image_wcs.wcs.crpix, [2000.5, 1500.5])
+        np.testing.assert_array_equal(image_wcs.wcs.cdelt, [-1e-3, 1e-3])
+
+
+class GetViewWCSTest(TestCase):
+    def test_matches_screen(self):
+        image_wcs = _image_wcs()
+        fig = Figure(figsize=(4, 4), dpi=100)
+        ax = fig.add_axes((0, 0, 1, 1))
+        ax.set_xlim(100, 300)
+        ax.set_ylim(50, 250)
+
+        view_wcs, extent = fits_handler.get_view_wcs(fig, image_wcs)
+
+        self.assertEqual(view_wcs.pixel_shape, (400, 400))
+        np.testing.assert_allclose(extent, (100, 300, 50, 250))
+
+        # the centre of the first pixel is a quarter of a pixel of the image in
+        lon, lat = view_wcs.wcs_pix2world(0, 0, 0)
+        expected = image_wcs.wcs_pix2world(100.25, 50.25, 0)
+        np.testing.assert_allclose((lon, lat), expected, atol=1e-9)
@@ -0,0 +1,54 @@
+from unittest import TestCase
+
+import numpy as np
+
+from src.lib.geometry import segment_distances, simplify
+
+
+class SegmentDistancesTest(TestCase):
+    def test_distances(self):
+        points = np.array([[0, 0], [10, 0], [10, 10]], dtype=float)
+
+        np.testing.assert_allclose(segment_distances(points, 5, 2), [2, 5])
+        # past the end of a segment, the distance is to the end point
+        np.testing.assert_allclose(segment_distances(points, -3, 4), [5, 13])
+
+    def test_zero_length_segment(self):
+        points = np.array([[1, 1], [1, 1]], dtype=float)
+
+        np.testing.assert_allclose(segment_distances(points, 4, 5), [5])
+
+
+class SimplifyTest(TestCase):
+    def test_straight_line(self):
+        points = np.stack([np.arange(100), np.arange(100) * 2], axis=1).astype(float)
+
+        np.testing.assert_array_equal(simplify(points, 0.1), points[[0, -1]])
+
+    def test_keeps_corners(self):
+        points = np.array([[0, 0], [1, 0.01], [2, 0], [2, 1], [2, 2]], dtype=float)
+
+        np.testing.assert_array_equal(simplify(points, 0.1), points[[0, 2, 4]])
+
+    def test_within_tolerance(self):
+        t = np.linspace(0, 2 * np.pi, 1000)
+        points = np.stack([np.cos(t), np.sin(t)], axis=1) * 100
+        simplified = simplify(points, 0.5)
+
+        self.assertLess(len(simplified), 100)
+        distances = [segment_distances(simplified, *p).min() for p in points]
+        self.assertLessEqual(max(distances), 0.5 + 1e-9)
+
+    def test_doubles_back(self):
+        # out past the end and back along the chord, which is all on one line
+        points = np.array([[0, 0], [10, 0], [20, 0], [15, 0], [12, 0]], dtype=float)
+        simplified = simplify(points, 0.5)
+
+        np.testing.assert_array_equal(simplified, points[[0, 2, 4]])
+        distances = [segment_distances(simplified, *p).min() for p in points]
+        self.assertLessEqual(max(distances), 0.5)
+
+    def test_short_lines(self):
+        points = np.array([[0, 0], [1, 1]], dtype=float)
+
+        np.testing.assert_array_equal(simplify(points, 1), points)
@@ -0,0 +1,59 @@
+from unittest import TestCase
+
+import numpy as np
+
+from src.lib import healpix
+
+
+class HealpixTest(TestCase):
+    def test_base_pixels(self):
+        # the centres of the 12 base pixels
+        lon = [45, 135, 225, 315, 0, 90, 180, 270, 45, 135, 225, 315]
+        lat = [41.8] * 4 + [0] * 4 + [-41.8] * 4
+
+        np.testing.assert_array_equal(healpix.ang2pix_nest(1, lon, lat), range(12))
+
+    def test_nested(self):
+        # within a base pixel the nested children go south, east, west, north
+        pixels = healpix.ang2pix_nest(2, [0, 10, -10, 0], [-20, 0, 0, 20])
+        np.testing.assert_array_equal(pixels, [16, 17, 18, 19])
+
+        # and each child holds its own children
+        rng = np.random.default_rng(0)
+        lon = rng.uniform(0, 360, 10000)
+        lat = np.degrees(np.arcsin(rng.uniform(-1, 1, 10000)))
+
+        np.testing.assert_array_equal(
+            healpix.ang2pix_nest(64, lon, lat) // 16,
+            healpix.ang2pix_nest(16, lon, lat),
+        )
+
+    def test_equal_area(self):
+        rng = np.random.default_rng(1)
+        lon = rng.uniform(0, 360, 1000000)
+        lat = np.degrees(np.arcsin(rng.uniform(-1, 1, 1000000)))
+
+        counts = np.bincount(healpix.ang2pix_nest(4, lon, lat), minlength=192)
+
+        self.assertEqual(len(counts), 192)
+        expected = 1000000 / 192
+        self.assertLess(np.max(np.abs(counts - expected)), 6 * np.sqrt(expected))
+
+    def test_interleave(self):
+        np.testing.assert_array_equal(
+            healpix.interleave([0, 1, 0, 3, 2**20], [0, 0, 1, 3, 0]),
+            [0, 1, 2, 15, 2**40],
+        )
+
+    def test_point(self):
+        rng = np.random.default_rng(2)
+        lon = rng.uniform(-360, 720, 2000)
+        lat = np.degrees(np.arcsin(rng.uniform(-1, 1, 2000)))
+        # the poles, equator and the edges of the polar caps
+        lat[:6] = [90, -90, 0, 41.8103149, -41.8103149, 89.9999]
+
+        for nside in [1, 16, 2**11, 2**29]:
+            self.assertEqual(
+                [healpix.ang2pix_nest_point(nside, a, b) for a, b in zip(lon, lat)],
+                healpix.ang2pix_nest(nside, lon, lat).tolist(),
+            )
@@ -0,0 +1,154 @@
+import io
+import os
+import tempfile
+from unittest import TestCase, mock
+
+import numpy as np
+from astropy.io import fits
+from PIL import Image
+
+from src.enums import DataType
+from src.widgets.hips_survey_selector import hips_cache, hips_handler
+from src.widgets.hips_survey_selector.hips_cache import CachedResponse, HiPSCache
+
+
+class StandInService:
+    """Stands in for hips2fits, making a small image for each query."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, params, download=None):
+        self.queries.append(params)
+
+        data = np.arange(12, dtype=np.float32).reshape(3, 4) + len(self.queries)
+        if params["format"] == "fits":
+            hdu = fits.PrimaryHDU(data[None, :, :])
+            hdu.header["HIPS"] = params["hips"]
+
+            payload = io.BytesIO()
+            hdu.writeto(payload)
+            content_type = "application/fits"
+        else:
+            payload = io.BytesIO()
+            Image.fromarray(data.astype(np.uint8)).save(payload, format="png")
+            content_type = "image/png"
+
+        return CachedResponse(payload.getvalue(), {"Content-Type": content_type})
+
+
+class HiPSCacheTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = HiPSCache(self.directory.name)
+        self.service = StandInService()
+
+        self.survey = hips_handler.HiPsSurvey(
+            ra=150.0,
+            dec=-30.0,
+            FOV=0.5,
+            projection="TAN",
+            survey="CDS/P/DSS2/red",
+            data_type=DataType.FITS,
+        )
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def open(self, survey):
+        return hips_handler.open_hips(
+            survey, cache=self.cache, service=self.service, native=False
+        )
+
+    def test_opens_from_cache(self):
+        data, header = self.open(self.survey)
+        cached_data, cached_header = self.open(self.survey)
+
+        self.assertEqual(len(self.service.queries), 1)
+        self.assertEqual(data.shape, (3, 4))
+        np.testing.assert_array_equal(cached_data, data)
+        self.assertEqual(cached_header["HIPS"], "CDS/P/DSS2/red")
+
+    def test_keyed_by_query(self):
+        self.open(self.survey)
+
+        self.survey.FOV = 1.0
+        self.open(self.survey)
+
+        self.survey.data_type = DataType.PNG
+        data, header = self.open(self.survey)
+
+        self.assertEqual(len(self.service.queries), 3)
+        self.assertIsNone(header)
+        self.assertEqual(data.dtype, np.uint8)
+
+        # all of them are still cached
+        self.survey.FOV = 0.5
+        self.survey.data_type = DataType.FITS
+        self.open(self.survey)
+        self.assertEqual(len(self.service.queries), 3)
+
+    def test_evicts_least_recently_used(self):
+        response = CachedResponse(b"x" * 100, {})
+        self.cache.max_bytes = 250
+
+        self.cache.put({"i": 0}, response)
+        self.cache.put({"i": 1}, response)
+
+        # mtimes can be too coarse to tell apart, so make them old
+        for i in range(2):
+            path = os.path.join(self.directory.name, hips_cache.cache_key({"i": i}))
+            os.utime(path + hips_cache.DATA_SUFFIX, ns=(i, i))
+
+        # using the first makes the second the least recently used
+        self.assertIsNotNone(self.cache.get({"i": 0}))
+        self.cache.put({"i": 2}, response)
+
+        self.assertIsNotNone(self.cache.get({"i": 0}))
+        self.assertIsNone(self.cache.get({"i": 1}))
+        self.assertIsNotNone(self.cache.get({"i": 2}))
+        self.assertLessEqual(self.cache.size(), 250)
+
+    def test_put_keeps_total(self):
+        self.cache.put({"i": 0}, CachedResponse(b"x" * 100, {}))
+
+        # only the first put scans the directory
+        with mock.patch.object(hips_cache.os, "listdir", wraps=os.listdir) as listdir:
+            for i in range(1, 20):
+                self.cache.put({"i": i}, CachedResponse(b"x" * 100, {}))
+
+            # replacing a response only counts the new one
+            self.cache.put({"i": 0}, CachedResponse(b"x" * 50, {}))
+
+        listdir.assert_not_called()
+        self.assertEqual(self.cache._total, 1950)
+        self.assertEqual(self.cache._total, self.cache.size())
+
+    def test_evicts_below_max(self):
+        self.cache.max_bytes = 1000
+        for i in range(11):
+            self.cache.put({"i": i}, CachedResponse(b"x" * 100, {}))
+
+        # trimmed to leave room, and the total is still right
+        self.assertLessEqual(
+            self.cache.size(), hips_cache.EVICT_TO * self.cache.max_bytes
+        )
+        self.assertEqual(self.cache._total, self.cache.size())
+
+    def test_partial_payload_is_a_miss(self):
+        params = {"hips": "a"}
+        self.cache.put(params, CachedResponse(b"abcdef", {}))
+
+        path = os.path.join(self.directory.name, hips_cache.cache_key(params))
+        with open(path + hips_cache.DATA_SUFFIX, "wb") as f:
+            f.write(b"abc")
+
+        self.assertIsNone(self.cache.get(params))
+
+    def test_clear(self):
+        self.open(self.survey)
+        self.cache.clear()
+
+        self.assertEqual(self.cache.size(), 0)
+        self.open(self.survey)
+        self.assertEqual(len(self.service.queries), 2)
@@ -0,0 +1,357 @@
+from unittest import TestCase, mock, skipIf
+
+import numpy as np
+from matplotlib.figure import Figure
+
+from src.widgets.image import hips_detail
+from src.widgets.image.hips_detail import (
+    BLOCK_SIZE,
+    ZOOM_THRESHOLD,
+    block_extent,
+    blocks_for_view,
+    blocks_in,
+    get_level,
+)
+from src.widgets.image.image_pyramid import ImagePyramid
+
+try:
+    # image_frame can only be imported through image_controller, which imports it
+    from src.widgets.image.image_controller import image_frame
+
+    ImageFrame = image_frame.ImageFrame
+except ImportError:
+    # i.e. a matplotlib or ttkbootstrap it doesn't support
+    ImageFrame = None
+
+
+class FakeFrame:
+    """Just what HiPSDetail uses of an ImageFrame, with the view on a real axes."""
+
+    def __init__(self, rows: int = 1000, cols: int = 1000, screen_pixels: int = 800):
+        self.fig = Figure(figsize=(screen_pixels / 100, screen_pixels / 100), dpi=100)
+        ax = self.fig.add_axes((0, 0, 1, 1))
+        ax.set_xlim(-0.5, cols - 0.5)
+        ax.set_ylim(-0.5, rows - 0.5)
+
+        self.image_data = np.arange(rows * cols, dtype=np.float32).reshape(rows, cols)
+        self.image_wcs = None
+        self.image_pyramid = ImagePyramid(self.image_data)
+        self.image_pyramid.build()
+
+        self.show_detail = mock.Mock()
+        self.after_callbacks = {}
+        self.cancelled = []
+
+    def set_view(self, xlim, ylim):
+        ax = self.fig.axes[0]
+        ax.set_xlim(*xlim)
+        ax.set_ylim(*ylim)
+
+    def after(self, _ms, callback):
+        after_id = f"after#{len(self.after_callbacks)}"
+        self.after_callbacks[after_id] = callback
+        return after_id
+
+    def after_cancel(self, after_id):
+        self.cancelled.append(after_id)
+
+
+class HiPSDetailTestCase(TestCase):
+    """Runs a HiPSDetail on a FakeFrame, with the downloads held until finish is
+    called."""
+
+    def setUp(self):
+        self.frame = FakeFrame()
+        self.detail = hips_detail.HiPSDetail(self.frame, None)
+
+        # (block, callback, error_callback) of the downloads started, in order
+        self.jobs = []
+
+        def run_in_background(_widget, _func, _survey, _wcs, block, _download, **kw):
+            self.jobs.append((block, kw["callback"], kw["error_callback"]))
+
+        patcher = mock.patch.object(
+            hips_detail.background, "run_in_background", run_in_background
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def started(self):
+        return [block for block, _, _ in self.jobs]
+
+    def finish(self, block, error=None):
+        """Finish the download of a block, with its level as the data."""
+        for job in self.jobs:
+            if job[0] == block:
+                self.jobs.remove(job)
+                _, callback, error_callback = job
+                if error is None:
+                    callback(np.full((BLOCK_SIZE, BLOCK_SIZE), block[0], np.float32))
+                else:
+                    error_callback(error)
+                return
+
+        self.fail(f"{block} wasn't being downloaded")
+
+    def settle(self):
+        """Run the fetch waiting on the view to settle."""
+        self.frame.after_callbacks[self.detail.after_id]()
+
+
+class BlockExtentTest(TestCase):
+    def test_first_block_starts_at_corner(self):
+        self.assertEqual(block_extent((0, 0, 0)), (-0.5, 511.5, -0.5, 511.5))
+
+    def test_finer_levels_are_smaller(self):
+        self.assertEqual(block_extent((1, 1, 2)), (255.5, 511.5, 511.5, 767.5))
+
+    def test_coarser_levels_are_larger(self):
+        self.assertEqual(block_extent((-1, -1, 0)), (-1024.5, -0.5, -0.5, 1023.5))
+
+
+class GetLevelTest(TestCase):
+    def test_not_zoomed_in(self):
+        self.assertEqual(get_level(800, 800), 0)
+        self.assertEqual(get_level(800 * ZOOM_THRESHOLD, 800), 0)
+
+    def test_zoomed_in(self):
+        self.assertEqual(get_level(800, 400), 1)
+        self.assertEqual(get_level(800, 100), 3)
+
+    def test_zoomed_out(self):
+        self.assertEqual(get_level(800, 3200), -2)
+
+    def test_clamped(self):
+        self.assertEqual(get_level(800, 1e-6), hips_detail.MAX_LEVEL)
+        self.assertEqual(get_level(800, 1e9), hips_detail.MIN_LEVEL)
+
+
+class BlocksForViewTest(TestCase):
+    def test_covers_view(self):
+        for level, xlim, ylim in [
+            (0, (-0.5, 799.5), (-0.5, 599.5)),
+            (2, (1000.3, 1190.1), (20.0, 170.0)),
+            (-1, (-3000.0, 2000.0), (500.0, -1500.0)),
+        ]:
+            block_range = blocks_for_view(level, xlim, ylim)
+            blocks = blocks_in(block_range)
+
+            _, bx0, bx1, by0, by1 = block_range
+            self.assertEqual(len(blocks), (bx1 - bx0 + 1) * (by1 - by0 + 1))
+
+            left, _, bottom, _ = block_extent(blocks[0])
+            _, right, _, top = block_extent(blocks[-1])
+            self.assertLessEqual(left, min(xlim))
+            self.assertGreaterEqual(right, max(xlim))
+            self.assertLessEqual(bottom, min(ylim))
+            self.assertGreaterEqual(top, max(ylim))
+
+            # and no more than that
+            span = BLOCK_SIZE * 2.0**-level
+            self.assertGreater(left + span, min(xlim))
+            self.assertLess(right - span, max(xlim))
+            self.assertGreater(bottom + span, min(ylim))
+            self.assertLess(top - span, max(ylim))
+
+    def test_exact_fit(self):
+        self.assertEqual(
+            blocks_for_view(0, (-0.5, 1023.5), (-0.5, 511.5)), (0, 0, 1, 0, 0)
+        )
+
+
+class ViewBlocksTest(HiPSDetailTestCase):
+    def test_home_view_not_downloaded(self):
+        self.assertIsNone(self.detail.view_blocks())
+        self.assertFalse(self.detail.update())
+        self.assertIsNone(self.detail.after_id)
+
+    def test_inside_image_not_downloaded(self):
+        self.frame.set_view((100, 900), (100, 900))
+        self.assertIsNone(self.detail.view_blocks())
+
+    def test_only_blocks_past_edge_downloaded(self):
+        self.frame = FakeFrame(rows=1000, cols=1500)
+        self.detail = hips_detail.HiPSDetail(self.frame, None)
+
+        # zoomed out to 2 blocks of level -1 across, only the right one is past the
+        #   edge within the view (the top of the view is the top of the image)
+        self.frame.set_view((-0.5, 1999.5), (-0.5, 999.5))
+        self.assertEqual(self.detail.view_blocks(), ((-1, 0, 1, 0, 0), ((-1, 1, 0),)))
+
+        self.assertFalse(self.detail.update())
+        self.settle()
+        self.assertEqual(self.started(), [(-1, 1, 0)])
+
+        self.finish((-1, 1, 0))
+        data, extent = self.frame.show_detail.call_args.args
+        self.assertEqual(extent, (-0.5, 2047.5, -0.5, 1023.5))
+        self.assertEqual(data.shape, (BLOCK_SIZE, 2 * BLOCK_SIZE))
+
+        # the block inside the image is drawn from the image pyramid, padded out
+        tile, _ = self.frame.image_pyramid.get_region((1, 0, 0, 0, 0))
+        np.testing.assert_array_equal(data[:500, :BLOCK_SIZE], tile)
+        self.assertTrue(np.isnan(data[500:, :BLOCK_SIZE]).all())
+        np.testing.assert_array_equal(data[:, BLOCK_SIZE:], -1)
+
+    def test_zoomed_in_downloaded(self):
+        self.frame.set_view((100, 300), (100, 300))
+        level, _, _, _, _ = self.detail.view_blocks()[0]
+        self.assertGreater(level, 0)
+
+
+class BlockCacheTest(HiPSDetailTestCase):
+    def test_least_recently_used_dropped(self):
+        blocks = [(1, x, 0) for x in range(hips_detail.BLOCK_CACHE_SIZE + 2)]
+        for block in blocks:
+            self.detail.load(block)
+            self.finish(block)
+
+        self.assertEqual(list(self.detail.blocks), blocks[2:])
+
+    def test_view_blocks_kept(self):
+        # more blocks than the cache holds, so they could never all be drawn if the
+        #   view's blocks were dropped
+        view = tuple((1, x, 0) for x in range(hips_detail.BLOCK_CACHE_SIZE + 8))
+        self.detail.needed = ((1, 0, len(view) - 1, 0, 0), view)
+        for block in view:
+            self.detail.load(block)
+            self.finish(block)
+
+        self.assertEqual(list(self.detail.blocks), list(view))
+
+        # the other blocks are still bounded
+        others = [(2, x, 0) for x in range(hips_detail.BLOCK_CACHE_SIZE + 1)]
+        for block in others:
+            self.detail.load(block)
+            self.finish(block)
+
+        self.assertEqual(set(self.detail.blocks), set(view) | set(others[1:]))
+
+    def test_prefetch_bounded(self):
+        # zoomed out enough that all around the view is past the edges
+        self.frame = FakeFrame(rows=10, cols=10, screen_pixels=2000)
+        self.detail = hips_detail.HiPSDetail(self.frame, None)
+        self.frame.set_view((-5000, 5000), (-5000, 5000))
+
+        self.detail.prefetch()
+        self.assertLessEqual(
+            len(self.detail.queue) + len(self.jobs), hips_detail.BLOCK_CACHE_SIZE
+        )
+
+    def test_failed_retried(self):
+        self.frame.set_view((200, 300), (200, 300))
+        self.detail.update()
+        self.settle()
+        block = self.started()[0]
+
+        self.finish(block, error=ValueError("nope"))
+        self.assertIn(block, self.detail.failed)
+
+        # not again for the same fetch
+        self.detail.load(block)
+        self.assertNotIn(block, self.started())
+
+        self.detail.update()
+        self.settle()
+        self.assertIn(block, self.started())
+
+
+class PrefetchTest(HiPSDetailTestCase):
+    def setUp(self):
+        super().setUp()
+
+        # zoomed in, so all of the view and around it is downloaded
+        self.frame.set_view((200, 300), (200, 300))
+        self.detail.update()
+        self.settle()
+        self.view = self.started()
+
+    def finish_view(self):
+        for block in self.view:
+            self.finish(block)
+
+    def test_view_before_prefetch(self):
+        self.assertEqual(len(self.view), 4)
+
+        # i.e. the toolbar finishing a zoom before the view is downloaded
+        self.detail.prefetch()
+        self.assertEqual(self.started(), self.view)
+        self.assertTrue(self.detail.queue)
+
+        self.finish_view()
+        self.frame.show_detail.assert_called_once()
+
+        # then just one block around the view
+        self.assertEqual(len(self.jobs), 1)
+        self.assertNotIn(self.started()[0], self.view)
+        self.assertEqual(self.detail.prefetching, self.started()[0])
+
+    def test_one_at_a_time(self):
+        self.finish_view()
+
+        queued = list(self.detail.queue)
+        prefetched = []
+        while self.jobs:
+            self.assertEqual(len(self.jobs), 1)
+            block = self.started()[0]
+            prefetched.append(block)
+            self.finish(block)
+
+        self.assertEqual(prefetched[1:], queued)
+        self.assertIsNone(self.detail.prefetching)
+
+        # what's around the view, and the next level in over the middle of it
+        levels = {block[0] for block in prefetched}
+        self.assertEqual(levels, {self.view[0][0], self.view[0][0] + 1})
+
+    def test_prefetch_after_error(self):
+        self.finish_view()
+
+        block = self.started()[0]
+        self.finish(block, error=ValueError("nope"))
+        self.assertEqual(len(self.jobs), 1)
+        self.assertNotEqual(self.started()[0], block)
+
+    def test_view_blocks_not_prefetched(self):
+        self.finish_view()
+        self.assertEqual(len(self.detail.blocks), 4)
+
+        self.detail.prefetch()
+        self.assertTrue(set(self.detail.queue).isdisjoint(self.view))
+
+    def test_cancel(self):
+        self.frame.set_view((250, 350), (250, 350))
+        self.detail.update()
+        downloads = list(self.detail.loading.values())
+        after_id = self.detail.after_id
+        self.detail.prefetch()
+
+        self.detail.cancel()
+        self.assertTrue(all(download.cancelled.is_set() for download in downloads))
+        self.assertIn(after_id, self.frame.cancelled)
+        self.assertIsNone(self.detail.after_id)
+        self.assertFalse(self.detail.queue)
+
+        # the cancelled downloads don't start any more
+        for block in self.view:
+            self.finish(block, error=hips_detail.hips_handler.DownloadCancelled())
+        self.assertEqual(self.jobs, [])
+        self.assertFalse(self.detail.failed)
+
+
+@skipIf(ImageFrame is None, "ImageFrame can't be imported")
+class ImageFrameTest(TestCase):
+    def setUp(self):
+        self.image_frame = ImageFrame.__new__(ImageFrame)
+        self.image_frame.hips_detail = mock.Mock(spec=hips_detail.HiPSDetail)
+
+    def test_navigate_prefetches(self):
+        self.image_frame.on_navigate()
+        self.image_frame.hips_detail.prefetch.assert_called_once_with()
+
+    def test_destroy_cancels(self):
+        with mock.patch.object(ImageFrame.__bases__[0], "destroy") as destroy:
+            self.image_frame.destroy()
+
+        self.image_frame.hips_detail.cancel.assert_called_once_with()
+        destroy.assert_called_once()
@@ -0,0 +1,127 @@
+import json
+import threading
+import time
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase, mock
+from urllib.parse import parse_qs, urlparse
+
+from src.widgets.hips_survey_selector import hips_handler
+from src.widgets.hips_survey_selector.hips_handler import (
+    DownloadCancelled,
+    HiPSDownload,
+)
+
+PAYLOAD = bytes(range(256)) * 1000
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Stands in for hips2fits, sending PAYLOAD slowly in pieces."""
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        self.server.queries.append(query)
+
+        if query.get("hips") == ["missing"]:
+            body = json.dumps({"title": "Bad survey", "description": "not found"})
+            self.send_response(400)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(body.encode())
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/fits")
+        self.send_header("Content-Length", str(len(PAYLOAD)))
+        self.end_headers()
+
+        try:
+            for start in range(0, len(PAYLOAD), 32 * 1024):
+                self.wfile.write(PAYLOAD[start : start + 32 * 1024])
+                self.wfile.flush()
+                time.sleep(0.001)
+        except (BrokenPipeError, ConnectionResetError):
+            # the download was cancelled
+            pass
+
+    def log_message(self, *_args):
+        pass
+
+
+class CancellingDownload(HiPSDownload):
+    """Cancels itself part way through."""
+
+    def update(self, done, total):
+        if done > len(PAYLOAD) // 4:
+            self.cancel()
+
+        super().update(done, total)
+
+
+class HiPSDownloadTest(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+        self.server.queries = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.fetch = partial(
+            hips_handler.fetch_hips2fits,
+            server=f"http://127.0.0.1:{self.server.server_port}/hips2fits",
+        )
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_progress(self):
+        download = HiPSDownload()
+        progress = []
+
+        with mock.patch.object(
+            download, "update", side_effect=lambda done, total: progress.append(done)
+        ):
+            response = self.fetch({"hips": "survey", "format": "fits"}, download)
+
+        self.assertEqual(response.payload, PAYLOAD)
+        self.assertEqual(response.headers["Content-Type"], "application/fits")
+        self.assertEqual(self.server.queries[0]["hips"], ["survey"])
+
+        self.assertEqual(progress[0], 0)
+        self.assertEqual(progress[-1], len(PAYLOAD))
+        self.assertGreater(len(progress), 2)
+        self.assertEqual(progress, sorted(progress))
+
+    def test_total(self):
+        download = HiPSDownload()
+        self.fetch({"hips": "survey"}, download)
+
+        self.assertEqual(download.done, len(PAYLOAD))
+        self.assertEqual(download.total, len(PAYLOAD))
+
+    def test_cancel(self):
+        download = CancellingDownload()
+
+        with self.assertRaises(DownloadCancelled):
+            self.fetch({"hips": "survey"}, download)
+
+        self.assertLess(download.done, len(PAYLOAD))
+
+    def test_error(self):
+        with self.assertRaisesRegex(AttributeError, "Bad survey: not found"):
+            self.fetch({"hips": "missing"})
+
+    def test_concurrent(self):
+        downloads = [HiPSDownload() for _ in range(4)]
+        threads = [
+            threading.Thread(target=self.fetch, args=({"hips": "survey"}, download))
+            for download in downloads
+        ]
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.server.queries), 4)
+        for download in downloads:
+            self.assertEqual(download.done, len(PAYLOAD))
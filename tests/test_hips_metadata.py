@@ -0,0 +1,192 @@
+import os
+import tempfile
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+
+import numpy as np
+from astropy.io import fits
+from astropy.wcs import WCS
+
+from src.enums import DataType
+from src.lib import healpix
+from src.widgets.hips_survey_selector import hips_handler, hips_metadata
+from src.widgets.hips_survey_selector.hips_cache import HiPSCache
+from src.widgets.hips_survey_selector.hips_metadata import InvalidSurveyRequest
+
+# the survey covers the order 3 cell (64 of them across a base cell) around here
+COVERED = (10.0, 20.0)
+MOC_ORDER = 3
+
+
+def make_survey(directory, formats):
+    """Write the properties and coverage of a survey, without any tiles."""
+
+    with open(os.path.join(directory, "properties"), "w") as f:
+        f.write(
+            "hips_order = 3\n"
+            "hips_tile_width = 8\n"
+            f"hips_tile_format = {' '.join(formats)}\n"
+            "hips_frame = equatorial\n"
+        )
+
+    ipix = healpix.ang2pix_nest(2**MOC_ORDER, *COVERED)
+    column = fits.Column(
+        name="UNIQ", format="K", array=np.array([4 * 4**MOC_ORDER + ipix])
+    )
+    table = fits.BinTableHDU.from_columns([column])
+    table.header["COORDSYS"] = "C"
+    fits.HDUList([fits.PrimaryHDU(), table]).writeto(
+        os.path.join(directory, hips_metadata.MOC_FILE)
+    )
+
+
+def make_wcs(ra, dec):
+    image_wcs = WCS(naxis=2)
+    image_wcs.wcs.ctype = ["RA---TAN", "DEC--TAN"]
+    image_wcs.wcs.crval = [ra, dec]
+    image_wcs.wcs.crpix = [20.5, 20.5]
+    image_wcs.wcs.cdelt = [-0.02, 0.02]
+    image_wcs.pixel_shape = (40, 40)
+    return image_wcs
+
+
+class RecordingHandler(SimpleHTTPRequestHandler):
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        super().do_GET()
+
+    def log_message(self, *_args):
+        pass
+
+
+def failing_service(_params, _download=None):
+    raise AssertionError("hips2fits shouldn't be asked")
+
+
+class HiPSMetadataTest(TestCase):
+    def setUp(self):
+        self.survey_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.cache = HiPSCache(self.cache_dir.name)
+
+        hips_metadata.clear_cache()
+        self.addCleanup(hips_metadata.clear_cache)
+
+    def tearDown(self):
+        self.survey_dir.cleanup()
+        self.cache_dir.cleanup()
+
+    def serve(self, formats=("fits", "png")):
+        make_survey(self.survey_dir.name, formats)
+
+        server = ThreadingHTTPServer(
+            ("127.0.0.1", 0),
+            partial(RecordingHandler, directory=self.survey_dir.name),
+        )
+        server.paths = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        return server, f"http://127.0.0.1:{server.server_port}"
+
+    def open(self, url, image_wcs, data_type=DataType.FITS):
+        survey = hips_handler.HiPsSurvey(survey=url, data_type=data_type)
+        return hips_handler.open_hips(survey, image_wcs, self.cache, failing_service)
+
+    def test_metadata(self):
+        server, url = self.serve()
+        metadata = hips_metadata.get_metadata(url, self.cache)
+
+        self.assertEqual(metadata.properties.formats, ["fits", "png"])
+        self.assertEqual(metadata.properties.max_order, 3)
+        self.assertTrue(metadata.coverage.contains_point(*COVERED))
+        self.assertFalse(metadata.coverage.contains_point(190.0, -20.0))
+
+        # it's kept in memory, then on disk
+        self.assertIs(hips_metadata.get_metadata(url, self.cache), metadata)
+        self.assertIs(hips_metadata.peek_metadata(url, self.cache), metadata)
+
+        requests = len(server.paths)
+        hips_metadata.clear_cache()
+        self.assertIsNone(hips_metadata.peek_metadata(url, self.cache))
+        hips_metadata.get_metadata(url, self.cache)
+        self.assertEqual(len(server.paths), requests)
+
+    def test_uncovered_fails_without_downloading(self):
+        server, url = self.serve()
+        hips_metadata.get_metadata(url, self.cache)
+        server.paths.clear()
+
+        with self.assertRaises(InvalidSurveyRequest):
+            self.open(url, make_wcs(190.0, -20.0))
+
+        self.assertEqual(server.paths, [])
+
+    def test_no_fits_fails_without_downloading(self):
+        server, url = self.serve(formats=("png",))
+
+        with self.assertRaises(InvalidSurveyRequest) as e:
+            self.open(url, make_wcs(*COVERED))
+
+        self.assertEqual(str(e.exception), hips_metadata.NO_FITS)
+        self.assertFalse(any("Norder" in path for path in server.paths))
+
+    def test_only_covered_tiles_are_read(self):
+        server, url = self.serve()
+
+        image_data, _header = self.open(url, make_wcs(*COVERED))
+
+        # none of the tiles exist, so it's all blank
+        self.assertEqual(image_data.shape, (40, 40))
+        self.assertTrue(np.all(np.isnan(image_data)))
+
+        tiles = [path for path in server.paths if "Norder" in path]
+        self.assertGreater(len(tiles), 0)
+
+        covered = healpix.ang2pix_nest(2**MOC_ORDER, *COVERED)
+        for path in tiles:
+            order = int(path.split("Norder")[1].split("/")[0])
+            npix = int(path.split("Npix")[1].split(".")[0])
+
+            # coarser tiles contain the covered cell, finer ones are within it
+            if order <= MOC_ORDER:
+                self.assertEqual(npix, covered >> (2 * (MOC_ORDER - order)))
+            else:
+                self.assertEqual(npix >> (2 * (order - MOC_ORDER)), covered)
+
+    def test_unreadable_coverage_is_reported(self):
+        server, url = self.serve()
+        with open(
+            os.path.join(self.survey_dir.name, hips_metadata.MOC_FILE), "wb"
+        ) as f:
+            f.write(b"not a fits file")
+
+        download = hips_handler.HiPSDownload()
+        survey = hips_handler.HiPsSurvey(survey=url, data_type=DataType.FITS)
+
+        # it's taken to cover everything
+        image_data, _header = hips_handler.open_hips(
+            survey, make_wcs(190.0, -20.0), self.cache, failing_service, download
+        )
+
+        self.assertEqual(image_data.shape, (40, 40))
+        self.assertIsNotNone(hips_metadata.get_metadata(url, self.cache).coverage_error)
+        self.assertIn("isn't checked", download.status)
+
+    def test_fallback_is_reported(self):
+        # a directory without a survey in it
+        download = hips_handler.HiPSDownload()
+        survey = hips_handler.HiPsSurvey(
+            survey=self.survey_dir.name, data_type=DataType.FITS
+        )
+
+        with self.assertRaises(AssertionError):
+            hips_handler.open_hips(
+                survey, make_wcs(*COVERED), self.cache, failing_service, download
+            )
+
+        self.assertIn("hips2fits", download.status)
@@ -0,0 +1,295 @@
+import os
+import tempfile
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+
+import numpy as np
+from astropy.io import fits
+from astropy.wcs import WCS
+from PIL import Image
+
+from src.enums import DataType
+from src.lib import healpix
+from src.widgets.hips_survey_selector import hips_handler, hips_metadata, hips_tiles
+from src.widgets.hips_survey_selector.hips_cache import HiPSCache
+from src.widgets.hips_survey_selector.hips_handler import (
+    DownloadCancelled,
+    HiPSDownload,
+)
+
+TILE_WIDTH = 8
+ORDERS = [0, 1, 2]
+
+
+def make_survey(directory, formats=("fits", "png")):
+    """Write a survey whose pixels are their own HEALPix index (mod 256 for png)."""
+
+    with open(os.path.join(directory, "properties"), "w") as f:
+        f.write(
+            "# a test survey\n"
+            f"hips_order = {max(ORDERS)}\n"
+            f"hips_order_min = {min(ORDERS)}\n"
+            f"hips_tile_width = {TILE_WIDTH}\n"
+            f"hips_tile_format = {' '.join(formats)}\n"
+            "hips_frame = equatorial\n"
+        )
+
+    # x runs down the rows of a FITS tile, y along the columns
+    rows, cols = np.mgrid[0:TILE_WIDTH, 0:TILE_WIDTH]
+    within = healpix.interleave(TILE_WIDTH - 1 - rows, cols)
+
+    for order in ORDERS:
+        for npix in range(12 * 4**order):
+            data = npix * TILE_WIDTH**2 + within
+
+            for extension in formats:
+                path = os.path.join(
+                    directory, hips_tiles.tile_path(order, npix, extension)
+                )
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+
+                if extension == "fits":
+                    fits.PrimaryHDU(data.astype(np.float64)).writeto(path)
+                else:
+                    # png tiles have the first row at the top
+                    Image.fromarray(np.flipud(data % 256).astype(np.uint8)).save(path)
+
+
+def make_wcs():
+    image_wcs = WCS(naxis=2)
+    image_wcs.wcs.ctype = ["RA---TAN", "DEC--TAN"]
+    image_wcs.wcs.crval = [10, 20]
+    image_wcs.wcs.crpix = [40, 30]
+    image_wcs.wcs.cdelt = [-0.5, 0.5]
+    image_wcs.pixel_shape = (80, 60)
+    return image_wcs
+
+
+def expected(image_wcs, order):
+    """The HEALPix index of each pixel of the image, at the resolution of order."""
+    x, y = np.meshgrid(np.arange(80), np.arange(60))
+    lon, lat = image_wcs.wcs_pix2world(x, y, 0)
+    return healpix.ang2pix_nest(2 ** (order + 3), lon, lat)
+
+
+def make_quadrant_survey(directory):
+    """Write a survey with just base tile 4, the one centred on (0, 0), split in to
+    quadrants of its four child cells, without going through healpix.
+
+    Following the HiPS standard (and Aladin, which made most surveys), a FITS tile
+    has its children 0 (south), 1 (east), 2 (west) and 3 (north) in its top left,
+    bottom left, top right and bottom right quarters (the first row at the bottom).
+    """
+
+    with open(os.path.join(directory, "properties"), "w") as f:
+        f.write(
+            "hips_order = 0\n"
+            f"hips_tile_width = {TILE_WIDTH}\n"
+            "hips_tile_format = fits png\n"
+            "hips_frame = equatorial\n"
+        )
+
+    half = TILE_WIDTH // 2
+    data = np.zeros((TILE_WIDTH, TILE_WIDTH))
+    data[half:, :half] = 10
+    data[:half, :half] = 11
+    data[half:, half:] = 12
+    data[:half, half:] = 13
+
+    for extension in ("fits", "png"):
+        path = os.path.join(directory, hips_tiles.tile_path(0, 4, extension))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        if extension == "fits":
+            fits.PrimaryHDU(data).writeto(path)
+        else:
+            Image.fromarray(np.flipud(data).astype(np.uint8)).save(path)
+
+
+class CountingHandler(SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests += 1
+        self.server.clients.add(self.client_address)
+        super().do_GET()
+
+    def log_message(self, *_args):
+        pass
+
+
+class HiPSTilesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.survey_dir = tempfile.TemporaryDirectory()
+        make_survey(cls.survey_dir.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.survey_dir.cleanup()
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.cache = HiPSCache(self.cache_dir.name)
+        self.image_wcs = make_wcs()
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def stream(self, survey, data_type=DataType.FITS, download=None):
+        return list(
+            (image.copy(), last)
+            for image, last in hips_tiles.stream_tiles(
+                hips_metadata.load_metadata(survey, self.cache),
+                self.image_wcs,
+                (60, 80),
+                data_type,
+                self.cache,
+                download or HiPSDownload(),
+            )
+        )
+
+    def serve(self):
+        server = ThreadingHTTPServer(
+            ("127.0.0.1", 0),
+            partial(CountingHandler, directory=self.survey_dir.name),
+        )
+        server.requests = 0
+        server.clients = set()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        return server, f"http://127.0.0.1:{server.server_port}"
+
+    def test_coarse_to_fine(self):
+        images = self.stream(self.survey_dir.name)
+
+        # 0.5 degree pixels are finer than the deepest order, so all of them are drawn
+        self.assertEqual([last for _image, last in images], [False, False, True])
+
+        for order, (image, _last) in zip(ORDERS, images):
+            np.testing.assert_array_equal(image, expected(self.image_wcs, order))
+
+    def test_png(self):
+        images = self.stream(self.survey_dir.name, DataType.PNG)
+        image, _last = images[-1]
+
+        self.assertEqual(image.shape, (60, 80, 4))
+        np.testing.assert_array_equal(
+            image[:, :, 0], expected(self.image_wcs, ORDERS[-1]) % 256
+        )
+        self.assertTrue(np.all(image[:, :, 3] == 255))
+
+    def test_missing_format(self):
+        with self.assertRaises(hips_tiles.NativeUnavailable):
+            self.stream(self.survey_dir.name, DataType.JPG)
+
+    def test_http(self):
+        server, url = self.serve()
+
+        # the metadata is read on a connection of its own, then cached
+        hips_metadata.load_metadata(url, self.cache)
+        server.clients.clear()
+
+        images = self.stream(url)
+
+        np.testing.assert_array_equal(
+            images[-1][0], expected(self.image_wcs, ORDERS[-1])
+        )
+
+        # the connections are kept alive between tiles
+        self.assertGreater(server.requests, hips_tiles.CONNECTIONS)
+        self.assertLessEqual(len(server.clients), hips_tiles.CONNECTIONS)
+
+        # then the tiles come from the cache
+        requests = server.requests
+        self.stream(url)
+        self.assertEqual(server.requests, requests)
+
+    def test_cancel(self):
+        download = HiPSDownload()
+        download.cancel()
+
+        with self.assertRaises(DownloadCancelled):
+            self.stream(self.survey_dir.name, download=download)
+
+    def test_open_tiles(self):
+        download = HiPSDownload()
+        survey = hips_handler.HiPsSurvey(
+            survey=self.survey_dir.name, data_type=DataType.FITS
+        )
+
+        image_data, header = hips_handler.open_tiles(
+            survey, self.image_wcs, self.cache, download
+        )
+
+        np.testing.assert_array_equal(image_data, expected(self.image_wcs, ORDERS[-1]))
+        self.assertEqual(WCS(header).wcs.crval[0], 10)
+
+        # the coarser orders were shown on the way
+        layers = [download.layers.get_nowait() for _ in ORDERS[:-1]]
+        self.assertTrue(download.layers.empty())
+        np.testing.assert_array_equal(layers[0][0], expected(self.image_wcs, 0))
+
+    def test_not_progressive(self):
+        server, url = self.serve()
+        hips_metadata.load_metadata(url, self.cache)
+        server.requests = 0
+
+        download = HiPSDownload()
+        survey = hips_handler.HiPsSurvey(survey=url, data_type=DataType.FITS)
+
+        image_data, _header = hips_handler.open_tiles(
+            survey, self.image_wcs, self.cache, download, progressive=False
+        )
+
+        np.testing.assert_array_equal(image_data, expected(self.image_wcs, ORDERS[-1]))
+        self.assertTrue(download.layers.empty())
+
+        # only the tiles of the last order were downloaded
+        lon, lat = hips_tiles.world_coordinates(self.image_wcs, (60, 80), "equatorial")
+        tiles = hips_tiles.lookup_tiles(lon, lat, ORDERS[-1], TILE_WIDTH).tiles
+        self.assertEqual(server.requests, len(tiles))
+
+
+class TileOrientationTest(TestCase):
+    def setUp(self):
+        self.survey_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.survey_dir.cleanup)
+        self.addCleanup(self.cache_dir.cleanup)
+
+        make_quadrant_survey(self.survey_dir.name)
+        self.cache = HiPSCache(self.cache_dir.name)
+
+        # a plate carree image of the whole base tile, RA increasing to the left
+        self.image_wcs = WCS(naxis=2)
+        self.image_wcs.wcs.ctype = ["RA---CAR", "DEC--CAR"]
+        self.image_wcs.wcs.crval = [0, 0]
+        self.image_wcs.wcs.crpix = [100.5, 60.5]
+        self.image_wcs.wcs.cdelt = [-0.5, 0.5]
+        self.image_wcs.pixel_shape = (200, 120)
+
+    def test_placed_on_sky(self):
+        # the base tile is a diamond with its corners at (0, +-41.8) and (+-45, 0),
+        # each child is the quarter of it towards one of them
+        places = {(0, -25): 10, (25, 0): 11, (335, 0): 12, (0, 25): 13}
+
+        for data_type in (DataType.FITS, DataType.PNG):
+            *_, (image, _last) = hips_tiles.stream_tiles(
+                hips_metadata.load_metadata(self.survey_dir.name, self.cache),
+                self.image_wcs,
+                (120, 200),
+                data_type,
+                self.cache,
+                HiPSDownload(),
+            )
+
+            for (lon, lat), value in places.items():
+                x, y = self.image_wcs.wcs_world2pix(lon, lat, 0)
+                pixel = image[int(round(float(y))), int(round(float(x)))]
+                self.assertEqual(np.ravel(pixel)[0], value, (data_type, lon, lat))
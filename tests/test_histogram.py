@@ -0,0 +1,69 @@
+from unittest import TestCase
+
+import numpy as np
+
+from src.widgets.renderer.histogram import (
+    HistogramPyramid,
+    bin_counts,
+    create_histogram_data,
+)
+
+
+class BinCountsTest(TestCase):
+    def setUp(self):
+        self.data = np.random.default_rng(0).normal(size=(300, 200))
+        self.data[0, :10] = np.nan
+
+    def test_matches_np_histogram(self):
+        expected, _ = np.histogram(self.data, bins=1000, range=(-2, 2))
+
+        np.testing.assert_array_equal(
+            bin_counts(self.data, -2, 2, bins=1000, threads=1), expected
+        )
+
+    def test_threads_match(self):
+        np.testing.assert_array_equal(
+            bin_counts(self.data, -3, 3, bins=4096, threads=4),
+            bin_counts(self.data, -3, 3, bins=4096, threads=1),
+        )
+
+    def test_max_value_in_last_bin(self):
+        counts = bin_counts(np.array([[0.0, 1.0]]), 0, 1, bins=4, threads=1)
+
+        np.testing.assert_array_equal(counts, [1, 0, 0, 1])
+
+
+class HistogramPyramidTest(TestCase):
+    def setUp(self):
+        self.counts = np.random.default_rng(0).integers(0, 100, 4096)
+        self.histogram = HistogramPyramid(self.counts, 0, 4096)
+
+    def test_levels_sum_pairs(self):
+        self.assertEqual(len(self.histogram.levels[-1]), 64)
+
+        for level in self.histogram.levels:
+            self.assertEqual(level.sum(), self.counts.sum())
+
+        np.testing.assert_array_equal(
+            self.histogram.levels[1], self.counts[0::2] + self.counts[1::2]
+        )
+
+    def test_counts_for_view(self):
+        # the whole range over 512 pixels needs 8 fine bins per pixel
+        counts, edges = self.histogram.counts_for_view(0, 4096, 512)
+        self.assertEqual(len(counts), 512)
+        self.assertEqual(len(edges), 513)
+
+        # zoomed in past the finest level, only the bins in view are returned
+        counts, edges = self.histogram.counts_for_view(100.5, 110.5, 512)
+        np.testing.assert_array_equal(counts, self.counts[100:111])
+        self.assertEqual(edges[0], 100)
+        self.assertEqual(edges[-1], 111)
+
+    def test_constant_data(self):
+        histogram = create_histogram_data(np.ones((10, 10)), 1, 1)
+        low, high = histogram.range()
+
+        self.assertLess(low, 1)
+        self.assertGreater(high, 1)
+        self.assertEqual(histogram.levels[0].sum(), 100)
@@ -0,0 +1,78 @@
+from unittest import TestCase
+
+import numpy as np
+
+from src.widgets.image.image_pyramid import ImagePyramid, block_reduce, preview
+
+
+class BlockReduceTest(TestCase):
+    def test_mean_ignores_nan(self):
+        data = np.array([[1, np.nan], [3, 2]], dtype=np.float32)
+
+        np.testing.assert_allclose(block_reduce(data, 2), [[2.0]])
+
+    def test_max_pads_edges(self):
+        data = np.arange(9, dtype=np.float32).reshape((3, 3))
+
+        np.testing.assert_array_equal(
+            block_reduce(data, 2, method="max"), [[4, 5], [7, 8]]
+        )
+
+    def test_all_nan_block_is_nan(self):
+        data = np.full((2, 2), np.nan)
+
+        self.assertTrue(np.isnan(block_reduce(data, 2)[0, 0]))
+
+
+class ImagePyramidTest(TestCase):
+    def setUp(self):
+        self.data = np.random.default_rng(0).random((1000, 700)).astype(np.float32)
+        self.pyramid = ImagePyramid(self.data, tile_size=128, max_stored_size=256)
+        self.pyramid.build()
+
+    def test_levels(self):
+        self.assertEqual(self.pyramid.max_level, 3)
+        self.assertEqual(self.pyramid.stored_level, 2)
+
+        overview, extent = self.pyramid.overview()
+        self.assertEqual(overview.shape, self.pyramid.level_shape(3))
+        self.assertLessEqual(extent[0], -0.5)
+        self.assertGreaterEqual(extent[3], 999.5)
+
+    def test_zoomed_out_view_uses_coarse_level(self):
+        region = self.pyramid.region_for_view(-0.5, 699.5, -0.5, 999.5, 250, 250)
+
+        self.assertEqual(region[0], 2)
+
+    def test_zoomed_in_view_uses_full_resolution(self):
+        region = self.pyramid.region_for_view(100, 200, 300, 400, 500, 500)
+        data, extent = self.pyramid.get_region(region)
+
+        self.assertEqual(region[0], 0)
+        np.testing.assert_array_equal(data, self.data[256:512, 0:256])
+        self.assertEqual(extent, (-0.5, 255.5, 255.5, 511.5))
+
+    def test_on_demand_tiles_match_stored_levels(self):
+        region = self.pyramid.region_for_view(-0.5, 699.5, -0.5, 999.5, 350, 500)
+        data, _ = self.pyramid.get_region(region)
+
+        self.assertEqual(region[0], 1)
+        np.testing.assert_allclose(data, block_reduce(self.data, 2), rtol=1e-6)
+
+
+class PreviewTest(TestCase):
+    def test_centred_on_samples(self):
+        for step in (1, 2, 3, 4):
+            # each pixel is its own x co-ordinate
+            image_data = np.tile(np.arange(120, dtype=np.float32), (60, 1))
+            data, (left, right, bottom, top) = preview(image_data, 120 // step)
+
+            cell = (right - left) / data.shape[1]
+            self.assertEqual(cell, step)
+            self.assertEqual((top - bottom) / data.shape[0], step)
+
+            centres = left + (np.arange(data.shape[1]) + 0.5) * cell
+            np.testing.assert_allclose(data[0], centres, atol=0.5)
+            # within the image, give or take half a pixel
+            self.assertGreaterEqual(left, -0.5)
+            self.assertLessEqual(right, 119.5 + step / 2)
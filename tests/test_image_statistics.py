@@ -0,0 +1,119 @@
+import os
+import tempfile
+import threading
+from unittest import TestCase, mock
+
+import numpy as np
+
+from src.widgets.image import fits_handler
+from src.widgets.image.image_statistics import ImageStatistics
+
+
+class ImageStatisticsTest(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.data = rng.normal(1, 2, (200, 300))
+        self.data[:10] = np.nan
+
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "image.fits")
+        with open(self.path, "wb") as f:
+            f.write(b"not really a fits file")
+
+        self.cache_dir = os.path.join(self.dir.name, "cache")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_summary(self):
+        summary = ImageStatistics(self.data).summary()
+
+        self.assertEqual(summary["count"], 190 * 300)
+        self.assertEqual(summary["nan_count"], 10 * 300)
+        self.assertAlmostEqual(summary["mean"], np.nanmean(self.data))
+        self.assertAlmostEqual(summary["std"], np.nanstd(self.data))
+        self.assertEqual(summary["min"], np.nanmin(self.data))
+        self.assertEqual(summary["max"], np.nanmax(self.data))
+        self.assertEqual(
+            summary["percentiles"], fits_handler.get_percentiles(self.data)[0]
+        )
+
+    def test_single_pass(self):
+        statistics = ImageStatistics(self.data)
+
+        with mock.patch.object(
+            fits_handler, "get_percentiles", wraps=fits_handler.get_percentiles
+        ) as get_percentiles:
+            statistics.mean()
+            statistics.get_percentiles()
+            statistics.get_percentiles(0.05)
+
+        self.assertEqual(get_percentiles.call_count, 1)
+        self.assertIsNotNone(statistics.get("max"))
+
+    def test_sigma(self):
+        statistics = ImageStatistics(self.data)
+        sigma = statistics.sigma()
+
+        clipped = self.data[self.data <= 2.5 * np.nanstd(self.data)]
+        self.assertAlmostEqual(sigma, np.std(clipped))
+
+    def test_persisted(self):
+        ImageStatistics(self.data, self.path, self.cache_dir).sigma()
+        # in the cache, not next to the file
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        self.assertEqual(os.listdir(self.dir.name), ["cache", "image.fits"])
+
+        statistics = ImageStatistics(self.data, self.path, self.cache_dir)
+        self.assertTrue(statistics.load())
+
+        with mock.patch.object(fits_handler, "get_percentiles") as get_percentiles:
+            percentiles, error = statistics.get_percentiles(0.05)
+            statistics.sigma()
+
+        get_percentiles.assert_not_called()
+        self.assertEqual(error, 0)
+        self.assertEqual(
+            percentiles, ImageStatistics(self.data).summary()["percentiles"]
+        )
+
+    def test_changed_file_not_loaded(self):
+        ImageStatistics(self.data, self.path, self.cache_dir).summary()
+
+        with open(self.path, "ab") as f:
+            f.write(b"more")
+
+        self.assertFalse(ImageStatistics(self.data, self.path, self.cache_dir).load())
+
+    def test_invalidate(self):
+        statistics = ImageStatistics(self.data, self.path, self.cache_dir)
+        statistics.summary()
+        statistics.invalidate()
+
+        self.assertIsNone(statistics.get("mean"))
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_invalidate_during_summary(self):
+        statistics = ImageStatistics(self.data)
+        started, resume = threading.Event(), threading.Event()
+        get_percentiles = fits_handler.get_percentiles
+
+        def slow_percentiles(*args, **kwargs):
+            started.set()
+            resume.wait(5)
+            return get_percentiles(*args, **kwargs)
+
+        with mock.patch.object(fits_handler, "get_percentiles", slow_percentiles):
+            thread = threading.Thread(target=statistics.summary)
+            thread.start()
+            started.wait(5)
+
+            # neither waits on the summary being calculated
+            self.assertIsNone(statistics.get("mean"))
+            statistics.invalidate()
+
+            resume.set()
+            thread.join(5)
+
+        # it was of the old data, so isn't kept
+        self.assertIsNone(statistics.get("mean"))
@@ -0,0 +1,94 @@
+import io
+from unittest import TestCase
+
+import numpy as np
+from astropy.io import fits
+
+from src.lib import healpix
+from src.lib.moc import MOC, uniq_to_cells
+
+
+def uniq(order, ipix):
+    return 4 * 4**order + ipix
+
+
+def random_points(n, seed=0):
+    rng = np.random.default_rng(seed)
+    lon = rng.uniform(0, 360, n)
+    lat = np.degrees(np.arcsin(rng.uniform(-1, 1, n)))
+    return lon, lat
+
+
+class MOCTest(TestCase):
+    def setUp(self):
+        # base cell 0, two of the children of base cell 1, and two grandchildren
+        self.moc = MOC.from_uniq(
+            [uniq(0, 0), uniq(1, 4), uniq(1, 5), uniq(2, 24), uniq(2, 25)]
+        )
+
+    def test_uniq_to_cells(self):
+        order, ipix = uniq_to_cells([uniq(0, 11), uniq(3, 700), uniq(29, 12345)])
+
+        np.testing.assert_array_equal(order, [0, 3, 29])
+        np.testing.assert_array_equal(ipix, [11, 700, 12345])
+
+    def test_ranges_are_merged(self):
+        self.assertEqual(self.moc.order, 2)
+        np.testing.assert_array_equal(self.moc.starts, [0])
+        np.testing.assert_array_equal(self.moc.ends, [26])
+        self.assertAlmostEqual(self.moc.sky_fraction, 26 / 192)
+
+    def test_contains(self):
+        lon, lat = random_points(10000)
+
+        np.testing.assert_array_equal(
+            self.moc.contains(lon, lat), healpix.ang2pix_nest(4, lon, lat) < 26
+        )
+
+    def test_contains_point(self):
+        lon, lat = random_points(2000, seed=1)
+
+        self.assertEqual(
+            [self.moc.contains_point(a, b) for a, b in zip(lon, lat)],
+            self.moc.contains(lon, lat).tolist(),
+        )
+
+    def test_contains_cells(self):
+        # order 1 cell 6 is only partly covered, order 3 cells are inside order 2 ones
+        np.testing.assert_array_equal(
+            self.moc.contains_cells([5, 6, 7], 1), [True, True, False]
+        )
+        np.testing.assert_array_equal(
+            self.moc.contains_cells([103, 104], 3), [True, False]
+        )
+
+    def test_degrade(self):
+        degraded = self.moc.degrade(0)
+
+        np.testing.assert_array_equal(degraded.starts, [0])
+        np.testing.assert_array_equal(degraded.ends, [2])
+        self.assertIs(self.moc.degrade(0), degraded)
+
+    def test_overlaps(self):
+        # a grid of points 10 degrees apart, all of which miss a cell of order 5
+        moc = MOC.from_uniq([uniq(5, healpix.ang2pix_nest(32, 5.0, 5.0))])
+        lon, lat = np.meshgrid(np.arange(-10, 11, 10.0), np.arange(-10, 11, 10.0))
+
+        self.assertFalse(np.any(moc.contains(lon, lat)))
+        self.assertTrue(moc.overlaps(lon, lat, 10.0))
+        self.assertFalse(moc.overlaps(lon + 180, lat, 10.0))
+
+    def test_from_fits(self):
+        column = fits.Column(
+            name="UNIQ", format="K", array=np.array([uniq(1, 4), uniq(2, 24)])
+        )
+        table = fits.BinTableHDU.from_columns([column])
+        table.header["COORDSYS"] = "G"
+
+        payload = io.BytesIO()
+        fits.HDUList([fits.PrimaryHDU(), table]).writeto(payload)
+        moc = MOC.from_fits(payload.getvalue())
+
+        self.assertEqual(moc.frame, "galactic")
+        np.testing.assert_array_equal(moc.starts, [16, 24])
+        np.testing.assert_array_equal(moc.ends, [20, 25])
@@ -0,0 +1,45 @@
+from unittest import TestCase
+
+import numpy as np
+
+from src.lib import percentiles
+
+EDGES = [0, 0.05, 0.25, 5, 50, 95, 99.75, 99.95, 100]
+
+
+class PercentilesTest(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.data = rng.standard_normal((600, 500)).astype(np.float32)
+        self.data[rng.random(self.data.shape) < 0.1] = np.nan
+
+    def test_exact_matches_nanpercentile(self):
+        values = percentiles.exact_percentiles(self.data, EDGES)
+
+        np.testing.assert_allclose(values, np.nanpercentile(self.data, EDGES))
+
+    def test_exact_with_small_sample_still_exact(self):
+        sample = percentiles.sample_data(self.data, 100)
+        values = percentiles.exact_percentiles(self.data, EDGES, sample=sample)
+
+        np.testing.assert_allclose(values, np.nanpercentile(self.data, EDGES))
+
+    def test_approximate_within_error(self):
+        values, error = percentiles.approximate_percentiles(self.data, EDGES[1:-1], 1)
+        finite = np.sort(self.data[~np.isnan(self.data)])
+
+        self.assertGreater(error, 0)
+        for edge, value in zip(EDGES[1:-1], values):
+            rank = 100 * np.searchsorted(finite, value) / len(finite)
+            self.assertLessEqual(abs(rank - edge), error)
+
+    def test_small_data_is_exact(self):
+        values, error = percentiles.get_percentiles(self.data[:10, :10], EDGES, 1)
+
+        self.assertEqual(error, 0)
+        np.testing.assert_allclose(values, np.nanpercentile(self.data[:10, :10], EDGES))
+
+    def test_all_nan(self):
+        values, _ = percentiles.get_percentiles(np.full((4, 4), np.nan), EDGES)
+
+        self.assertTrue(np.isnan(values).all())
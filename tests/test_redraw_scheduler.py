@@ -0,0 +1,56 @@
+from unittest import TestCase, mock
+
+from src.lib.redraw_scheduler import RedrawScheduler
+
+
+class RedrawSchedulerTest(TestCase):
+    def setUp(self):
+        self.canvas = mock.Mock()
+        self.after_idle = self.canvas.get_tk_widget.return_value.after_idle
+        self.scheduler = RedrawScheduler(self.canvas)
+
+    def idle(self):
+        for call in self.after_idle.call_args_list:
+            call.args[0]()
+
+        self.after_idle.reset_mock()
+
+    def test_requests_are_coalesced(self):
+        for _ in range(5):
+            self.scheduler.request()
+
+        self.canvas.draw.assert_not_called()
+        self.after_idle.assert_called_once()
+
+        self.idle()
+
+        self.canvas.draw.assert_called_once()
+        self.assertEqual(self.scheduler.requested, 5)
+        self.assertEqual(self.scheduler.draws, 1)
+        self.assertEqual(self.scheduler.avoided, 4)
+
+    def test_draws_again_after_idle(self):
+        self.scheduler.request()
+        self.idle()
+        self.scheduler.request()
+        self.idle()
+
+        self.assertEqual(self.canvas.draw.call_count, 2)
+        self.assertEqual(self.scheduler.avoided, 0)
+
+    def test_flush_draws_now(self):
+        self.scheduler.request()
+        self.scheduler.flush()
+        self.canvas.draw.assert_called_once()
+
+        # the pending idle callback doesn't draw again
+        self.idle()
+        self.canvas.draw.assert_called_once()
+
+    def test_no_draw_when_closed(self):
+        self.canvas.get_tk_widget.return_value.winfo_exists.return_value = False
+
+        self.scheduler.request()
+        self.idle()
+
+        self.canvas.draw.assert_not_called()
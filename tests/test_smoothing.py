@@ -0,0 +1,71 @@
+from unittest import TestCase, mock
+
+import numpy as np
+from scipy.ndimage import gaussian_filter
+
+from src.widgets.contour import smoothing
+
+
+class SmoothTest(TestCase):
+    def setUp(self):
+        smoothing.clear_cache()
+
+        y, x = np.mgrid[0:400, 0:400]
+        # a smooth blob plus some noise
+        self.data = np.exp(-((x - 200) ** 2 + (y - 150) ** 2) / (2 * 60**2)) + (
+            np.random.default_rng(0).normal(scale=0.05, size=(400, 400))
+        )
+
+    def test_cached(self):
+        first, _ = smoothing.smooth(self.data, 2)
+        second, _ = smoothing.smooth(self.data, 2)
+        other, _ = smoothing.smooth(self.data, 3)
+
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+
+    def test_not_cached_for_other_data(self):
+        first, _ = smoothing.smooth(self.data, 2)
+        second, _ = smoothing.smooth(self.data.copy(), 2)
+
+        self.assertIsNot(first, second)
+
+    def test_forget(self):
+        first, _ = smoothing.smooth(self.data, 2)
+        self.data[:] = 0
+        smoothing.forget(self.data)
+        second, _ = smoothing.smooth(self.data, 2)
+
+        self.assertIsNot(first, second)
+        self.assertEqual(np.abs(second).max(), 0)
+
+    def test_small_sigma_is_exact(self):
+        smoothed, factor = smoothing.smooth(self.data, 2)
+
+        self.assertEqual(factor, 1)
+        np.testing.assert_allclose(smoothed, gaussian_filter(self.data, 2))
+
+    def test_downsampled_matches_full(self):
+        smoothed, factor = smoothing.smooth(self.data, 8)
+        expected = gaussian_filter(self.data, 8)
+
+        self.assertEqual(factor, 4)
+        self.assertEqual(smoothed.shape, (100, 100))
+
+        # compare at the centres of the decimated pixels, away from the edges
+        centres = expected[1::4, 1::4] / 2 + expected[2::4, 2::4] / 2
+        np.testing.assert_allclose(smoothed[5:-5, 5:-5], centres[5:-5, 5:-5], atol=0.01)
+
+    def test_no_downsample(self):
+        smoothed, factor = smoothing.smooth(self.data, 8, downsample=False)
+
+        self.assertEqual(factor, 1)
+        self.assertEqual(smoothed.shape, self.data.shape)
+
+    def test_eviction(self):
+        with mock.patch.object(smoothing, "CACHE_BYTES", self.data.nbytes):
+            first, _ = smoothing.smooth(self.data, 1)
+            smoothing.smooth(self.data, 2)
+            again, _ = smoothing.smooth(self.data, 1)
+
+        self.assertIsNot(first, again)
@@ -0,0 +1,42 @@
+from unittest import TestCase
+
+import numpy as np
+
+from src.lib.spatial_index import GridIndex
+
+
+class GridIndexTest(TestCase):
+    def setUp(self):
+        self.index = GridIndex(10)
+
+    def test_query(self):
+        self.index.insert("a", (0, 0, 5, 5))
+        self.index.insert("b", (100, 100, 105, 105))
+        self.index.insert("c", (0, 0, 200, 200))
+
+        self.assertEqual(self.index.query((1, 1, 2, 2)), {"a", "c"})
+        self.assertEqual(self.index.query((101, 101, 101, 101)), {"b", "c"})
+        self.assertEqual(self.index.query((-50, -50, -40, -40)), set())
+
+    def test_remove(self):
+        self.index.insert("a", (0, 0, 5, 5))
+        self.index.remove("a")
+        self.index.remove("not there")
+
+        self.assertEqual(len(self.index), 0)
+        self.assertEqual(self.index.query((0, 0, 5, 5)), set())
+
+    def test_polyline_only_covers_its_cells(self):
+        self.index.insert_polyline("line", np.array([[0, 0], [1000, 1000]]))
+
+        self.assertEqual(self.index.query((500, 500, 500, 500)), {"line"})
+        # within the bounds of the line, but far from it
+        self.assertEqual(self.index.query((900, 50, 900, 50)), set())
+        self.assertLess(len(self.index._items["line"]), 400)
+
+    def test_reinsert_moves(self):
+        self.index.insert("a", (0, 0, 5, 5))
+        self.index.insert("a", (50, 50, 55, 55))
+
+        self.assertEqual(self.index.query((0, 0, 5, 5)), set())
+        self.assertEqual(self.index.query((50, 50, 50, 50)), {"a"})
@@ -0,0 +1,113 @@
+import math
+from unittest import TestCase, mock
+
+import numpy as np
+from astropy.io import fits
+from astropy.wcs import WCS
+
+from src.widgets.image import regions
+from src.widgets.statistics import statistics
+
+
+class ComputeStatisticsTest(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.data = rng.normal(1, 2, (300, 200))
+        self.data[5:8, 5:8] = np.nan
+
+    def test_whole_image(self):
+        result = statistics.compute_statistics(self.data)
+
+        self.assertEqual(result.count, 300 * 200 - 9)
+        self.assertEqual(result.nan_count, 9)
+        self.assertAlmostEqual(result.sum, np.nansum(self.data))
+        self.assertAlmostEqual(result.mean, np.nanmean(self.data))
+        self.assertEqual(result.median, np.nanmedian(self.data))
+        self.assertAlmostEqual(result.rms, np.sqrt(np.nanmean(self.data**2)))
+        self.assertEqual(result.min, np.nanmin(self.data))
+        self.assertEqual(result.max, np.nanmax(self.data))
+        self.assertIsNone(result.beam_flux)
+
+    def test_viewport(self):
+        region = statistics.viewport_region(self.data.shape, (49.5, -20), (9.5, 19.5))
+        self.assertEqual(region, (slice(10, 20), slice(0, 50)))
+
+        result = statistics.compute_statistics(self.data, region)
+        self.assertEqual(result.count, 500)
+        self.assertEqual(result.median, np.median(self.data[10:20, :50]))
+
+    def test_empty(self):
+        region = statistics.viewport_region(self.data.shape, (500, 600), (0, 10))
+        result = statistics.compute_statistics(self.data, region)
+
+        self.assertEqual(result.count, 0)
+        self.assertTrue(math.isnan(result.mean))
+
+    def test_beam_flux(self):
+        header = fits.Header()
+        header["BMAJ"] = 0.01
+        header["BMIN"] = 0.005
+
+        image_wcs = WCS(naxis=2)
+        image_wcs.wcs.ctype = ["RA---SIN", "DEC--SIN"]
+        image_wcs.wcs.cdelt = [-0.001, 0.001]
+
+        area = statistics.beam_area(header, image_wcs)
+        self.assertAlmostEqual(area, np.pi / (4 * np.log(2)) * 50)
+
+        result = statistics.compute_statistics(self.data, None, header, image_wcs)
+        self.assertAlmostEqual(result.beam_flux, result.sum / area)
+        self.assertEqual(result.rows()[-1][0], "Beam Flux")
+
+
+class RegionStatisticsTest(TestCase):
+    def setUp(self):
+        regions.clear_cache()
+
+        rng = np.random.default_rng(0)
+        self.data = rng.normal(1, 2, (100, 120))
+
+    def test_box(self):
+        result = statistics.compute_region_statistics(
+            self.data, regions.BoxRegion(9.6, 19.5, 29.4, 29.5)
+        )
+
+        self.assertEqual(result.count, 20 * 10)
+        self.assertAlmostEqual(result.sum, self.data[20:30, 10:30].sum())
+
+    def test_ellipse_matches_mask(self):
+        region = regions.EllipseRegion(60, 50, 20, 10)
+        result = statistics.compute_region_statistics(self.data, region)
+
+        y, x = np.mgrid[0:100, 0:120]
+        inside = ((x - 60) / 20) ** 2 + ((y - 50) / 10) ** 2 <= 1
+
+        self.assertEqual(result.count, inside.sum())
+        self.assertAlmostEqual(result.sum, self.data[inside].sum())
+        self.assertEqual(result.median, np.median(self.data[inside]))
+
+    def test_mask_cached(self):
+        region = regions.PolygonRegion(((10, 10), (50, 10), (10, 50)))
+
+        with mock.patch.object(
+            regions, "rasterise", wraps=regions.rasterise
+        ) as rasterise:
+            first = statistics.compute_region_statistics(self.data, region)
+            second = statistics.compute_region_statistics(self.data.copy(), region)
+
+        self.assertEqual(rasterise.call_count, 1)
+        self.assertEqual(first, second)
+
+    def test_packed(self):
+        mask = regions.get_mask(regions.BoxRegion(-10, -10, 8.5, 200), (100, 120))
+
+        self.assertEqual((mask.rows, mask.cols), (slice(0, 100), slice(0, 9)))
+        self.assertEqual(mask.packed.nbytes, (100 * 9 + 7) // 8)
+        self.assertTrue(mask.unpack().all())
+
+    def test_outside(self):
+        result = statistics.compute_region_statistics(
+            self.data, regions.BoxRegion(500, 500, 600, 600)
+        )
+
+        self.assertEqual(result.count, 0)
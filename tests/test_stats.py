@@ -0,0 +1,68 @@
+from functools import partial
+from unittest import TestCase, mock
+
+import numpy as np
+
+from src.lib import stats, util
+
+
+def reference_sigma(image_data):
+    # the original copy-and-mask contour.get_sigma
+    clipped_image = np.copy(image_data)
+    clip_level = 2.5 * np.nanstd(clipped_image)
+    clipped_image[np.where(clipped_image > clip_level)] = np.nan
+    return np.nanstd(clipped_image)
+
+
+class StatsTest(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.data = rng.normal(0.5, 2, (300, 400))
+        # some bright sources and blanked pixels
+        self.data[100:110, 100:110] = 50
+        self.data[:, :20] = np.nan
+
+    def test_moments(self):
+        chunks = partial(util.iter_chunks, chunk_size=1000)
+
+        with mock.patch.object(stats, "iter_chunks", chunks):
+            count, mean, std = stats.moments(self.data)
+
+        self.assertEqual(count, 300 * 380)
+        self.assertAlmostEqual(mean, np.nanmean(self.data), places=10)
+        self.assertAlmostEqual(std, np.nanstd(self.data), places=10)
+
+    def test_moments_precision(self):
+        data = np.full((100, 100), 1e9) + np.arange(10000).reshape(100, 100) % 2
+
+        _count, mean, std = stats.moments(data)
+
+        self.assertAlmostEqual(mean, 1e9 + 0.5)
+        self.assertAlmostEqual(std, 0.5)
+
+    def test_matches_reference(self):
+        self.assertAlmostEqual(
+            stats.clipped_sigma(self.data), reference_sigma(self.data), places=10
+        )
+
+    def test_does_not_modify(self):
+        data = self.data.copy()
+        stats.clipped_sigma(data, iterations=5)
+
+        np.testing.assert_array_equal(data, self.data)
+
+    def test_iterations_converge_to_noise(self):
+        sigma = stats.clipped_sigma(self.data, iterations=10)
+
+        self.assertLess(sigma, stats.clipped_sigma(self.data))
+        self.assertAlmostEqual(stats.clipped_sigma(self.data, stride=2), sigma, 0)
+
+    def test_mad(self):
+        self.assertAlmostEqual(stats.mad_sigma(self.data), 2, delta=0.05)
+        self.assertTrue(np.isnan(stats.mad_sigma(np.full((3, 3), np.nan))))
+
+    def test_empty(self):
+        count, mean, std = stats.moments(np.full((3, 3), np.nan))
+
+        self.assertEqual(count, 0)
+        self.assertTrue(np.isnan(stats.clipped_sigma(np.full((3, 3), np.nan))))